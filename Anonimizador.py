@@ -1,5 +1,14 @@
-import pydicom
+import argparse
+import csv
+import hashlib
+import json
 import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+
+import pydicom
+from pydicom.datadict import dictionary_VR, keyword_for_tag
+from pydicom.uid import UID
 
 # Carpeta donde se encuentran los archivos DICOM
 dicom_folder = r"C:\Users\Claudia\Desktop\FUESMEN\Secuencia con datos"
@@ -7,24 +16,275 @@ dicom_folder = r"C:\Users\Claudia\Desktop\FUESMEN\Secuencia con datos"
 # Carpeta donde guardarás los archivos anonimizados
 output_folder = r"C:\Users\Claudia\Desktop\FUESMEN\Axial T2"
 
-# Crear la carpeta de salida si no existe
-os.makedirs(output_folder, exist_ok=True)
-
-# Recorrer todos los archivos en la carpeta DICOM
-for filename in os.listdir(dicom_folder):
-    if filename.endswith(".dcm"):  # Solo archivos DICOM
-        file_path = os.path.join(dicom_folder, filename)
-        dicom_data = pydicom.dcmread(file_path)
-
-        # Anonimizar los campos de información personal
-        dicom_data.PatientName = "Darth Vader"
-        dicom_data.PatientID = ""
-        dicom_data.PatientBirthDate = ""
-        dicom_data.PatientSex = ""
-        dicom_data.ReferringPhysicianName = "Lord Farquaad"  # Anonimizar nombre del médico referente
-        
-        # Guardar el archivo anonimizado en la carpeta de salida
-        output_path = os.path.join(output_folder, filename)
-        dicom_data.save_as(output_path)
-
-        print(f"Archivo anonimizado guardado: {output_path}")
\ No newline at end of file
+# Perfiles de anonimización: un texto reemplaza el valor del campo y None lo elimina
+PERFIL_BASICO = {
+    "PatientName": "Darth Vader",
+    "PatientID": "",
+    "PatientBirthDate": "",
+    "PatientSex": "",
+    "ReferringPhysicianName": "Lord Farquaad",  # Anonimizar nombre del médico referente
+}
+
+PERFIL_AMPLIADO = {
+    **PERFIL_BASICO,
+    "OtherPatientIDs": None,
+    "OtherPatientNames": None,
+    "PatientAddress": None,
+    "PatientTelephoneNumbers": None,
+    "PatientMotherBirthName": None,
+    "InstitutionName": "",
+    "InstitutionAddress": None,
+    "AccessionNumber": "",
+    "StudyID": "",
+    "PerformingPhysicianName": "",
+    "OperatorsName": "",
+    "RequestingPhysician": None,
+}
+
+# Todos los elementos de tipo UI se sustituyen de forma coherente en todo el estudio, también
+# dentro de secuencias (ReferencedSOPInstanceUID...), salvo los que identifican tipos y no
+# instancias: clases SOP, sintaxis de transferencia y la clase de la implementación
+SUFIJOS_UID_CONSERVADOS = ("SOPClassUID", "TransferSyntaxUID", "ImplementationClassUID")
+
+# Versión del procedimiento; forma parte de la huella de la configuración, así que al
+# cambiarlo se vuelven a anonimizar las salidas de versiones anteriores
+VERSION_ANONIMIZACION = 2
+
+# Los elementos más grandes que esto (PixelData) no se cargan: se copian tal cual al guardar
+TAMANO_DIFERIDO = "64 KB"
+
+# Configuración de cada proceso trabajador
+_configuracion = {}
+
+
+def remapear_uid(uid, semilla):
+    """Genera un UID nuevo y determinista a partir del original y de la semilla del lote."""
+    return pydicom.uid.generate_uid(entropy_srcs=[semilla, str(uid)])
+
+
+def _conservar_uid(tag, valor):
+    """Los UIDs de tipos (clases SOP, sintaxis) y los UIDs registrados en el estándar no se remapean."""
+    palabra = keyword_for_tag(tag)
+    return palabra.endswith(SUFIJOS_UID_CONSERVADOS) or UID(valor).name != valor
+
+
+def _remapear_uids(dataset, semilla, mapeo):
+    """
+    Sustituye los UIDs de dataset y de sus secuencias, recursivamente.
+
+    Solo se consulta el VR de cada elemento (sin leer su valor), así que los elementos
+    diferidos como PixelData no se cargan.
+    """
+    for tag in list(dataset.keys()):
+        elemento = dataset.get_item(tag)
+        vr = elemento.VR
+        if vr is None:
+            try:
+                vr = dictionary_VR(tag)
+            except KeyError:
+                continue
+        if vr == "SQ":
+            for item in dataset[tag].value:
+                _remapear_uids(item, semilla, mapeo)
+        elif vr == "UI":
+            elemento = dataset[tag]
+            if elemento.value in (None, ""):
+                continue
+            valores = list(elemento.value) if elemento.VM > 1 else [elemento.value]
+            nuevos = []
+            for valor in valores:
+                valor = str(valor).strip("\x00 ")
+                if not valor or _conservar_uid(tag, valor):
+                    nuevos.append(valor)
+                    continue
+                mapeo[valor] = remapear_uid(valor, semilla)
+                nuevos.append(mapeo[valor])
+            elemento.value = nuevos if elemento.VM > 1 else nuevos[0]
+
+
+def huella_configuracion(perfil, eliminar_privados):
+    """Resumen de la configuración de anonimización, para detectar salidas hechas con otra."""
+    configuracion = {"perfil": perfil, "eliminar_privados": eliminar_privados, "version": VERSION_ANONIMIZACION}
+    return hashlib.sha1(json.dumps(configuracion, sort_keys=True).encode()).hexdigest()
+
+
+def _inicializar_trabajador(perfil, semilla, eliminar_privados):
+    _configuracion.update(perfil=perfil, semilla=semilla, eliminar_privados=eliminar_privados)
+
+
+def anonimizar_archivo(file_path, output_path, perfil, semilla, eliminar_privados=True):
+    """
+    Anonimiza un archivo DICOM sin decodificar sus píxeles.
+
+    Parameters:
+        file_path (str): Archivo de entrada.
+        output_path (str): Archivo de salida.
+        perfil (dict): Campos a reemplazar (texto) o eliminar (None).
+        semilla (str): Semilla del remapeo de UIDs.
+        eliminar_privados (bool): Elimina las etiquetas privadas (pueden contener datos del paciente).
+
+    Returns:
+        dict: Pares UID original -> UID nuevo usados en el archivo.
+    """
+    dicom_data = pydicom.dcmread(file_path, defer_size=TAMANO_DIFERIDO)
+
+    # Anonimizar los campos de información personal
+    for campo, valor in perfil.items():
+        if valor is None:
+            if campo in dicom_data:
+                delattr(dicom_data, campo)
+        else:
+            setattr(dicom_data, campo, valor)
+
+    if eliminar_privados:
+        dicom_data.remove_private_tags()
+
+    mapeo = {}
+    _remapear_uids(dicom_data, semilla, mapeo)
+    if "SOPInstanceUID" in dicom_data and getattr(dicom_data, "file_meta", None) is not None:
+        dicom_data.file_meta.MediaStorageSOPInstanceUID = dicom_data.SOPInstanceUID
+
+    # Guardar el archivo anonimizado en la carpeta de salida
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    dicom_data.save_as(output_path)
+    return mapeo
+
+
+def _procesar(rutas):
+    file_path, output_path = rutas
+    try:
+        mapeo = anonimizar_archivo(file_path, output_path, _configuracion["perfil"], _configuracion["semilla"],
+                                   _configuracion["eliminar_privados"])
+        return file_path, None, mapeo
+    except Exception as e:
+        return file_path, str(e), {}
+
+
+def _rutas_auxiliares(output_folder):
+    """La tabla de UIDs, la semilla y la huella de la configuración se guardan junto a la carpeta de salida."""
+    base = os.path.abspath(output_folder).rstrip(os.sep)
+    return f"{base}_tabla_uids.csv", f"{base}_semilla.txt", f"{base}_configuracion.txt"
+
+
+def _cargar_semilla(ruta_semilla):
+    if os.path.exists(ruta_semilla):
+        with open(ruta_semilla, encoding="utf-8") as f:
+            return f.read().strip()
+    semilla = secrets.token_hex(16)
+    with open(ruta_semilla, "w", encoding="utf-8") as f:
+        f.write(semilla)
+    return semilla
+
+
+def _esta_actualizado(file_path, output_path):
+    """Un archivo de salida más reciente que su entrada no se vuelve a anonimizar."""
+    try:
+        return os.path.getmtime(output_path) >= os.path.getmtime(file_path)
+    except OSError:
+        return False
+
+
+def anonimizar_carpeta(dicom_folder, output_folder, perfil=PERFIL_AMPLIADO, n_procesos=None,
+                       eliminar_privados=True, forzar=False):
+    """
+    Anonimiza de forma recursiva todos los DICOM de una carpeta con un grupo de procesos.
+
+    La estructura de subcarpetas se conserva en la salida. Los UIDs se sustituyen de forma
+    determinista a partir de una semilla guardada junto a la salida, de modo que todos los
+    archivos de un estudio (y las ejecuciones posteriores) reciben los mismos UIDs nuevos;
+    la correspondencia se guarda en una tabla CSV. Si la salida se hizo con otro perfil u
+    otra opción de etiquetas privadas, se anonimiza de nuevo entera.
+
+    Parameters:
+        dicom_folder (str): Carpeta de entrada.
+        output_folder (str): Carpeta de salida.
+        perfil (dict): Campos a reemplazar (texto) o eliminar (None).
+        n_procesos (int): Número de procesos; por defecto, todos los núcleos.
+        eliminar_privados (bool): Elimina las etiquetas privadas.
+        forzar (bool): Vuelve a anonimizar aunque la salida esté al día.
+
+    Returns:
+        dict: Número de archivos anonimizados, omitidos y con error.
+    """
+    # Crear la carpeta de salida si no existe
+    os.makedirs(output_folder, exist_ok=True)
+    ruta_tabla, ruta_semilla, ruta_configuracion = _rutas_auxiliares(output_folder)
+    semilla = _cargar_semilla(ruta_semilla)
+
+    # Las salidas de una ejecución con otra configuración no están al día aunque sean más recientes
+    huella = huella_configuracion(perfil, eliminar_privados)
+    huella_anterior = None
+    if os.path.exists(ruta_configuracion):
+        with open(ruta_configuracion, encoding="utf-8") as f:
+            huella_anterior = f.read().strip()
+    if huella_anterior is not None and huella_anterior != huella:
+        print("La configuración de anonimización cambió: se reprocesan todos los archivos.")
+    reprocesar = forzar or huella_anterior != huella
+
+    tareas = []
+    omitidos = 0
+    for root, _, files in os.walk(dicom_folder):
+        for filename in files:
+            if not filename.lower().endswith(".dcm"):  # Solo archivos DICOM
+                continue
+            file_path = os.path.join(root, filename)
+            output_path = os.path.join(output_folder, os.path.relpath(file_path, dicom_folder))
+            if not reprocesar and _esta_actualizado(file_path, output_path):
+                omitidos += 1
+                continue
+            tareas.append((file_path, output_path))
+
+    print(f"{len(tareas)} archivos por anonimizar, {omitidos} ya estaban al día.")
+
+    tabla = {}
+    if os.path.exists(ruta_tabla):
+        with open(ruta_tabla, newline="", encoding="utf-8") as f:
+            tabla = {fila["uid_original"]: fila["uid_nuevo"] for fila in csv.DictReader(f)}
+
+    anonimizados = errores = 0
+    with ProcessPoolExecutor(max_workers=n_procesos, initializer=_inicializar_trabajador,
+                             initargs=(perfil, semilla, eliminar_privados)) as pool:
+        for file_path, error, mapeo in pool.map(_procesar, tareas, chunksize=64):
+            if error is not None:
+                errores += 1
+                print(f"Error anonimizando {file_path}: {error}")
+                continue
+            anonimizados += 1
+            tabla.update(mapeo)
+            if anonimizados % 1000 == 0:
+                print(f"Anonimizados {anonimizados} de {len(tareas)} archivos...")
+
+    with open(ruta_tabla, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(["uid_original", "uid_nuevo"])
+        escritor.writerows(sorted(tabla.items()))
+
+    # La huella se guarda al terminar: una ejecución interrumpida se repite entera con la nueva
+    if not errores:
+        with open(ruta_configuracion, "w", encoding="utf-8") as f:
+            f.write(huella)
+
+    print(f"Anonimización terminada: {anonimizados} archivos, {omitidos} omitidos, {errores} errores.")
+    print(f"Tabla de UIDs guardada en: {ruta_tabla}")
+    return {"anonimizados": anonimizados, "omitidos": omitidos, "errores": errores}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Anonimización por lotes de archivos DICOM.")
+    parser.add_argument("entrada", nargs="?", default=dicom_folder, help="Carpeta con los DICOM originales")
+    parser.add_argument("salida", nargs="?", default=output_folder, help="Carpeta para los DICOM anonimizados")
+    parser.add_argument("--perfil", choices=["basico", "ampliado"], default="ampliado")
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--conservar-privados", action="store_true",
+                        help="Conserva las etiquetas privadas (por defecto se eliminan)")
+    parser.add_argument("--forzar", action="store_true", help="Reprocesar archivos ya anonimizados")
+    args = parser.parse_args()
+
+    anonimizar_carpeta(
+        args.entrada,
+        args.salida,
+        perfil=PERFIL_BASICO if args.perfil == "basico" else PERFIL_AMPLIADO,
+        n_procesos=args.procesos,
+        eliminar_privados=not args.conservar_privados,
+        forzar=args.forzar,
+    )
@@ -1,55 +1,264 @@
-import pydicom
-import matplotlib.pyplot as plt
+import argparse
 import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import pydicom
 from PIL import Image  # Asegúrate de importar PIL para trabajar con imágenes
 
-# Leer archivo DICOM
+# Archivo (o carpeta) DICOM por defecto
 file_path = r"C:\Users\Claudia\Desktop\FUESMEN\Imagenes de prueba\1.dcm"
-dicom_data = pydicom.dcmread(file_path)
-
-# Extraer datos
-birth_date = dicom_data.PatientBirthDate  # Fecha en formato AAAAMMDD
-
-# Separar año, mes y día
-birth_year = birth_date[:4]  # Primeros 4 dígitos
-birth_month = birth_date[4:6]  # Dígitos 5 y 6
-birth_day = birth_date[6:]  # Últimos 2 dígitos
-
-patient_data = {
-    "Nombre": dicom_data.PatientName,
-    "ID": dicom_data.PatientID,
-    "Año de nacimiento": birth_year,
-    "Mes de nacimiento": birth_month,
-    "Día de nacimiento": birth_day,
-    "Sexo": dicom_data.PatientSex
-}
-
-# Mostrar en consola
-for key, value in patient_data.items():
-    print(f"{key}: {value}")
-
-# Extraer imagen
-image = dicom_data.pixel_array  # Obtener la matriz de píxeles de la imagen
-
-# Normalizar los valores de píxeles para asegurarse de que estén en el rango de 0-255 (formato compatible con JPEG)
-image_normalized = (image - image.min()) / (image.max() - image.min()) * 255
-image_normalized = image_normalized.astype('uint8')  # Convertir a enteros de 8 bits
-
-# Crear el nuevo nombre del archivo
-carpeta_original = os.path.dirname(file_path)  # Carpeta donde está el archivo DICOM
-nombre_original = os.path.basename(file_path).split(".")[0]  # Nombre sin la extensión
-new_name = f"{nombre_original}j.jpg"  # Nuevo nombre con "j" al final y extensión .jpg
-output_path = os.path.join(carpeta_original, new_name)  # Ruta completa para guardar
-
-# Guardar la imagen como JPEG
-image_pil = Image.fromarray(image_normalized)  # Crear una imagen PIL desde el array
-image_pil.save(output_path, format='JPEG')  # Guardar como JPEG
-
-# Mostrar la imagen
-plt.imshow(image, cmap='gray')  # cmap='gray' para escala de grises
-plt.title(dicom_data.PatientName)
-plt.axis('off')  # Ocultar los ejes
-plt.show()
-
-# Confirmación de que la imagen se guardó
-print(f"Imagen guardada como: {output_path}")
+
+LADO_MOSAICO = 128  # Tamaño en píxeles de cada imagen del mosaico por serie
+
+
+def _primer_valor(valor):
+    """WindowCenter/WindowWidth pueden tener varios valores; se usa el primero."""
+    if isinstance(valor, pydicom.multival.MultiValue):
+        return float(valor[0])
+    return float(valor)
+
+
+@lru_cache(maxsize=64)
+def crear_lut(con_signo, pendiente, ordenada, centro, ancho, invertir):
+    """
+    Tabla de consulta de 65536 entradas que lleva cada valor almacenado de 16 bits a 8 bits.
+
+    Aplica RescaleSlope/RescaleIntercept y la ventana lineal de DICOM (PS3.3 C.11.2.1.2)
+    una sola vez por combinación de parámetros, en lugar de hacerlo con aritmética
+    en coma flotante sobre cada píxel.
+
+    Parameters:
+        con_signo (bool): Los píxeles son int16 (se indexa por su vista uint16).
+        pendiente (float): RescaleSlope.
+        ordenada (float): RescaleIntercept.
+        centro (float): Centro de la ventana.
+        ancho (float): Ancho de la ventana.
+        invertir (bool): True para MONOCHROME1.
+
+    Returns:
+        np.ndarray: LUT uint8 de 65536 entradas.
+    """
+    almacenados = np.arange(65536, dtype=np.int64)
+    if con_signo:
+        almacenados = np.where(almacenados >= 32768, almacenados - 65536, almacenados)
+    valores = almacenados * pendiente + ordenada
+
+    normalizado = (valores - (centro - 0.5)) / max(ancho - 1, 1) + 0.5
+    lut = np.clip(normalizado * 255, 0, 255).astype(np.uint8)
+    if invertir:
+        lut = 255 - lut
+    return lut
+
+
+def convertir_a_8bits(dicom_data):
+    """
+    Convierte la imagen DICOM a uint8 con su ventana y su reescalado.
+
+    Sin WindowCenter/WindowWidth se usa el rango mínimo-máximo de la imagen, como
+    hacía la versión anterior del conversor.
+    """
+    image = dicom_data.pixel_array  # Obtener la matriz de píxeles de la imagen
+    if int(dicom_data.get("NumberOfFrames", 1) or 1) > 1:
+        image = image[0]  # En imágenes multiframe se exporta el primer frame
+
+    if dicom_data.get("SamplesPerPixel", 1) != 1:
+        return image.astype(np.uint8)  # Imágenes en color: se guardan tal cual
+
+    pendiente = float(dicom_data.get("RescaleSlope", 1) or 1)
+    ordenada = float(dicom_data.get("RescaleIntercept", 0) or 0)
+    invertir = dicom_data.get("PhotometricInterpretation") == "MONOCHROME1"
+
+    if "WindowCenter" in dicom_data and "WindowWidth" in dicom_data:
+        centro = _primer_valor(dicom_data.WindowCenter)
+        ancho = _primer_valor(dicom_data.WindowWidth)
+    else:
+        minimo = float(image.min()) * pendiente + ordenada
+        maximo = float(image.max()) * pendiente + ordenada
+        ancho = max(maximo - minimo, 1.0) + 1
+        centro = minimo + ancho / 2
+
+    return aplicar_ventana(image, pendiente, ordenada, centro, ancho, invertir)
+
+
+def aplicar_ventana(image, pendiente, ordenada, centro, ancho, invertir=False):
+    """
+    Aplica el reescalado y la ventana a un array de píxeles y devuelve uint8.
+
+    Los enteros de hasta 16 bits pasan por la LUT de crear_lut; el resto se calcula
+    en coma flotante con la misma fórmula.
+    """
+    if image.dtype.kind in "ui" and image.dtype.itemsize <= 2:
+        con_signo = image.dtype.kind == "i"
+        almacenados = image.astype(np.int16 if con_signo else np.uint16, copy=False)
+        lut = crear_lut(con_signo, pendiente, ordenada, round(centro, 4), round(ancho, 4), invertir)
+        return lut[almacenados.view(np.uint16)]
+
+    # Otros tipos (float, 32 bits): misma ventana calculada en coma flotante
+    valores = image.astype(np.float64) * pendiente + ordenada
+    normalizado = np.clip(((valores - (centro - 0.5)) / max(ancho - 1, 1) + 0.5) * 255, 0, 255)
+    image_normalized = np.nan_to_num(normalizado).astype(np.uint8)
+    return 255 - image_normalized if invertir else image_normalized
+
+
+def _exportar_archivo(tarea):
+    """
+    Exporta un DICOM a JPEG/PNG y, si se pide, su miniatura.
+
+    Returns:
+        tuple: (ruta, clave de serie, número de instancia, miniatura para el mosaico o None, error).
+    """
+    ruta, carpeta_salida, formato, lado_miniatura, con_mosaico = tarea
+    try:
+        dicom_data = pydicom.dcmread(ruta)
+        image_8bits = convertir_a_8bits(dicom_data)
+
+        # Crear el nuevo nombre del archivo
+        nombre_original = os.path.splitext(os.path.basename(ruta))[0]  # Nombre sin la extensión
+        extension = "jpg" if formato == "jpeg" else formato
+        os.makedirs(carpeta_salida, exist_ok=True)
+        output_path = os.path.join(carpeta_salida, f"{nombre_original}j.{extension}")
+
+        image_pil = Image.fromarray(image_8bits)  # Crear una imagen PIL desde el array
+        image_pil.save(output_path, format=formato.upper())
+
+        if lado_miniatura:
+            miniatura = image_pil.copy()
+            miniatura.thumbnail((lado_miniatura, lado_miniatura))
+            miniatura.save(os.path.join(carpeta_salida, f"{nombre_original}_mini.{extension}"),
+                           format=formato.upper())
+
+        mosaico = None
+        if con_mosaico:
+            celda = image_pil.convert("L")
+            celda.thumbnail((LADO_MOSAICO, LADO_MOSAICO))
+            mosaico = np.asarray(celda)
+
+        serie = (carpeta_salida, str(dicom_data.get("SeriesInstanceUID", "")),
+                 str(dicom_data.get("SeriesDescription", "serie")))
+        return ruta, serie, int(dicom_data.get("InstanceNumber", 0) or 0), mosaico, None
+    except Exception as e:
+        return ruta, None, 0, None, str(e)
+
+
+def guardar_mosaico(celdas, output_path, columnas=None):
+    """
+    Compone una hoja de contactos con las miniaturas de una serie.
+
+    Parameters:
+        celdas (list): Miniaturas uint8 en el orden de la serie.
+        output_path (str): Ruta de la imagen resultante.
+        columnas (int): Columnas del mosaico; por defecto, lo más cuadrado posible.
+    """
+    columnas = columnas or int(np.ceil(np.sqrt(len(celdas))))
+    filas = int(np.ceil(len(celdas) / columnas))
+    lienzo = np.zeros((filas * LADO_MOSAICO, columnas * LADO_MOSAICO), dtype=np.uint8)
+    for k, celda in enumerate(celdas):
+        fila, columna = divmod(k, columnas)
+        y0 = fila * LADO_MOSAICO + (LADO_MOSAICO - celda.shape[0]) // 2
+        x0 = columna * LADO_MOSAICO + (LADO_MOSAICO - celda.shape[1]) // 2
+        lienzo[y0:y0 + celda.shape[0], x0:x0 + celda.shape[1]] = celda
+    Image.fromarray(lienzo).save(output_path)
+
+
+def exportar_carpeta(entrada, salida=None, formato="jpeg", n_procesos=None, lado_miniatura=0, mosaico=False):
+    """
+    Exporta todos los DICOM de una carpeta (o un único archivo) sin abrir ventanas.
+
+    Parameters:
+        entrada (str): Archivo DICOM o carpeta que se recorre de forma recursiva.
+        salida (str): Carpeta de salida; por defecto, junto a cada archivo.
+        formato (str): "jpeg" o "png".
+        n_procesos (int): Número de procesos; por defecto, todos los núcleos.
+        lado_miniatura (int): Lado máximo de las miniaturas (0 para no generarlas).
+        mosaico (bool): Genera una hoja de contactos por serie.
+
+    Returns:
+        dict: Número de imágenes exportadas y de errores.
+    """
+    if os.path.isfile(entrada):
+        raiz, archivos = os.path.dirname(entrada), [entrada]
+    else:
+        raiz = entrada
+        archivos = [
+            os.path.join(root, f)
+            for root, _, files in os.walk(entrada)
+            for f in files if f.lower().endswith(".dcm")
+        ]
+
+    tareas = []
+    for ruta in archivos:
+        carpeta_original = os.path.dirname(ruta)  # Carpeta donde está el archivo DICOM
+        carpeta_salida = (os.path.join(salida, os.path.relpath(carpeta_original, raiz))
+                          if salida else carpeta_original)
+        tareas.append((ruta, os.path.normpath(carpeta_salida), formato, lado_miniatura, mosaico))
+
+    exportadas = errores = 0
+    series = defaultdict(list)
+    with ProcessPoolExecutor(max_workers=n_procesos) as pool:
+        for ruta, serie, instancia, celda, error in pool.map(_exportar_archivo, tareas, chunksize=16):
+            if error is not None:
+                errores += 1
+                print(f"Error exportando {ruta}: {error}")
+                continue
+            exportadas += 1
+            if celda is not None:
+                series[serie].append((instancia, ruta, celda))
+
+    for (carpeta_salida, serie_uid, descripcion), celdas in series.items():
+        celdas.sort(key=lambda c: (c[0], c[1]))
+        # El final del UID distingue series con la misma descripción en la misma carpeta
+        nombre = "".join(c if c.isalnum() or c in "-_" else "_" for c in descripcion) + f"_{serie_uid[-6:]}"
+        output_path = os.path.join(carpeta_salida, f"mosaico_{nombre}.{'jpg' if formato == 'jpeg' else formato}")
+        guardar_mosaico([celda for _, _, celda in celdas], output_path)
+        print(f"Mosaico guardado en: {output_path}")
+
+    print(f"Se exportaron {exportadas} imágenes ({errores} errores).")
+    return {"exportadas": exportadas, "errores": errores}
+
+
+def mostrar_archivo(file_path):
+    """Muestra los datos del paciente y la imagen de un único archivo (comportamiento original)."""
+    import matplotlib.pyplot as plt
+
+    dicom_data = pydicom.dcmread(file_path)
+
+    # Extraer datos
+    birth_date = dicom_data.get("PatientBirthDate", "")  # Fecha en formato AAAAMMDD
+
+    patient_data = {
+        "Nombre": dicom_data.get("PatientName", ""),
+        "ID": dicom_data.get("PatientID", ""),
+        "Año de nacimiento": birth_date[:4],  # Primeros 4 dígitos
+        "Mes de nacimiento": birth_date[4:6],  # Dígitos 5 y 6
+        "Día de nacimiento": birth_date[6:],  # Últimos 2 dígitos
+        "Sexo": dicom_data.get("PatientSex", ""),
+    }
+
+    # Mostrar en consola
+    for key, value in patient_data.items():
+        print(f"{key}: {value}")
+
+    # Mostrar la imagen
+    plt.imshow(convertir_a_8bits(dicom_data), cmap='gray')  # cmap='gray' para escala de grises
+    plt.title(str(patient_data["Nombre"]))
+    plt.axis('off')  # Ocultar los ejes
+    plt.show()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exportación por lotes de DICOM a JPEG/PNG.")
+    parser.add_argument("entrada", nargs="?", default=file_path, help="Archivo DICOM o carpeta")
+    parser.add_argument("--salida", default=None, help="Carpeta de salida (por defecto, junto a cada DICOM)")
+    parser.add_argument("--formato", choices=["jpeg", "png"], default="jpeg")
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--miniaturas", type=int, default=0, help="Lado máximo de las miniaturas en píxeles")
+    parser.add_argument("--mosaico", action="store_true", help="Generar una hoja de contactos por serie")
+    parser.add_argument("--mostrar", action="store_true", help="Mostrar la imagen (solo con un archivo)")
+    args = parser.parse_args()
+
+    exportar_carpeta(args.entrada, args.salida, args.formato, args.procesos, args.miniaturas, args.mosaico)
+    if args.mostrar and os.path.isfile(args.entrada):
+        mostrar_archivo(args.entrada)
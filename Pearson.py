@@ -1,25 +1,366 @@
+import argparse
+import os
+
 import pydicom
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.stats import pearsonr
+from matplotlib.colors import LogNorm
+from scipy.stats import t as student_t
 from tkinter import Tk, filedialog
 
+# Elementos por bloque en los cálculos en streaming (memoria acotada por bloque)
+BLOCK_SIZE = 1 << 20
+
 def load_dicom_image(path):
     dicom_data = pydicom.dcmread(path)
     image = dicom_data.pixel_array.astype(np.float32)
     return image
 
-def compute_pearson(image1, image2):
+def load_mask(path):
+    """Carga una máscara de ROI (.npy o DICOM); los valores distintos de cero pertenecen a la ROI."""
+    if path.lower().endswith(".npy"):
+        return np.load(path) != 0
+    return pydicom.dcmread(path).pixel_array != 0
+
+def _flat_view(array):
+    """Vista 1D del array sin copiarlo cuando es contiguo."""
+    return np.asarray(array).reshape(-1)
+
+def _iter_blocks(image1, image2, mask=None, block_size=BLOCK_SIZE):
+    """Recorre dos imágenes (o volúmenes) por bloques, aplicando la máscara si la hay."""
+    flat1, flat2 = _flat_view(image1), _flat_view(image2)
+    flat_mask = None if mask is None else _flat_view(np.broadcast_to(mask, np.shape(image1)))
+    for start in range(0, flat1.size, block_size):
+        block1 = flat1[start:start + block_size]
+        block2 = flat2[start:start + block_size]
+        if flat_mask is not None:
+            block_mask = flat_mask[start:start + block_size]
+            block1, block2 = block1[block_mask], block2[block_mask]
+        yield block1, block2
+
+class StreamingPearson:
+    """
+    Correlación de Pearson acumulada por bloques.
+
+    Guarda solo los momentos centrados (n, medias, sumas de cuadrados y de productos)
+    y combina cada bloque con la fórmula de Chan et al., así que se pueden añadir
+    pares de imágenes de una serie o de un volumen uno a uno sin aplanarlos ni
+    tenerlos todos en memoria.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean1 = self.mean2 = 0.0
+        self.m2_1 = self.m2_2 = self.c12 = 0.0
+
+    def _merge(self, n, mean1, mean2, m2_1, m2_2, c12):
+        total = self.n + n
+        delta1, delta2 = mean1 - self.mean1, mean2 - self.mean2
+        factor = self.n * n / total
+        self.mean1 += delta1 * n / total
+        self.mean2 += delta2 * n / total
+        self.m2_1 += m2_1 + delta1 * delta1 * factor
+        self.m2_2 += m2_2 + delta2 * delta2 * factor
+        self.c12 += c12 + delta1 * delta2 * factor
+        self.n = total
+
+    def update(self, image1, image2, mask=None, block_size=BLOCK_SIZE):
+        if np.shape(image1) != np.shape(image2):
+            raise ValueError("Las imágenes deben tener las mismas dimensiones")
+        for block1, block2 in _iter_blocks(image1, image2, mask, block_size):
+            if block1.size == 0:
+                continue
+            x = block1.astype(np.float64)
+            y = block2.astype(np.float64)
+            mean1, mean2 = x.mean(), y.mean()
+            x -= mean1
+            y -= mean2
+            self._merge(x.size, mean1, mean2, x @ x, y @ y, x @ y)
+        return self
+
+    def result(self):
+        """Devuelve (coeficiente de correlación, valor p bilateral, número de píxeles)."""
+        if self.n < 3 or self.m2_1 == 0 or self.m2_2 == 0:
+            return np.nan, np.nan, self.n
+        r = float(np.clip(self.c12 / np.sqrt(self.m2_1 * self.m2_2), -1.0, 1.0))
+        if abs(r) == 1.0:
+            return r, 0.0, self.n
+        grados = self.n - 2
+        estadistico = r * np.sqrt(grados / (1.0 - r * r))
+        return r, float(2 * student_t.sf(abs(estadistico), grados)), self.n
+
+def compute_pearson(image1, image2, mask=None):
     if image1.shape != image2.shape:
         raise ValueError("Las imágenes deben tener las mismas dimensiones")
-    
-    flat1 = image1.flatten()
-    flat2 = image2.flatten()
-#TRANSFORMA LA MATRIZ EN UN VECTOR FILA PARA PODER CALCULAR LA CORRELACIÓN DE PEARSON
-    
-    correlation, _ = pearsonr(flat1, flat2)
+
+    flat1 = image1.ravel()
+    flat2 = image2.ravel()
+#VISTAS 1D DE LAS IMÁGENES (SIN COPIA); LA CORRELACIÓN SE ACUMULA POR BLOQUES
+    if mask is not None:
+        # Los valores devueltos (p. ej. para el gráfico de dispersión) son los que entran en r
+        flat_mask = _flat_view(np.broadcast_to(mask, np.shape(image1)))
+        flat1, flat2 = flat1[flat_mask], flat2[flat_mask]
+
+    correlation, _, _ = StreamingPearson().update(image1, image2, mask).result()
     return correlation, flat1, flat2
 
+def compute_pearson_series(series1, series2, mask=None):
+    """
+    Correlación de Pearson entre dos series completas, corte a corte.
+
+    Parameters:
+        series1, series2: Secuencias de cortes (VolumenPerezoso, listas de arrays o volúmenes).
+        mask: Máscara 2D común a todos los cortes, o 3D con una máscara por corte.
+
+    Returns:
+        tuple: (coeficiente, valor p, número de píxeles).
+    """
+    if len(series1) != len(series2):
+        raise ValueError("Las series deben tener el mismo número de cortes")
+    accumulator = StreamingPearson()
+    for index in range(len(series1)):
+        slice_mask = None if mask is None else (mask[index] if np.ndim(mask) == 3 else mask)
+        accumulator.update(series1[index], series2[index], slice_mask)
+    return accumulator.result()
+
+def correlation_matrix(images, mask=None, block_size=BLOCK_SIZE):
+    """
+    Matriz N×N de correlaciones de Pearson entre N imágenes (o volúmenes) de igual forma.
+
+    Se recorre el conjunto una sola vez por bloques de píxeles: cada bloque se apila
+    como (N, B) y se acumulan sus sumas y el producto matricial bloque @ bloque.T.
+    Los valores se desplazan por las medias del primer bloque para evitar la
+    cancelación numérica al restar los productos de las medias.
+
+    Returns:
+        np.ndarray: Matriz (N, N) de coeficientes (NaN para imágenes constantes).
+    """
+    views = [_flat_view(image) for image in images]
+    if any(view.size != views[0].size for view in views):
+        raise ValueError("Las imágenes deben tener las mismas dimensiones")
+    flat_mask = None if mask is None else _flat_view(np.broadcast_to(mask, np.shape(images[0])))
+
+    n_images = len(views)
+    sums = np.zeros(n_images)
+    cross = np.zeros((n_images, n_images))
+    shift = None
+    count = 0
+    for start in range(0, views[0].size, block_size):
+        block = np.stack([view[start:start + block_size] for view in views]).astype(np.float64)
+        if flat_mask is not None:
+            block = block[:, flat_mask[start:start + block_size]]
+        if block.shape[1] == 0:
+            continue
+        if shift is None:
+            shift = block.mean(axis=1)
+        block -= shift[:, None]
+        sums += block.sum(axis=1)
+        cross += block @ block.T
+        count += block.shape[1]
+
+    if count < 2:
+        return np.full((n_images, n_images), np.nan)
+    covariance = cross - np.outer(sums, sums) / count
+    deviation = np.sqrt(np.clip(np.diag(covariance), 0, None))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        matrix = covariance / np.outer(deviation, deviation)
+    matrix[np.outer(deviation, deviation) == 0] = np.nan
+    return np.clip(matrix, -1.0, 1.0)
+
+def histogram2d_streaming(image1, image2, mask=None, bins=256, block_size=BLOCK_SIZE):
+    """
+    Histograma 2D de intensidades conjuntas acumulado por bloques.
+
+    Una primera pasada obtiene el rango de cada imagen y la segunda acumula las cuentas
+    con bordes fijos, de modo que la memoria no depende del número de píxeles.
+
+    Returns:
+        tuple: (cuentas (bins, bins), bordes en x, bordes en y).
+    """
+    ranges = [[np.inf, -np.inf], [np.inf, -np.inf]]
+    for block1, block2 in _iter_blocks(image1, image2, mask, block_size):
+        if block1.size == 0:
+            continue
+        for limits, block in zip(ranges, (block1, block2)):
+            limits[0] = min(limits[0], float(block.min()))
+            limits[1] = max(limits[1], float(block.max()))
+    if not np.isfinite(ranges[0][0]):
+        raise ValueError("La máscara no contiene ningún píxel")
+    for limits in ranges:
+        if limits[0] == limits[1]:
+            limits[1] = limits[0] + 1
+
+    counts = np.zeros((bins, bins), dtype=np.int64)
+    for block1, block2 in _iter_blocks(image1, image2, mask, block_size):
+        block_counts, _, _ = np.histogram2d(block1, block2, bins=bins, range=ranges)
+        counts += block_counts.astype(np.int64)
+    xedges = np.linspace(*ranges[0], bins + 1)
+    yedges = np.linspace(*ranges[1], bins + 1)
+    return counts, xedges, yedges
+
+class VoxelwiseCorrelation:
+    """
+    Mapas de correlación de Pearson vóxel a vóxel a lo largo de una cohorte.
+
+    Cada sujeto aporta un mapa (por ejemplo de T2) y un valor (por ejemplo una
+    puntuación clínica, o un segundo mapa de la misma forma). Se mantienen por vóxel
+    el número de sujetos válidos, las medias y las sumas de cuadrados y productos
+    centrados con la actualización de Welford, así que la memoria no depende del
+    número de sujetos. Los vóxeles NaN o fuera de la máscara de un sujeto no cuentan
+    para ese sujeto.
+    """
+
+    def __init__(self, shape):
+        self.shape = tuple(shape)
+        self.n = np.zeros(self.shape, dtype=np.int32)
+        self.mean_x = np.zeros(self.shape)
+        self.mean_y = np.zeros(self.shape)
+        self.m2_x = np.zeros(self.shape)
+        self.m2_y = np.zeros(self.shape)
+        self.c_xy = np.zeros(self.shape)
+
+    def update(self, subject_map, value, mask=None):
+        x = np.asarray(subject_map, dtype=np.float64)
+        if x.shape != self.shape:
+            raise ValueError(f"El mapa del sujeto tiene forma {x.shape}; se esperaba {self.shape}")
+        y = np.broadcast_to(np.asarray(value, dtype=np.float64), self.shape)
+        valid = np.isfinite(x) & np.isfinite(y)
+        if mask is not None:
+            valid &= np.broadcast_to(mask, self.shape)
+
+        n = self.n + valid
+        n_safe = np.maximum(n, 1)
+        dx = np.where(valid, x - self.mean_x, 0.0)
+        dy = np.where(valid, y - self.mean_y, 0.0)
+        self.mean_x += dx / n_safe
+        self.mean_y += dy / n_safe
+        # Los segundos factores usan ya las medias actualizadas (Welford)
+        self.m2_x += dx * np.where(valid, x - self.mean_x, 0.0)
+        self.m2_y += dy * np.where(valid, y - self.mean_y, 0.0)
+        self.c_xy += dx * np.where(valid, y - self.mean_y, 0.0)
+        self.n = n
+        return self
+
+    def result(self, min_subjects=3):
+        """
+        Devuelve los mapas (r, p, n) en float32; r y p son NaN donde hay menos de
+        min_subjects sujetos válidos o alguna de las variables es constante.
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = self.c_xy / np.sqrt(self.m2_x * self.m2_y)
+            r = np.clip(r, -1.0, 1.0)
+            r[(self.n < max(min_subjects, 3)) | (self.m2_x <= 0) | (self.m2_y <= 0)] = np.nan
+            degrees = np.maximum(self.n - 2, 1)
+            statistic = r * np.sqrt(degrees / np.maximum(1.0 - r * r, 1e-300))
+        p = 2 * student_t.sf(np.abs(statistic), degrees)
+        p[np.isnan(r)] = np.nan
+        return r.astype(np.float32), p.astype(np.float32), self.n
+
+def load_subject_map(path):
+    """
+    Carga el mapa de un sujeto: .npy/.npz, un archivo DICOM o una carpeta con una serie
+    DICOM (apilada por posición). Se aplican RescaleSlope/RescaleIntercept si existen.
+    """
+    if path.lower().endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    if path.lower().endswith(".npz"):
+        with np.load(path) as data:
+            return data[data.files[0]]
+    if os.path.isdir(path):
+        from volumen_perezoso import cargar_volumen_perezoso
+        volume = cargar_volumen_perezoso(path)
+        if volume is None:
+            raise ValueError(f"No hay archivos DICOM en {path}")
+        header = volume.cabeceras[0]
+        data = volume.como_array()
+        volume.cerrar()
+    else:
+        header = pydicom.dcmread(path)
+        data = header.pixel_array
+    slope = float(header.get("RescaleSlope", 1) or 1)
+    intercept = float(header.get("RescaleIntercept", 0) or 0)
+    return data.astype(np.float32) * slope + intercept
+
+def read_cohort(csv_path):
+    """Lee un CSV con las columnas 'mapa' (ruta del mapa del sujeto) y 'valor' (número o ruta de otro mapa)."""
+    import csv
+    base = os.path.dirname(os.path.abspath(csv_path))
+    cohort = []
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            value = row["valor"].strip()
+            try:
+                value = float(value)
+            except ValueError:
+                value = os.path.join(base, value)
+            cohort.append((os.path.join(base, row["mapa"].strip()), value))
+    return cohort
+
+def cohort_correlation(cohort, mask=None, min_subjects=3):
+    """
+    Mapas r y p de una cohorte, cargando un sujeto cada vez.
+
+    Parameters:
+        cohort (list): Pares (ruta del mapa, valor escalar o ruta de un segundo mapa).
+        mask: Máscara común a todos los sujetos (opcional).
+
+    Returns:
+        tuple: (r, p, n) con la forma de los mapas.
+    """
+    accumulator = None
+    for index, (map_path, value) in enumerate(cohort, start=1):
+        subject_map = load_subject_map(map_path)
+        if isinstance(value, str):
+            value = load_subject_map(value)
+        if accumulator is None:
+            accumulator = VoxelwiseCorrelation(np.shape(subject_map))
+        accumulator.update(subject_map, value, mask)
+        print(f"Sujeto {index}/{len(cohort)} añadido: {map_path}")
+    if accumulator is None:
+        raise ValueError("La cohorte está vacía")
+    return accumulator.result(min_subjects)
+
+def save_correlation_maps(r_map, p_map, n_map, output_folder, file_format="npy", reference_folder=None):
+    """
+    Guarda los mapas r y p como NumPy (.npy, con NaN) o como series DICOM.
+
+    En DICOM los valores se cuantizan a uint16 con RescaleSlope/RescaleIntercept
+    (r en [-1, 1] con pasos de 1e-4, p en [0, 1] con pasos de 1/65534). El 0 almacenado
+    queda reservado para los vóxeles sin dato (NaN) y los válidos empiezan en 1, así que
+    r = -1 o p = 0 no se confunden con el fondo. Los p menores que el paso se guardan
+    como el mínimo (1); para conservarlos, o los NaN, se usa el formato npy.
+    Las cabeceras se toman de la serie de referencia, que debe tener un corte por
+    cada corte de los mapas.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    if file_format == "npy":
+        paths = []
+        for name, data in (("mapa_r", r_map), ("mapa_p", p_map), ("n_sujetos", n_map)):
+            path = os.path.join(output_folder, f"{name}.npy")
+            np.save(path, data)
+            paths.append(path)
+        return paths
+
+    if reference_folder is None:
+        raise ValueError("Para guardar en DICOM hace falta una serie de referencia")
+    from volumen_perezoso import cargar_volumen_perezoso
+    from T2_volumen import guardar_volumen_dicom
+    reference = cargar_volumen_perezoso(reference_folder)
+    reference.cerrar()
+    r_volume = r_map if r_map.ndim == 3 else r_map[np.newaxis]
+    p_volume = p_map if p_map.ndim == 3 else p_map[np.newaxis]
+    if len(reference) != r_volume.shape[0]:
+        raise ValueError(f"La referencia tiene {len(reference)} cortes y los mapas {r_volume.shape[0]}")
+
+    r_scale, p_scale = 10000, 65534
+    r_uint16 = np.nan_to_num(np.round((np.clip(r_volume, -1, 1) + 1) * r_scale) + 1, nan=0).astype(np.uint16)
+    p_uint16 = np.nan_to_num(np.round(np.clip(p_volume, 0, 1) * p_scale) + 1, nan=0).astype(np.uint16)
+    paths = guardar_volumen_dicom(r_uint16, reference.rutas, output_folder, "mapa_r",
+                                  pendiente=1 / r_scale, ordenada=-1 - 1 / r_scale, descripcion="Pearson r")
+    paths += guardar_volumen_dicom(p_uint16, reference.rutas, output_folder, "mapa_p",
+                                   pendiente=1 / p_scale, ordenada=-1 / p_scale, descripcion="Pearson p")
+    return paths
+
 def plot_scatter(flat1, flat2, correlation):
     plt.figure(figsize=(8, 6))
     plt.scatter(flat1, flat2, alpha=0.5, s=1)
@@ -29,27 +370,120 @@ def plot_scatter(flat1, flat2, correlation):
     plt.grid()
     plt.show()
 
+def plot_density(image1, image2, correlation, mask=None, kind="hist2d", bins=256):
+    """
+    Gráfico de densidad de intensidades conjuntas en lugar de un punto por píxel.
+
+    kind="hist2d" usa histogram2d_streaming (válido para volúmenes completos);
+    kind="hexbin" usa plt.hexbin sobre los píxeles de la ROI.
+    """
+    plt.figure(figsize=(8, 6))
+    if kind == "hexbin":
+        flat1, flat2 = _flat_view(image1), _flat_view(image2)
+        if mask is not None:
+            flat_mask = _flat_view(np.broadcast_to(mask, np.shape(image1)))
+            flat1, flat2 = flat1[flat_mask], flat2[flat_mask]
+        plt.hexbin(flat1, flat2, gridsize=bins // 2, bins="log", mincnt=1, cmap="viridis")
+    else:
+        counts, xedges, yedges = histogram2d_streaming(image1, image2, mask, bins)
+        plt.pcolormesh(xedges, yedges, np.ma.masked_equal(counts.T, 0), norm=LogNorm(), cmap="viridis")
+    plt.colorbar(label="Número de píxeles")
+    plt.xlabel("Intensidad de píxeles - Imagen 1")
+    plt.ylabel("Intensidad de píxeles - Imagen 2")
+    plt.title(f"Coeficiente de Pearson: {correlation:.4f}")
+    plt.grid()
+    plt.show()
+
+def plot_correlation_matrix(matrix, labels):
+    plt.figure(figsize=(8, 7))
+    plt.imshow(matrix, cmap="coolwarm", vmin=-1, vmax=1)
+    plt.colorbar(label="Coeficiente de Pearson")
+    plt.xticks(range(len(labels)), labels, rotation=90)
+    plt.yticks(range(len(labels)), labels)
+    if len(labels) <= 12:
+        for i in range(len(labels)):
+            for j in range(len(labels)):
+                plt.text(j, i, f"{matrix[i, j]:.2f}", ha="center", va="center", fontsize=8)
+    plt.title("Matriz de correlación de Pearson")
+    plt.tight_layout()
+    plt.show()
+
 def select_file():
     root = Tk()
     root.withdraw()
     file_path = filedialog.askopenfilename(title="Seleccionar imagen DICOM", filetypes=[("DICOM files", "*.dcm")])
     return file_path
 
+def select_files():
+    root = Tk()
+    root.withdraw()
+    file_paths = filedialog.askopenfilenames(title="Seleccionar imágenes DICOM", filetypes=[("DICOM files", "*.dcm")])
+    return list(file_paths)
+
 def main():
-    path1 = select_file()
-    path2 = select_file()
-    
-    if not path1 or not path2:
+    parser = argparse.ArgumentParser(description="Correlación de Pearson entre imágenes o series DICOM.")
+    parser.add_argument("imagenes", nargs="*", help="Dos imágenes (par) o más (matriz N×N); sin argumentos se abre un diálogo")
+    parser.add_argument("--series", nargs=2, metavar=("CARPETA1", "CARPETA2"), help="Correlación entre dos series completas")
+    parser.add_argument("--cohorte", default=None, help="CSV (columnas mapa,valor) para mapas de correlación vóxel a vóxel")
+    parser.add_argument("--salida", default="mapas_correlacion", help="Carpeta de salida de los mapas de la cohorte")
+    parser.add_argument("--formato", choices=["npy", "dicom"], default="npy")
+    parser.add_argument("--referencia", default=None, help="Serie DICOM de referencia para guardar en DICOM")
+    parser.add_argument("--mascara", default=None, help="Máscara de ROI (.npy o DICOM)")
+    parser.add_argument("--grafico", choices=["hist2d", "hexbin", "scatter", "ninguno"], default="hist2d")
+    parser.add_argument("--bins", type=int, default=256)
+    args = parser.parse_args()
+
+    mask = load_mask(args.mascara) if args.mascara else None
+
+    if args.cohorte:
+        cohort = read_cohort(args.cohorte)
+        r_map, p_map, n_map = cohort_correlation(cohort, mask)
+        reference = args.referencia
+        if reference is None and os.path.isdir(cohort[0][0]):
+            reference = cohort[0][0]  # Las cabeceras se toman del primer sujeto
+        paths = save_correlation_maps(r_map, p_map, n_map, args.salida, args.formato, reference)
+        print(f"Mapas de correlación guardados en: {', '.join(paths)}")
+        return
+
+    if args.series:
+        from volumen_perezoso import cargar_volumen_perezoso
+        series1, series2 = (cargar_volumen_perezoso(carpeta) for carpeta in args.series)
+        if not series1 or not series2:
+            print("No se encontraron imágenes DICOM en alguna de las carpetas.")
+            return
+        correlation, p_value, n = compute_pearson_series(series1, series2, mask)
+        print(f"Coeficiente de correlación de Pearson: {correlation:.4f} (p = {p_value:.3g}, {n} píxeles)")
+        return
+
+    paths = args.imagenes
+    if not paths:
+        # Se pueden elegir varias imágenes a la vez; con una sola se pide la segunda
+        paths = select_files()
+        if len(paths) == 1:
+            paths.append(select_file())
+
+    if len(paths) < 2 or not all(paths):
         print("Selección de archivos cancelada.")
         return
-    
-    image1 = load_dicom_image(path1)
-    image2 = load_dicom_image(path2)
-    
-    correlation, flat1, flat2 = compute_pearson(image1, image2)
+
+    images = [load_dicom_image(path) for path in paths]
+
+    if len(images) > 2:
+        matrix = correlation_matrix(images, mask)
+        labels = [os.path.basename(path) for path in paths]
+        print(matrix)
+        if args.grafico != "ninguno":
+            plot_correlation_matrix(matrix, labels)
+        return
+
+    image1, image2 = images
+    correlation, flat1, flat2 = compute_pearson(image1, image2, mask)
     print(f"Coeficiente de correlación de Pearson: {correlation:.4f}")
-    
-    plot_scatter(flat1, flat2, correlation)
+
+    if args.grafico == "scatter":
+        plot_scatter(flat1, flat2, correlation)
+    elif args.grafico != "ninguno":
+        plot_density(image1, image2, correlation, mask, args.grafico, args.bins)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,11 +1,12 @@
 import os
-import shutil
-import pydicom
 import tkinter as tk
 from tkinter import filedialog
 from tkinter import messagebox
 from tkinter import simpledialog
 import threading
+import queue
+from copia_dicom import copiar_archivos
+from indice_dicom import RUTA_INDICE, abrir_indice, actualizar_indice
 
 def mostrar_Instrucciones():
     # Crear una ventana emergente con un tamaño más ancho
@@ -39,34 +40,38 @@ def mostrar_Instrucciones():
 
     
 
-def identificar_secuencia_dicom(dicom_folder):
+def identificar_secuencia_dicom(dicom_folder, ruta_indice=RUTA_INDICE, al_encontrar=None):
     secuencias = {}
-    for root, _, files in os.walk(dicom_folder):
-        for file in files:
-            if file.lower().endswith(".dcm"):  # Verifica que sea un archivo DICOM
-                file_path = os.path.join(root, file)
-                try:
-                    dicom_data = pydicom.dcmread(file_path)
-                    series_description = dicom_data.get("SeriesDescription", "Desconocida")
-                    protocol_name = dicom_data.get("ProtocolName", "Desconocido")
-                    numero_serie = dicom_data.get("SeriesNumber", "Desconocido")
-                    device_name = dicom_data.get("DeviceSerialNumber", "Desconocido")
-                    secuencia_info = {
-                        "SeriesDescription": series_description,
-                        "ProtocolName": protocol_name,
-                        "FilePath": file_path,
-                        "SeriesNumber": numero_serie,
-                        "DeviceName": device_name,
-                    }
-                    secuencias.setdefault(series_description, []).append(secuencia_info)
-                except Exception as e:
-                    print(f"Error leyendo el archivo {file_path}: {e}")
+
+    def agregar(fila):
+        if fila["error"] is not None:
+            return
+        series_description = fila["series_description"] or "Desconocida"
+        secuencia_info = {
+            "SeriesDescription": series_description,
+            "ProtocolName": fila["protocol_name"] or "Desconocido",
+            "FilePath": fila["ruta"],
+            "SeriesNumber": fila["series_number"] if fila["series_number"] is not None else "Desconocido",
+            "DeviceName": fila["device_serial"] or "Desconocido",
+        }
+        secuencias.setdefault(series_description, []).append(secuencia_info)
+        if al_encontrar is not None:
+            al_encontrar(secuencia_info)
+
+    # Actualizar el índice en disco: solo se leen (en paralelo y sin píxeles) los archivos nuevos o modificados
+    conexion = abrir_indice(ruta_indice)
+    try:
+        resumen = actualizar_indice(conexion, dicom_folder, al_leer=agregar)
+        print(f"Índice actualizado: {resumen['nuevos']} nuevos, {resumen['actualizados']} modificados, "
+              f"{resumen['sin_cambios']} sin cambios, {resumen['eliminados']} eliminados")
+    finally:
+        conexion.close()
     return secuencias
 
-def copiar_secuencia(secuencias, criterio, valor, destino):
+def copiar_secuencia(secuencias, criterio, valor, destino, modo="paralelo"):
     seleccionadas = [
         detalles for key, detalles in secuencias.items()
-        if any(item[criterio] == valor for item in detalles)
+        if any(str(item[criterio]) == valor for item in detalles)
     ]
     
     if not seleccionadas:
@@ -76,20 +81,20 @@ def copiar_secuencia(secuencias, criterio, valor, destino):
     if not os.path.exists(destino):
         os.makedirs(destino)
     
-    for detalles in seleccionadas:
-        for item in detalles:
-            origen = item["FilePath"]
-            archivo_nombre = os.path.basename(origen)
-            destino_final = os.path.join(destino, archivo_nombre)
-            shutil.copy(origen, destino_final)
-            print(f"Copiado: {origen} -> {destino_final}")
+    # Modos: "copia", "paralelo", "hardlink", "reflink" o "symlink" (con vuelta automática a la copia)
+    pares = [
+        (item["FilePath"], os.path.join(destino, os.path.basename(item["FilePath"])))
+        for detalles in seleccionadas
+        for item in detalles
+    ]
+    copiar_archivos(pares, modo=modo)
     print(f"¡Secuencia/protocolo copiado exitosamente a {destino}!")
 
 def seleccionar_carpeta(titulo="Seleccionar Carpeta"):
     carpeta = filedialog.askdirectory(title=titulo)
     return carpeta
 
-def mostrar_info_secuencias(secuencias_identificadas):
+def mostrar_info_secuencias(secuencias_identificadas, cola_secuencias=None, al_terminar=None):
     info_ventana = tk.Toplevel()
     info_ventana.title("Información de las secuencias")
     
@@ -101,18 +106,42 @@ def mostrar_info_secuencias(secuencias_identificadas):
     texto_info = tk.Text(frame, wrap=tk.WORD)
     texto_info.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
     
-    # Configurar texto sin necesidad de barra deslizadora
-    info_secuencias = ""
-    for secuencia, detalles in secuencias_identificadas.items():
-        info_secuencias += f"Secuencia: {secuencia}\n"
-        for detalle in detalles[:1]:  # Mostrar solo una entrada por secuencia
-            info_secuencias += f"  - Número de Serie: {detalle['SeriesNumber']}\n"
-            info_secuencias += f"  - Protocolo: {detalle['ProtocolName']}\n"
-            info_secuencias += f"  - Nombre del equipo: {detalle['DeviceName']}\n"
+    # Mostrar solo una entrada por secuencia
+    mostradas = set()
+
+    def agregar_secuencia(detalle):
+        if detalle["SeriesDescription"] in mostradas:
+            return
+        mostradas.add(detalle["SeriesDescription"])
+        info_secuencias = f"Secuencia: {detalle['SeriesDescription']}\n"
+        info_secuencias += f"  - Número de Serie: {detalle['SeriesNumber']}\n"
+        info_secuencias += f"  - Protocolo: {detalle['ProtocolName']}\n"
+        info_secuencias += f"  - Nombre del equipo: {detalle['DeviceName']}\n"
         info_secuencias += "\n"
+        texto_info.insert(tk.END, info_secuencias)
+
+    if cola_secuencias is None:
+        for detalles in secuencias_identificadas.values():
+            agregar_secuencia(detalles[0])
+        texto_info.config(state=tk.DISABLED)  # Hacer el cuadro de texto solo lectura
+        return
 
-    texto_info.insert(tk.END, info_secuencias)
-    texto_info.config(state=tk.DISABLED)  # Hacer el cuadro de texto solo lectura
+    # Llenar la ventana a medida que el escaneo (en otro hilo) encuentra archivos
+    def revisar_cola():
+        while True:
+            try:
+                detalle = cola_secuencias.get_nowait()
+            except queue.Empty:
+                break
+            if detalle is None:  # Fin del escaneo
+                texto_info.config(state=tk.DISABLED)
+                if al_terminar is not None:
+                    al_terminar()
+                return
+            agregar_secuencia(detalle)
+        info_ventana.after(100, revisar_cola)
+
+    revisar_cola()
 
 def seleccionar_criterio():
     criterio_seleccionado = simpledialog.askstring("Seleccionar criterio", 
@@ -130,22 +159,38 @@ def ejecutar_seleccion_criterio():
     else:
         print("No se ingresó un valor o criterio válido.")
 
-# Crear una ventana principal oculta (no la mostramos)
-root = tk.Tk()
-root.withdraw()
+if __name__ == "__main__":
+    # Crear una ventana principal oculta (no la mostramos)
+    root = tk.Tk()
+    root.withdraw()
+
+    # Mostrar las instrucciones
+    mostrar_Instrucciones()
+
+    # Selección de la carpeta de entrada y salida
+    carpeta_entrada = seleccionar_carpeta("Selecciona la carpeta de entrada de los archivos DICOM")
+    carpeta_salida = seleccionar_carpeta("Selecciona la carpeta de salida para guardar los archivos")
+
+    # Identificar secuencias en un hilo aparte; la ventana de información se llena a medida que llegan
+    secuencias_identificadas = {}
+    cola_secuencias = queue.Queue()
 
-# Mostrar las instrucciones
-mostrar_Instrucciones()
+    def escanear_entrada():
+        try:
+            secuencias_identificadas.update(
+                identificar_secuencia_dicom(carpeta_entrada, al_encontrar=cola_secuencias.put)
+            )
+        finally:
+            cola_secuencias.put(None)
 
-# Selección de la carpeta de entrada y salida
-carpeta_entrada = seleccionar_carpeta("Selecciona la carpeta de entrada de los archivos DICOM")
-carpeta_salida = seleccionar_carpeta("Selecciona la carpeta de salida para guardar los archivos")
+    def al_terminar_escaneo():
+        # Ejecutar la selección del criterio en el hilo principal cuando el escaneo termina
+        ejecutar_seleccion_criterio()
+        root.destroy()
 
-# Identificar secuencias
-secuencias_identificadas = identificar_secuencia_dicom(carpeta_entrada)
+    threading.Thread(target=escanear_entrada, daemon=True).start()
 
-# Mostrar la información obtenida en una ventana emergente
-mostrar_info_secuencias(secuencias_identificadas)
+    # Mostrar la información obtenida en una ventana emergente
+    mostrar_info_secuencias(secuencias_identificadas, cola_secuencias, al_terminar=al_terminar_escaneo)
 
-# Ejecutar la selección del criterio en el hilo principal
-ejecutar_seleccion_criterio()
+    root.mainloop()
@@ -1,42 +1,44 @@
 import os
-import shutil
-import pydicom
 import tkinter as tk
 from tkinter import filedialog
 from tkinter import simpledialog
+from copia_dicom import copiar_archivos
+from escaneo_dicom import escanear_cabeceras
+from indice_dicom import RUTA_INDICE, abrir_indice, actualizar_indice, consultar_archivos
 
 def seleccionar_carpeta(titulo="Seleccionar Carpeta"):
     """Abre un cuadro de diálogo para seleccionar una carpeta."""
     carpeta = filedialog.askdirectory(title=titulo)
     return carpeta
 
-def identificar_secuencias(dicom_folder):
+def identificar_secuencias(dicom_folder, ruta_indice=RUTA_INDICE):
     """
     Identifica las secuencias en la carpeta DICOM.
 
+    Usa el índice persistente de indice_dicom: solo se leen los archivos nuevos o
+    modificados desde la última ejecución y las secuencias salen de una consulta.
+
     Parameters:
         dicom_folder (str): Ruta de la carpeta con archivos DICOM.
+        ruta_indice (str): Ruta de la base de datos del índice.
 
     Returns:
         dict: Diccionario con SeriesNumber como clave y una lista de diccionarios con detalles de archivos como valor.
     """
-    secuencias = {}
-    for root, _, files in os.walk(dicom_folder):
-        for file in files:
-            if file.lower().endswith(".dcm"):
-                file_path = os.path.join(root, file)
-                try:
-                    dicom_data = pydicom.dcmread(file_path)
-                    series_number = dicom_data.get("SeriesNumber", "Desconocido")
-                    series_description = dicom_data.get("SeriesDescription", "Desconocido")
-                    if series_number not in secuencias:
-                        secuencias[series_number] = {
-                            "description": series_description,
-                            "files": []
-                        }
-                    secuencias[series_number]["files"].append(file_path)
-                except Exception as e:
-                    print(f"Error leyendo el archivo {file_path}: {e}")
+    conexion = abrir_indice(ruta_indice)
+    try:
+        actualizar_indice(conexion, dicom_folder)
+        secuencias = {}
+        for fila in consultar_archivos(conexion, dicom_folder):
+            series_number = fila["series_number"] if fila["series_number"] is not None else "Desconocido"
+            if series_number not in secuencias:
+                secuencias[series_number] = {
+                    "description": fila["series_description"] or "Desconocido",
+                    "files": []
+                }
+            secuencias[series_number]["files"].append(fila["ruta"])
+    finally:
+        conexion.close()
     return secuencias
 
 def seleccionar_secuencia(secuencias):
@@ -59,36 +61,33 @@ def seleccionar_secuencia(secuencias):
     print("Selección inválida o cancelada.")
     return None
 
-def agrupar_imagenes_por_posicion(file_paths, output_folder):
+def agrupar_imagenes_por_posicion(file_paths, output_folder, modo="paralelo"):
     """
     Agrupa imágenes DICOM por ImagePositionPatient.
 
+    Solo se leen las cabeceras de los archivos y la copia se hace en un único lote.
+
     Parameters:
         file_paths (list): Lista de rutas de archivos DICOM.
         output_folder (str): Ruta de la carpeta de salida para las imágenes agrupadas.
+        modo (str): "copia", "paralelo", "hardlink", "reflink" o "symlink" (ver copia_dicom).
     """
-    for file_path in file_paths:
-        try:
-            # Leer el archivo DICOM
-            dicom_data = pydicom.dcmread(file_path)
-
-            # Obtener ImagePositionPatient
-            position = dicom_data.get("ImagePositionPatient", "Desconocida")
-
-            # Verificar que position sea válida
-            if position != "Desconocida":
-                position_str = "_".join(map(str, position))
-            else:
-                position_str = "Desconocida"
-
-            # Crear carpetas de salida organizadas
-            position_folder = os.path.join(output_folder, f"Posicion_{position_str}")
-            os.makedirs(position_folder, exist_ok=True)
-
-            # Copiar archivo a la carpeta correspondiente
-            shutil.copy(file_path, position_folder)
-        except Exception as e:
-            print(f"Error procesando {file_path}: {e}")
+    pares = []
+    for file_path, etiquetas, error in escanear_cabeceras(file_paths):
+        if error is not None:
+            print(f"Error procesando {file_path}: {error}")
+            continue
+
+        # Obtener ImagePositionPatient
+        position_str = etiquetas["posicion"] or "Desconocida"
+
+        # Crear carpetas de salida organizadas
+        position_folder = os.path.join(output_folder, f"Posicion_{position_str}")
+        os.makedirs(position_folder, exist_ok=True)
+        pares.append((file_path, os.path.join(position_folder, os.path.basename(file_path))))
+
+    # Copiar (o enlazar) los archivos a la carpeta correspondiente
+    copiar_archivos(pares, modo=modo)
 
 if __name__ == "__main__":
     # Crear una ventana oculta para los cuadros de diálogo
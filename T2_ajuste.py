@@ -0,0 +1,565 @@
+import hashlib
+import os
+
+import numpy as np
+
+# Límites del ajuste (ms) y umbral de señal compartidos por los scripts de mapeo T2
+T2_MIN, T2_MAX = 10, 200
+UMBRAL_SENAL = 10
+T2_INICIAL = 40  # Valor de T2 inicial ajustado para hígado
+
+# Diccionarios de curvas de decaimiento ya generados, por conjunto de TE y rejilla de T2
+_diccionarios = {}
+
+
+def exp_decay(TE, S0, T2):
+    """Modelo de decaimiento exponencial para el ajuste de T2."""
+    return S0 * np.exp(-TE / T2)
+
+
+def _preparar_senales(images_array, TE_values, umbral):
+    """
+    Reordena la pila de ecos como una matriz (n_ecos, n_pixeles) y calcula la máscara de señal.
+
+    Parameters:
+        images_array (np.ndarray): Pila de ecos con forma (n_ecos, ...).
+        TE_values (list): Tiempos de eco en ms, uno por imagen.
+        umbral (float): Los píxeles cuya señal máxima sea menor que este valor no se ajustan.
+
+    Returns:
+        tuple: (señales, TE, máscara, forma espacial del mapa).
+    """
+    images_array = np.asarray(images_array)
+    TE = np.asarray(TE_values, dtype=np.float64)
+    if images_array.shape[0] != TE.size:
+        raise ValueError("El número de imágenes no coincide con el número de tiempos de eco")
+    forma = images_array.shape[1:]
+    senales = images_array.reshape(TE.size, -1).astype(np.float64)
+    mascara = senales.max(axis=0) >= umbral
+    return senales, TE, mascara, forma
+
+
+def _componer_mapas(T2, S0, mascara, forma):
+    """Recorta T2 a los límites del ajuste y devuelve los mapas con NaN fuera de la máscara."""
+    T2 = np.clip(T2, T2_MIN, T2_MAX)
+    validos = mascara & np.isfinite(T2) & np.isfinite(S0)
+    T2_map = np.where(validos, T2, np.nan).astype(np.float32).reshape(forma)
+    S0_map = np.where(validos, S0, np.nan).astype(np.float32).reshape(forma)
+    return T2_map, S0_map
+
+
+def _regresion_loglineal(senales, TE, ponderado=True):
+    """Regresión lineal (ponderada) de log(S) frente a TE para cada columna de senales."""
+    positivas = senales > 0
+    log_senales = np.log(np.where(positivas, senales, 1.0))
+    if ponderado:
+        pesos = np.where(positivas, senales ** 2, 0.0)
+    else:
+        pesos = positivas.astype(np.float64)
+
+    # Sumas de la regresión lineal ponderada log(S) = log(S0) - TE / T2
+    x = TE[:, None]
+    Sw = pesos.sum(axis=0)
+    Sx = (pesos * x).sum(axis=0)
+    Sy = (pesos * log_senales).sum(axis=0)
+    Sxx = (pesos * x * x).sum(axis=0)
+    Sxy = (pesos * x * log_senales).sum(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pendiente = (Sw * Sxy - Sx * Sy) / (Sw * Sxx - Sx ** 2)
+        ordenada = (Sy - pendiente * Sx) / Sw
+        # Una pendiente nula o positiva (sin decaimiento) equivale a T2 en el límite superior
+        T2 = np.where(pendiente < 0, -1.0 / pendiente, T2_MAX)
+        T2 = np.where(np.isfinite(pendiente), T2, np.nan)
+        S0 = np.exp(ordenada)
+    return T2, S0
+
+
+def ajustar_T2_loglineal(images_array, TE_values, umbral=UMBRAL_SENAL, ponderado=True):
+    """
+    Estima T2 y S0 para todos los píxeles a la vez por mínimos cuadrados sobre log(S).
+
+    Con ponderado=True usa pesos S^2 (mínimos cuadrados ponderados), que compensan
+    la amplificación del ruido del logaritmo en los ecos tardíos de señal baja.
+
+    Parameters:
+        images_array (np.ndarray): Pila de ecos con forma (n_ecos, ...).
+        TE_values (list): Tiempos de eco en ms.
+        umbral (float): Umbral de señal máxima por debajo del cual el píxel queda en NaN.
+        ponderado (bool): Si es False se usa mínimos cuadrados ordinarios.
+
+    Returns:
+        tuple: (T2_map, S0_map) con la forma espacial de la pila y dtype float32.
+    """
+    senales, TE, mascara, forma = _preparar_senales(images_array, TE_values, umbral)
+
+    T2, S0 = _regresion_loglineal(senales, TE, ponderado)
+    return _componer_mapas(T2, S0, mascara, forma)
+
+
+def ajustar_T2_arlo(images_array, TE_values, umbral=UMBRAL_SENAL):
+    """
+    Estima T2 con ARLO (auto-regresión sobre operaciones lineales) para todos los píxeles.
+
+    Integra la curva de decaimiento con la regla de Simpson entre ecos alternos y
+    obtiene T2 de forma cerrada. Requiere al menos tres ecos equiespaciados.
+
+    Parameters:
+        images_array (np.ndarray): Pila de ecos con forma (n_ecos, ...).
+        TE_values (list): Tiempos de eco en ms, equiespaciados.
+        umbral (float): Umbral de señal máxima por debajo del cual el píxel queda en NaN.
+
+    Returns:
+        tuple: (T2_map, S0_map) con la forma espacial de la pila y dtype float32.
+    """
+    senales, TE, mascara, forma = _preparar_senales(images_array, TE_values, umbral)
+
+    if TE.size < 3:
+        raise ValueError("ARLO necesita al menos tres ecos")
+    espaciados = np.diff(TE)
+    if not np.allclose(espaciados, espaciados[0], rtol=1e-3):
+        raise ValueError("ARLO requiere tiempos de eco equiespaciados")
+    delta_TE = espaciados[0]
+
+    # Integrales de Simpson (s) y diferencias (d) entre los ecos i-2 e i
+    s = delta_TE / 3 * (senales[:-2] + 4 * senales[1:-1] + senales[2:])
+    d = senales[:-2] - senales[2:]
+
+    suma_ss = (s * s).sum(axis=0)
+    suma_sd = (s * d).sum(axis=0)
+    suma_dd = (d * d).sum(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        T2 = (suma_ss + delta_TE / 3 * suma_sd) / (delta_TE / 3 * suma_dd + suma_sd)
+        T2 = np.where(T2 > 0, T2, T2_MAX)
+
+        # Con T2 fijo, S0 se obtiene por mínimos cuadrados lineales
+        decaimiento = np.exp(-TE[:, None] / T2)
+        S0 = (senales * decaimiento).sum(axis=0) / (decaimiento ** 2).sum(axis=0)
+
+    return _componer_mapas(T2, S0, mascara, forma)
+
+
+def generar_diccionario(TE_values, paso=0.1, carpeta_cache=None):
+    """
+    Genera (o recupera de la caché) el diccionario de curvas de decaimiento normalizadas.
+
+    Parameters:
+        TE_values (list): Tiempos de eco en ms del protocolo.
+        paso (float): Separación en ms de la rejilla de T2 entre T2_MIN y T2_MAX.
+        carpeta_cache (str): Carpeta opcional donde guardar el diccionario en disco.
+
+    Returns:
+        tuple: (rejilla de T2, curvas normalizadas (n_ecos, n_T2), normas de las curvas).
+    """
+    TE = np.asarray(TE_values, dtype=np.float64)
+    clave = (tuple(np.round(TE, 3)), T2_MIN, T2_MAX, paso)
+    if clave in _diccionarios:
+        return _diccionarios[clave]
+
+    ruta_cache = None
+    if carpeta_cache:
+        huella = hashlib.sha1(repr(clave).encode()).hexdigest()[:16]
+        ruta_cache = os.path.join(carpeta_cache, f"diccionario_T2_{huella}.npz")
+        if os.path.exists(ruta_cache):
+            with np.load(ruta_cache) as datos:
+                diccionario = (datos["rejilla"], datos["curvas"], datos["normas"])
+            _diccionarios[clave] = diccionario
+            return diccionario
+
+    rejilla = np.arange(T2_MIN, T2_MAX + paso / 2, paso)
+    curvas = np.exp(-TE[:, None] / rejilla[None, :])
+    normas = np.linalg.norm(curvas, axis=0)
+    diccionario = (rejilla, curvas / normas, normas)
+
+    if ruta_cache:
+        os.makedirs(carpeta_cache, exist_ok=True)
+        np.savez(ruta_cache, rejilla=rejilla, curvas=diccionario[1], normas=normas)
+    _diccionarios[clave] = diccionario
+    return diccionario
+
+
+def ajustar_T2_diccionario(images_array, TE_values, umbral=UMBRAL_SENAL, paso=0.1, tamano_bloque=1024,
+                           submuestreo=1, carpeta_cache=None):
+    """
+    Estima T2 buscando, para cada píxel, la curva del diccionario más parecida.
+
+    La comparación es un producto interno normalizado calculado por bloques de píxeles,
+    así que la memoria está acotada por tamano_bloque y el tiempo no depende de la
+    convergencia de ningún ajuste iterativo. Por defecto cada píxel se compara con todas
+    las curvas del diccionario; con submuestreo > 1 la búsqueda se hace primero sobre una
+    de cada `submuestreo` curvas y después sobre las vecinas a la mejor, que es más rápido
+    pero puede no encontrar la mejor curva.
+
+    Parameters:
+        images_array (np.ndarray): Pila de ecos con forma (n_ecos, ...).
+        TE_values (list): Tiempos de eco en ms.
+        umbral (float): Umbral de señal máxima por debajo del cual el píxel queda en NaN.
+        paso (float): Resolución en ms de la rejilla de T2.
+        tamano_bloque (int): Píxeles comparados con el diccionario en cada bloque (la matriz de
+            productos ocupa n_curvas × tamano_bloque valores).
+        submuestreo (int): Factor de la búsqueda gruesa opcional; 1 (por defecto) compara con todas las curvas.
+        carpeta_cache (str): Carpeta opcional para reutilizar diccionarios entre ejecuciones.
+
+    Returns:
+        tuple: (T2_map, S0_map) con la forma espacial de la pila y dtype float32.
+    """
+    senales, TE, mascara, forma = _preparar_senales(images_array, TE_values, umbral)
+    rejilla, curvas, normas = generar_diccionario(TE, paso, carpeta_cache)
+
+    submuestreo = max(1, int(submuestreo))
+    gruesas = np.arange(0, rejilla.size, submuestreo)
+    vecinas = np.arange(-submuestreo, submuestreo + 1)
+
+    indices = np.flatnonzero(mascara)
+    T2 = np.full(mascara.size, np.nan)
+    S0 = np.full(mascara.size, np.nan)
+    for inicio in range(0, indices.size, tamano_bloque):
+        bloque = indices[inicio:inicio + tamano_bloque]
+        y = senales[:, bloque]
+        columnas = np.arange(bloque.size)
+
+        mejor = gruesas[np.argmax(curvas[:, gruesas].T @ y, axis=0)]
+        if submuestreo > 1:
+            # Refinamiento entre las curvas vecinas de la mejor curva gruesa
+            candidatas = np.clip(mejor[None, :] + vecinas[:, None], 0, rejilla.size - 1)
+            productos = np.einsum("ekb,eb->kb", curvas[:, candidatas], y)
+            mejor = candidatas[np.argmax(productos, axis=0), columnas]
+
+        producto = np.einsum("eb,eb->b", curvas[:, mejor], y)
+        T2[bloque] = rejilla[mejor]
+        # S0 es la proyección de la señal sobre la curva elegida sin normalizar
+        S0[bloque] = producto / normas[mejor]
+
+    return _componer_mapas(T2, S0, mascara, forma)
+
+
+def ajustar_T2_curve_fit(images_array, TE_values, umbral=UMBRAL_SENAL, mostrar_progreso=True, progreso=None):
+    """
+    Ajuste no lineal píxel a píxel con curve_fit (método original de los scripts).
+
+    Parameters:
+        images_array (np.ndarray): Pila de ecos con forma (n_ecos, filas, columnas).
+        TE_values (list): Tiempos de eco en ms.
+        umbral (float): Umbral de señal máxima por debajo del cual el píxel queda en NaN.
+        mostrar_progreso (bool): Imprime el avance cada 10% de los píxeles.
+        progreso (callable): Función opcional progreso(pixeles_hechos, pixeles_totales), llamada
+            por cada fila; sustituye a la impresión del avance.
+
+    Returns:
+        tuple: (T2_map, S0_map) con dtype float32.
+    """
+    # SciPy solo se importa en el motor que lo usa: los vectorizados no lo necesitan
+    from scipy.optimize import curve_fit
+
+    T2_map = np.zeros_like(images_array[0], dtype=np.float32)
+    S0_map = np.zeros_like(images_array[0], dtype=np.float32)
+
+    total_pixels = images_array.shape[1] * images_array.shape[2]
+    decima_impresa = 0
+
+    for i in range(images_array.shape[1]):
+        for j in range(images_array.shape[2]):
+            signal_values = images_array[:, i, j]
+
+            # Filtrar valores de señal muy bajos para evitar ruido
+            if np.max(signal_values) < umbral:
+                T2_map[i, j] = np.nan
+                S0_map[i, j] = np.nan
+                continue
+
+            try:
+                S0_init = np.max(signal_values)
+                popt, _ = curve_fit(
+                    exp_decay,
+                    TE_values,
+                    signal_values,
+                    p0=(S0_init, T2_INICIAL),
+                    bounds=([0, T2_MIN], [np.inf, T2_MAX])
+                )
+                S0_map[i, j], T2_map[i, j] = popt
+            except Exception:
+                T2_map[i, j] = np.nan
+                S0_map[i, j] = np.nan
+
+        # El avance cuenta todos los píxeles de la fila, también los enmascarados
+        processed_pixels = (i + 1) * images_array.shape[2]
+        if progreso is not None:
+            progreso(processed_pixels, total_pixels)
+        elif mostrar_progreso and total_pixels and 10 * processed_pixels // total_pixels > decima_impresa:
+            decima_impresa = 10 * processed_pixels // total_pixels
+            progress = (processed_pixels / total_pixels) * 100
+            print(f"Progreso: {progress:.1f}%")
+
+    return T2_map, S0_map
+
+
+def ajustar_T2_lm(images_array, TE_values, umbral=UMBRAL_SENAL, tol=1e-6, max_iter=100,
+                  lambda_inicial=1e-3):
+    """
+    Ajuste no lineal de exp_decay con Levenberg-Marquardt sobre todos los píxeles a la vez.
+
+    Reproduce el ajuste de curve_fit con bounds=([0, T2_MIN], [inf, T2_MAX]): usa los
+    jacobianos analíticos del modelo, proyecta cada paso sobre los límites y deja de
+    iterar los píxeles que ya convergieron.
+
+    Parameters:
+        images_array (np.ndarray): Pila de ecos con forma (n_ecos, ...).
+        TE_values (list): Tiempos de eco en ms.
+        umbral (float): Umbral de señal máxima por debajo del cual el píxel queda en NaN.
+        tol (float): Tolerancia relativa sobre el paso y sobre la reducción del coste.
+        max_iter (int): Número máximo de iteraciones.
+        lambda_inicial (float): Amortiguamiento inicial de Levenberg-Marquardt.
+
+    Returns:
+        tuple: (T2_map, S0_map) con la forma espacial de la pila y dtype float32.
+    """
+    senales, TE, mascara, forma = _preparar_senales(images_array, TE_values, umbral)
+
+    indices = np.flatnonzero(mascara)
+    y = senales[:, indices]
+    TE_col = TE[:, None]
+
+    # Estimación inicial log-lineal, con el valor inicial de los scripts como respaldo
+    T2, S0 = _regresion_loglineal(y, TE)
+    iniciales_validos = np.isfinite(T2) & np.isfinite(S0)
+    T2 = np.clip(np.where(iniciales_validos, T2, T2_INICIAL), T2_MIN, T2_MAX)
+    S0 = np.where(iniciales_validos, S0, y.max(axis=0) if y.size else S0)
+
+    coste = ((S0 * np.exp(-TE_col / T2) - y) ** 2).sum(axis=0)
+    amortiguamiento = np.full(indices.size, lambda_inicial)
+    activos = np.arange(indices.size)
+
+    for _ in range(max_iter):
+        if activos.size == 0:
+            break
+        S0_a, T2_a, y_a = S0[activos], T2[activos], y[:, activos]
+        lam = amortiguamiento[activos]
+
+        # Jacobianos analíticos de exp_decay respecto de S0 y T2
+        decaimiento = np.exp(-TE_col / T2_a)
+        residuo = S0_a * decaimiento - y_a
+        J_S0 = decaimiento
+        J_T2 = S0_a * decaimiento * TE_col / T2_a ** 2
+
+        A00 = (J_S0 * J_S0).sum(axis=0)
+        A01 = (J_S0 * J_T2).sum(axis=0)
+        A11 = (J_T2 * J_T2).sum(axis=0)
+        g0 = (J_S0 * residuo).sum(axis=0)
+        g1 = (J_T2 * residuo).sum(axis=0)
+
+        # Sistema 2x2 amortiguado resuelto de forma cerrada para cada píxel
+        B00 = A00 * (1 + lam)
+        B11 = A11 * (1 + lam)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            det = B00 * B11 - A01 ** 2
+            paso_S0 = -(B11 * g0 - A01 * g1) / det
+            paso_T2 = -(B00 * g1 - A01 * g0) / det
+
+        # Proyección del paso sobre los límites del ajuste
+        S0_nuevo = np.clip(S0_a + paso_S0, 0, np.inf)
+        T2_nuevo = np.clip(T2_a + paso_T2, T2_MIN, T2_MAX)
+        coste_nuevo = ((S0_nuevo * np.exp(-TE_col / T2_nuevo) - y_a) ** 2).sum(axis=0)
+
+        mejora = coste_nuevo < coste[activos]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cambio = np.maximum(np.abs(S0_nuevo - S0_a) / np.maximum(S0_a, 1e-12),
+                                np.abs(T2_nuevo - T2_a) / T2_a)
+            reduccion = (coste[activos] - coste_nuevo) / np.maximum(coste[activos], 1e-12)
+
+        S0[activos] = np.where(mejora, S0_nuevo, S0_a)
+        T2[activos] = np.where(mejora, T2_nuevo, T2_a)
+        coste[activos] = np.where(mejora, coste_nuevo, coste[activos])
+        amortiguamiento[activos] = np.where(mejora, lam / 10, lam * 10)
+
+        convergidos = (
+            (mejora & ((reduccion <= tol) | (cambio <= tol)))
+            | (~mejora & (amortiguamiento[activos] > 1e10))
+            | ~np.isfinite(det)
+        )
+        activos = activos[~convergidos]
+
+    T2_completo = np.full(mascara.size, np.nan)
+    S0_completo = np.full(mascara.size, np.nan)
+    T2_completo[indices] = T2
+    S0_completo[indices] = S0
+    return _componer_mapas(T2_completo, S0_completo, mascara, forma)
+
+
+def calidad_ajuste(images_array, TE_values, T2_map, S0_map, pixeles_por_bloque=65536):
+    """
+    R² y residuo RMS del modelo exp_decay ajustado en cada píxel.
+
+    Se calculan a partir de los mapas ya ajustados, sin repetir el ajuste, recorriendo
+    los píxeles por bloques para no crear la curva modelo de todo el volumen a la vez.
+
+    Parameters:
+        images_array (np.ndarray): Pila de ecos con forma (n_ecos, ...).
+        TE_values (list): Tiempos de eco en ms.
+        T2_map, S0_map (np.ndarray): Mapas ajustados con la forma espacial de la pila.
+        pixeles_por_bloque (int): Píxeles evaluados a la vez.
+
+    Returns:
+        tuple: (R2_map, residuo_map) en float32; NaN donde no hay ajuste.
+    """
+    TE = np.asarray(TE_values, dtype=np.float64)
+    senales = np.asarray(images_array).reshape(TE.size, -1)
+    T2 = np.asarray(T2_map).reshape(-1)
+    S0 = np.asarray(S0_map).reshape(-1)
+    R2 = np.full(T2.size, np.nan, dtype=np.float32)
+    residuo = np.full(T2.size, np.nan, dtype=np.float32)
+
+    for inicio in range(0, T2.size, pixeles_por_bloque):
+        bloque = slice(inicio, min(inicio + pixeles_por_bloque, T2.size))
+        y = senales[:, bloque].astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            modelo = S0[bloque] * np.exp(-TE[:, None] / T2[bloque])
+            ss_res = np.sum((y - modelo) ** 2, axis=0)
+            ss_tot = np.sum((y - y.mean(axis=0)) ** 2, axis=0)
+            R2[bloque] = np.where(ss_tot > 0, 1 - ss_res / ss_tot, np.nan)
+        residuo[bloque] = np.sqrt(ss_res / TE.size)
+
+    forma = np.shape(T2_map)
+    return R2.reshape(forma), residuo.reshape(forma)
+
+
+def mascara_validez(T2_map, S0_map):
+    """
+    Píxeles con un ajuste utilizable: T2 y S0 finitos, S0 positivo y T2 estrictamente
+    dentro de los límites del ajuste (un T2 en el límite indica que el ajuste se saturó).
+    """
+    with np.errstate(invalid="ignore"):
+        return np.isfinite(T2_map) & np.isfinite(S0_map) & (S0_map > 0) & (T2_map > T2_MIN) & (T2_map < T2_MAX)
+
+
+def verificar_contra_curve_fit(images_array, TE_values, metodo="lm", tolerancia=1e-3,
+                               n_muestras=200, semilla=0, **opciones):
+    """
+    Compara un motor de ajuste con curve_fit en una muestra aleatoria de píxeles.
+
+    Parameters:
+        images_array (np.ndarray): Pila de ecos con forma (n_ecos, filas, columnas).
+        TE_values (list): Tiempos de eco en ms.
+        metodo (str): Motor a verificar.
+        tolerancia (float): Diferencia relativa máxima de T2 admitida.
+        n_muestras (int): Número de píxeles comparados.
+        semilla (int): Semilla del muestreo.
+        **opciones: Argumentos adicionales para el motor.
+
+    Returns:
+        tuple: (diferencia relativa máxima, True si no supera la tolerancia).
+    """
+    images_array = np.asarray(images_array)
+    n_ecos = images_array.shape[0]
+    senales = images_array.reshape(n_ecos, -1)
+    candidatos = np.flatnonzero(senales.max(axis=0) >= opciones.get("umbral", UMBRAL_SENAL))
+    if candidatos.size == 0:
+        return 0.0, True
+    rng = np.random.default_rng(semilla)
+    muestra = rng.choice(candidatos, size=min(n_muestras, candidatos.size), replace=False)
+
+    # Las dos ejecuciones ven la misma muestra como una imagen de una fila
+    pila = senales[:, muestra][:, None, :]
+    T2_motor, _ = ajustar_mapa_T2(pila, TE_values, metodo=metodo, **opciones)
+    T2_ref, _ = ajustar_T2_curve_fit(pila, TE_values, umbral=opciones.get("umbral", UMBRAL_SENAL),
+                                     mostrar_progreso=False)
+
+    comparables = np.isfinite(T2_motor) & np.isfinite(T2_ref)
+    if not comparables.any():
+        return 0.0, True
+    diferencia = float(np.max(np.abs(T2_motor[comparables] - T2_ref[comparables]) / T2_ref[comparables]))
+    return diferencia, diferencia <= tolerancia
+
+
+def _ajustar_T2_paralelo(images_array, TE_values, **opciones):
+    """Ajuste píxel a píxel repartido entre procesos (ver T2_paralelo)."""
+    # Importación diferida: T2_paralelo depende de este módulo
+    from T2_paralelo import ajustar_T2_paralelo
+    return ajustar_T2_paralelo(images_array, TE_values, **opciones)
+
+
+def _ajustar_T2_numba(images_array, TE_values, **opciones):
+    """Ajuste exacto píxel a píxel compilado con Numba, si está instalado (ver T2_numba)."""
+    from T2_numba import ajustar_T2_numba
+    return ajustar_T2_numba(images_array, TE_values, **opciones)
+
+
+# Motores de ajuste disponibles, seleccionables por nombre desde los scripts
+METODOS_AJUSTE = {
+    "loglineal": ajustar_T2_loglineal,
+    "arlo": ajustar_T2_arlo,
+    "lm": ajustar_T2_lm,
+    "diccionario": ajustar_T2_diccionario,
+    "curve_fit": ajustar_T2_curve_fit,
+    "paralelo": _ajustar_T2_paralelo,
+    "numba": _ajustar_T2_numba,
+}
+
+
+def _ajustar_compactado(images_array, TE_values, mascara, metodo, progreso, **opciones):
+    """
+    Ajusta solo los píxeles de la máscara, compactados en una pila densa, y los devuelve a su sitio.
+
+    Los píxeles seleccionados se colocan en filas del mismo ancho que la imagen, así que los
+    motores que reparten o informan por filas (curve_fit, paralelo) siguen funcionando igual.
+    Los huecos de la última fila quedan a cero, por debajo del umbral de señal.
+    """
+    images_array = np.asarray(images_array)
+    mascara = np.asarray(mascara, dtype=bool)
+    if mascara.shape != images_array.shape[1:]:
+        raise ValueError("La máscara debe tener la forma espacial de la pila de ecos")
+    T2_map = np.full(mascara.shape, np.nan, dtype=np.float32)
+    S0_map = np.full(mascara.shape, np.nan, dtype=np.float32)
+    n_seleccionados = int(np.count_nonzero(mascara))
+    if n_seleccionados == 0:
+        return T2_map, S0_map
+
+    columnas = mascara.shape[-1]
+    filas = -(-n_seleccionados // columnas)
+    compactas = np.zeros((images_array.shape[0], filas * columnas), dtype=images_array.dtype)
+    compactas[:, :n_seleccionados] = images_array[:, mascara]
+    T2_compacto, S0_compacto = ajustar_mapa_T2(compactas.reshape(-1, filas, columnas), TE_values, metodo,
+                                               progreso, **opciones)
+    T2_map[mascara] = T2_compacto.reshape(-1)[:n_seleccionados]
+    S0_map[mascara] = S0_compacto.reshape(-1)[:n_seleccionados]
+    return T2_map, S0_map
+
+
+def ajustar_mapa_T2(images_array, TE_values, metodo="lm", progreso=None, mascara=None, **opciones):
+    """
+    Calcula los mapas T2 y S0 con el motor de ajuste indicado.
+
+    Parameters:
+        images_array (np.ndarray): Pila de ecos con forma (n_ecos, filas, columnas).
+        TE_values (list): Tiempos de eco en ms.
+        metodo (str): Nombre del motor en METODOS_AJUSTE.
+        progreso (callable): Función opcional progreso(pixeles_hechos, pixeles_totales). Los motores
+            píxel a píxel informan durante el ajuste; los vectorizados, al terminar.
+        mascara (np.ndarray): Máscara booleana (filas, columnas) de los píxeles que se ajustan
+            (p. ej. de T2_mascara.mascara_tejido); el resto queda en NaN sin llegar al motor, y
+            el progreso cuenta solo los píxeles de la máscara.
+        **opciones: Argumentos adicionales para el motor elegido.
+
+    Returns:
+        tuple: (T2_map, S0_map).
+    """
+    if metodo not in METODOS_AJUSTE:
+        raise ValueError(f"Método de ajuste desconocido: {metodo}. Opciones: {', '.join(METODOS_AJUSTE)}")
+    if mascara is not None:
+        return _ajustar_compactado(images_array, TE_values, mascara, metodo, progreso, **opciones)
+    if progreso is None:
+        return METODOS_AJUSTE[metodo](images_array, TE_values, **opciones)
+
+    total = int(np.prod(np.shape(images_array)[1:]))
+    if metodo == "curve_fit":
+        return ajustar_T2_curve_fit(images_array, TE_values, progreso=progreso, **opciones)
+    if metodo == "paralelo":
+        # T2_paralelo informa en filas; se traduce a píxeles
+        columnas = np.shape(images_array)[2]
+        return _ajustar_T2_paralelo(images_array, TE_values,
+                                    progreso=lambda hechas, filas: progreso(hechas * columnas, filas * columnas),
+                                    **opciones)
+    progreso(0, total)
+    mapas = METODOS_AJUSTE[metodo](images_array, TE_values, **opciones)
+    progreso(total, total)
+    return mapas
@@ -1,47 +1,479 @@
+import argparse
+import csv
 import pydicom
 import numpy as np
 import os
+from collections import OrderedDict
 import matplotlib.pyplot as plt
 from tkinter import Tk
-from tkinter.filedialog import askopenfilename
+from tkinter.filedialog import askopenfilenames
 
-# Función para mostrar coordenadas al mover el mouse
-def on_hover(event):
-    if event.xdata is not None and event.ydata is not None:
-        plt.gca().set_title(f'Histograma de valores T2\nTiempo T2: {event.xdata:.2f} ms, Frecuencia: {event.ydata:.0f}')
-        plt.draw()
+from T2_ajuste import T2_MAX, T2_MIN
+from T2_mascara import METODOS_MASCARA, mascara_serie
+from T2_volumen import mapas_multiparametricos
 
-root = Tk()
-root.withdraw()
-dicom_path = askopenfilename(title="Seleccionar archivo DICOM de mapa T2", filetypes=[("DICOM files", "*.dcm")])
+N_BINS = 200  # Número de intervalos del histograma
+PERCENTILES = (5, 25, 50, 75, 95)
+CORTES_EN_CACHE = 8  # Cortes que el explorador conserva decodificados (los más recientes)
 
-if not dicom_path:
-    print("No se seleccionó ningún archivo.")
-else:
-    ds = pydicom.dcmread(dicom_path)
-    T2_map = ds.pixel_array.astype(np.float32)
 
-    min_T2, max_T2 = np.min(T2_map), np.max(T2_map)
-    print(f"Dimensiones del mapa T2: {T2_map.shape}")
-    print(f"Rango de valores T2: {min_T2:.2f} - {max_T2:.2f} ms")
+class HistogramaT2:
+    """
+    Histograma acumulativo con bordes fijos para mapas T2 completos.
 
+    Los cortes (o los mapas de varios sujetos) se añaden uno a uno y solo se guardan
+    las cuentas por intervalo y unos momentos exactos (n, media, suma de cuadrados
+    centrados, mínimo y máximo), así que la memoria no depende del número de vóxeles.
+    Los NaN, el fondo y los vóxeles fuera de la ROI no se cuentan; los que caen fuera
+    del rango se cuentan aparte para que los percentiles sigan siendo correctos.
+
+    Parameters:
+        limites (tuple): (mínimo, máximo) compartido por todos los cortes.
+        n_bins (int): Número de intervalos.
+    """
+
+    def __init__(self, limites, n_bins=N_BINS):
+        self.edges = np.linspace(float(limites[0]), float(limites[1]), n_bins + 1)
+        self.counts = np.zeros(n_bins, dtype=np.int64)
+        self.por_debajo = 0
+        self.por_encima = 0
+        self.n = 0
+        self.media = 0.0
+        self.m2 = 0.0
+        self.minimo = np.inf
+        self.maximo = -np.inf
+
+    def agregar(self, valores, mascara=None, fondo=None):
+        """
+        Añade los vóxeles válidos de un corte o mapa.
+
+        Parameters:
+            valores (np.ndarray): Valores T2 del corte.
+            mascara (np.ndarray): ROI booleana (opcional).
+            fondo (np.ndarray): Máscara booleana del fondo que se descarta (opcional).
+        """
+        valores = np.asarray(valores)
+        validos = np.isfinite(valores)
+        if mascara is not None:
+            validos &= np.broadcast_to(mascara, valores.shape)
+        if fondo is not None:
+            validos &= ~fondo
+        datos = valores[validos].astype(np.float64)
+        if datos.size == 0:
+            return self
+
+        indices = np.searchsorted(self.edges, datos, side="right") - 1
+        indices[datos == self.edges[-1]] = len(self.counts) - 1  # El último intervalo es cerrado
+        dentro = (indices >= 0) & (indices < len(self.counts))
+        self.counts += np.bincount(indices[dentro], minlength=len(self.counts))
+        self.por_debajo += int(np.count_nonzero(datos < self.edges[0]))
+        self.por_encima += int(np.count_nonzero(datos > self.edges[-1]))
+
+        # Combinación de momentos del bloque con los acumulados (Chan et al.)
+        n_bloque = datos.size
+        media_bloque = float(datos.mean())
+        m2_bloque = float(np.square(datos - media_bloque).sum())
+        total = self.n + n_bloque
+        delta = media_bloque - self.media
+        self.media += delta * n_bloque / total
+        self.m2 += m2_bloque + delta * delta * self.n * n_bloque / total
+        self.n = total
+        self.minimo = min(self.minimo, float(datos.min()))
+        self.maximo = max(self.maximo, float(datos.max()))
+        return self
+
+    @property
+    def centros(self):
+        return (self.edges[:-1] + self.edges[1:]) / 2
+
+    def moda(self):
+        """Centro del intervalo con más vóxeles y su frecuencia."""
+        indice = int(np.argmax(self.counts))
+        return float(self.centros[indice]), int(self.counts[indice])
+
+    def percentil(self, q):
+        """
+        Percentil q (0-100) interpolado linealmente dentro del intervalo que lo contiene.
+        Si cae en los vóxeles fuera de rango se devuelve el borde correspondiente.
+        """
+        if self.n == 0:
+            return np.nan
+        objetivo = q / 100 * self.n
+        if objetivo <= self.por_debajo:
+            return float(self.edges[0])
+        acumulado = self.por_debajo + np.cumsum(self.counts)
+        indice = int(np.searchsorted(acumulado, objetivo))
+        if indice >= len(self.counts):
+            return float(self.edges[-1])
+        anterior = acumulado[indice - 1] if indice > 0 else self.por_debajo
+        fraccion = (objetivo - anterior) / max(self.counts[indice], 1)
+        return float(self.edges[indice] + fraccion * (self.edges[indice + 1] - self.edges[indice]))
+
+    def estadisticas(self, percentiles=PERCENTILES):
+        """Estadísticas de la ROI: exactas (n, media, desviación, extremos) y del histograma (moda, percentiles)."""
+        moda, frecuencia_moda = self.moda() if self.n else (np.nan, 0)
+        resultado = {
+            "n": self.n,
+            "media": self.media if self.n else np.nan,
+            "desviacion": float(np.sqrt(self.m2 / (self.n - 1))) if self.n > 1 else np.nan,
+            "minimo": self.minimo if self.n else np.nan,
+            "maximo": self.maximo if self.n else np.nan,
+            "moda": moda,
+            "frecuencia_moda": frecuencia_moda,
+            "fuera_de_rango": self.por_debajo + self.por_encima,
+        }
+        for q in percentiles:
+            resultado[f"p{q}"] = self.percentil(q)
+        return resultado
+
+    def guardar_csv(self, ruta):
+        """Exporta las cuentas por intervalo a CSV."""
+        with open(ruta, "w", newline="", encoding="utf-8") as f:
+            escritor = csv.writer(f)
+            escritor.writerow(["limite_inferior", "limite_superior", "centro", "frecuencia"])
+            for inferior, superior, centro, cuenta in zip(self.edges[:-1], self.edges[1:], self.centros, self.counts):
+                escritor.writerow([f"{inferior:.6g}", f"{superior:.6g}", f"{centro:.6g}", int(cuenta)])
+
+
+def es_multiparametrico(ds):
+    """True si ds es un DICOM multiparamétrico (frames etiquetados T2, S0, R2...) de T2_volumen."""
+    if "PerFrameFunctionalGroupsSequence" not in ds or not ds.PerFrameFunctionalGroupsSequence:
+        return False
+    contenido = ds.PerFrameFunctionalGroupsSequence[0].get("FrameContentSequence")
+    return bool(contenido) and "FrameLabel" in contenido[0]
+
+
+def n_cortes_mapa(ds):
+    """Número de cortes T2 de un archivo de mapa (en uno multiparamétrico, solo los frames de T2)."""
+    if es_multiparametrico(ds):
+        return sum(frame.FrameContentSequence[0].FrameLabel == "T2" for frame in ds.PerFrameFunctionalGroupsSequence)
+    return int(ds.get("NumberOfFrames", 1) or 1)
+
+
+def leer_mapa(ds):
+    """
+    Valores T2 de un archivo de mapa y su fondo.
+
+    Los scripts de mapeo guardan los vóxeles sin ajuste (NaN) como 0; ese valor
+    almacenado se trata como fondo antes de aplicar RescaleSlope/RescaleIntercept.
+    De un archivo multiparamétrico se leen solo los frames de T2, cada uno con su
+    propio reescalado por frame.
+    """
+    if es_multiparametrico(ds):
+        T2 = mapas_multiparametricos(ds)["T2"]
+        return T2, np.isnan(T2)
+    almacenados = ds.pixel_array
+    if almacenados.ndim == 2:
+        almacenados = almacenados[np.newaxis]  # Un archivo multiframe aporta varios cortes
+    pendiente = float(ds.get("RescaleSlope", 1) or 1)
+    ordenada = float(ds.get("RescaleIntercept", 0) or 0)
+    return almacenados.astype(np.float32) * pendiente + ordenada, almacenados == 0
+
+
+def limites_por_defecto(rutas):
+    """
+    Rango del histograma deducido de las cabeceras, sin decodificar ningún píxel.
+
+    Los mapas en ms (con RescaleSlope/RescaleIntercept o multiparamétricos) están
+    recortados al rango del ajuste, así que se usa (T2_MIN, T2_MAX). Los guardados sin
+    reescalado están en valores almacenados con una escala que la cabecera no indica
+    (4096, 65535...): se usa el rango representable, de 1 a LargestImagePixelValue o
+    2**BitsStored - 1, y conviene indicar los límites reales.
+    """
+    maximo_almacenado = 0
+    for ruta in rutas:
+        ds = pydicom.dcmread(ruta, stop_before_pixels=True)
+        if es_multiparametrico(ds) or "RescaleSlope" in ds:
+            continue
+        maximo = ds.get("LargestImagePixelValue")
+        if maximo is None:
+            maximo = 2 ** int(ds.get("BitsStored", 16)) - 1
+        maximo_almacenado = max(maximo_almacenado, int(maximo))
+    if maximo_almacenado:
+        return 1.0, float(maximo_almacenado)
+    return float(T2_MIN), float(T2_MAX)
+
+
+def histograma_archivos(rutas, limites=None, n_bins=N_BINS, roi=None):
+    """
+    Histograma y estadísticas de uno o varios mapas T2 en una sola pasada.
+
+    Parameters:
+        rutas (list): Archivos DICOM de mapas T2 (cortes de un volumen o mapas de una cohorte).
+        limites (tuple): Rango del histograma; por defecto, el de las cabeceras (ver limites_por_defecto).
+        n_bins (int): Número de intervalos.
+        roi (np.ndarray): Máscara 2D común a todos los cortes o 3D con una por corte.
+
+    Returns:
+        HistogramaT2: Acumulador con las cuentas y los momentos.
+    """
+    histograma = HistogramaT2(limites or limites_por_defecto(rutas), n_bins)
+    corte = 0
+    for ruta in rutas:
+        valores, fondo = leer_mapa(pydicom.dcmread(ruta))
+        for k in range(valores.shape[0]):
+            mascara = None if roi is None else (roi[corte] if roi.ndim == 3 else roi)
+            histograma.agregar(valores[k], mascara, fondo[k])
+            corte += 1
+    return histograma
+
+
+class ExploradorT2:
+    """
+    Ventana que enlaza un mapa T2 con su histograma.
+
+    - Al pasar el ratón por el histograma o por el mapa se muestra el valor bajo el
+      cursor; los textos y marcas son artistas animados que se redibujan por blitting
+      sobre el fondo guardado, sin redibujar la figura completa.
+    - Al arrastrar sobre el histograma se resaltan en el mapa los píxeles de ese rango.
+      Cada corte tiene precalculada una imagen con el intervalo de cada píxel, así que
+      el resaltado es una consulta en una tabla de colores por intervalo
+      (tabla[indices]) y no una umbralización del mapa en cada evento.
+    - Un clic en el mapa fija la lectura del T2 de ese píxel; la rueda cambia de corte.
+
+    Parameters:
+        leer_corte (callable): Devuelve (valores T2, fondo) del corte k.
+        n_cortes (int): Número de cortes.
+        histograma (HistogramaT2): Histograma acumulado del volumen.
+    """
+
+    COLOR_RESALTADO = (1.0, 0.0, 1.0, 0.6)
+
+    def __init__(self, leer_corte, n_cortes, histograma):
+        self.leer_corte = leer_corte
+        self.n_cortes = n_cortes
+        self.histograma = histograma
+        self.n_bins = len(histograma.counts)
+        self.corte = 0
+        self._cortes = OrderedDict()
+        self._fondo_figura = None
+        self._inicio_rango = None
+        self.lectura_fija = ""
+        # Tabla de colores por intervalo; la última entrada corresponde a los píxeles sin valor
+        self.tabla = np.zeros((self.n_bins + 1, 4), dtype=np.float32)
+
+        self.fig, (self.ax_mapa, self.ax_hist) = plt.subplots(1, 2, figsize=(14, 6))
+        indices, valores = self._corte(0)
+        self.imagen = self.ax_mapa.imshow(valores, cmap="jet", vmin=histograma.edges[0], vmax=histograma.edges[-1])
+        self.fig.colorbar(self.imagen, ax=self.ax_mapa, label="Tiempo T2 (ms)")
+        self.resaltado = self.ax_mapa.imshow(self.tabla[indices], interpolation="nearest", animated=True)
+        self.ax_mapa.set_axis_off()
+        self.ax_mapa.set_title(f"Mapa T2 - corte 1/{n_cortes}")
+        self.marca = self.ax_mapa.plot([], [], "w+", markersize=12, animated=True)[0]
+        self.texto_mapa = self.ax_mapa.text(0.02, 0.02, "", transform=self.ax_mapa.transAxes, color="white",
+                                            va="bottom", animated=True,
+                                            bbox=dict(facecolor="black", alpha=0.5, edgecolor="none"))
+
+        self.ax_hist.stairs(histograma.counts, histograma.edges, fill=True, color='blue', alpha=0.7)
+        self.ax_hist.set_title('Histograma de valores T2')
+        self.ax_hist.set_xlabel('Tiempo T2 (ms)')
+        self.ax_hist.set_ylabel('Frecuencia')
+        self.linea = self.ax_hist.axvline(histograma.edges[0], color="red", lw=1, animated=True)
+        self.texto_hist = self.ax_hist.text(0.98, 0.98, "", transform=self.ax_hist.transAxes, ha="right",
+                                            va="top", animated=True)
+        self.rango = self.ax_hist.axvspan(histograma.edges[0], histograma.edges[0], color="magenta", alpha=0.3,
+                                          animated=True, visible=False)
+
+        self.fig.canvas.mpl_connect("draw_event", self._guardar_fondo)
+        self.fig.canvas.mpl_connect("motion_notify_event", self._al_mover)
+        self.fig.canvas.mpl_connect("button_press_event", self._al_pulsar)
+        self.fig.canvas.mpl_connect("button_release_event", self._al_soltar)
+        self.fig.canvas.mpl_connect("scroll_event", self._al_girar_rueda)
+
+    # --- Datos por corte ---
+    def _corte(self, k):
+        """
+        Devuelve (índices, valores) del corte k. Los índices son el intervalo del
+        histograma de cada píxel, con n_bins para el fondo, los NaN y los fuera de rango.
+        Solo se conservan los CORTES_EN_CACHE cortes usados más recientemente.
+        """
+        if k in self._cortes:
+            self._cortes.move_to_end(k)
+        else:
+            valores, fondo = self.leer_corte(k)
+            valores = np.where(fondo, np.nan, valores)
+            edges = self.histograma.edges
+            indices = np.searchsorted(edges, valores, side="right") - 1
+            indices[valores == edges[-1]] = self.n_bins - 1
+            indices[~np.isfinite(valores) | (indices < 0) | (indices >= self.n_bins)] = self.n_bins
+            self._cortes[k] = (indices.astype(np.int32), valores)
+            if len(self._cortes) > CORTES_EN_CACHE:
+                self._cortes.popitem(last=False)
+        return self._cortes[k]
+
+    def _pixel(self, evento):
+        """(fila, columna, T2) bajo el cursor en el mapa, o None fuera de la imagen."""
+        valores = self._corte(self.corte)[1]
+        fila, columna = int(round(evento.ydata)), int(round(evento.xdata))
+        if 0 <= fila < valores.shape[0] and 0 <= columna < valores.shape[1]:
+            return fila, columna, valores[fila, columna]
+        return None
+
+    # --- Dibujo por blitting ---
+    def _guardar_fondo(self, _evento=None):
+        self._fondo_figura = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._dibujar_animados()
+
+    def _dibujar_animados(self):
+        for artista in (self.resaltado, self.marca, self.texto_mapa):
+            self.ax_mapa.draw_artist(artista)
+        for artista in (self.rango, self.linea, self.texto_hist):
+            self.ax_hist.draw_artist(artista)
+
+    def _refrescar(self):
+        if self._fondo_figura is None:
+            return
+        self.fig.canvas.restore_region(self._fondo_figura)
+        self._dibujar_animados()
+        self.fig.canvas.blit(self.fig.bbox)
+
+    def seleccionar_rango(self, t2_inicio, t2_fin):
+        """Resalta en el mapa los píxeles de los intervalos que cubren [t2_inicio, t2_fin]."""
+        edges = self.histograma.edges
+        inicio, fin = sorted((t2_inicio, t2_fin))
+        primero = int(np.clip(np.searchsorted(edges, inicio, side="right") - 1, 0, self.n_bins - 1))
+        ultimo = int(np.clip(np.searchsorted(edges, fin, side="right") - 1, 0, self.n_bins - 1))
+        self.tabla[:] = 0
+        self.tabla[primero:ultimo + 1] = self.COLOR_RESALTADO
+        self.resaltado.set_data(self.tabla[self._corte(self.corte)[0]])
+        self.rango.set_x(edges[primero])
+        self.rango.set_width(edges[ultimo + 1] - edges[primero])
+        self.rango.set_visible(True)
+        n_voxeles = int(self.histograma.counts[primero:ultimo + 1].sum())
+        self.texto_hist.set_text(f"Rango {edges[primero]:.1f} - {edges[ultimo + 1]:.1f} ms: {n_voxeles} vóxeles")
+        self._refrescar()
+
+    def mostrar_corte(self, k):
+        self.corte = int(np.clip(k, 0, self.n_cortes - 1))
+        indices, valores = self._corte(self.corte)
+        self.imagen.set_data(valores)
+        self.resaltado.set_data(self.tabla[indices])
+        self.marca.set_data([], [])
+        self.ax_mapa.set_title(f"Mapa T2 - corte {self.corte + 1}/{self.n_cortes}")
+        self.fig.canvas.draw_idle()  # Cambia la imagen de fondo: hace falta un dibujado completo
+
+    # --- Eventos ---
+    def _al_mover(self, evento):
+        if evento.xdata is None or evento.ydata is None:
+            return
+        if evento.inaxes is self.ax_hist:
+            if self._inicio_rango is not None:
+                self.seleccionar_rango(self._inicio_rango, evento.xdata)
+                return
+            indice = np.searchsorted(self.histograma.edges, evento.xdata, side="right") - 1
+            frecuencia = self.histograma.counts[indice] if 0 <= indice < self.n_bins else 0
+            self.linea.set_xdata([evento.xdata, evento.xdata])
+            self.texto_hist.set_text(f"Tiempo T2: {evento.xdata:.2f} ms, Frecuencia: {frecuencia}")
+            self._refrescar()
+        elif evento.inaxes is self.ax_mapa:
+            pixel = self._pixel(evento)
+            if pixel is not None:
+                lectura = f"({pixel[0]}, {pixel[1]}): T2 = {pixel[2]:.2f} ms"
+                self.texto_mapa.set_text("\n".join(filter(None, [self.lectura_fija, lectura])))
+                self._refrescar()
+
+    def _al_pulsar(self, evento):
+        if evento.button != 1 or evento.xdata is None:
+            return
+        if evento.inaxes is self.ax_hist:
+            self._inicio_rango = evento.xdata
+        elif evento.inaxes is self.ax_mapa:
+            pixel = self._pixel(evento)
+            if pixel is not None:
+                fila, columna, valor = pixel
+                self.lectura_fija = f"Clic ({fila}, {columna}): T2 = {valor:.2f} ms"
+                print(f"Corte {self.corte + 1}, píxel ({fila}, {columna}): T2 = {valor:.2f} ms")
+                self.marca.set_data([columna], [fila])
+                self.texto_mapa.set_text(self.lectura_fija)
+                self._refrescar()
+
+    def _al_soltar(self, evento):
+        if self._inicio_rango is not None and evento.inaxes is self.ax_hist and evento.xdata is not None:
+            self.seleccionar_rango(self._inicio_rango, evento.xdata)
+        self._inicio_rango = None
+
+    def _al_girar_rueda(self, evento):
+        if evento.inaxes is self.ax_mapa:
+            self.mostrar_corte(self.corte + (1 if evento.button == "up" else -1))
+
+
+def guardar_grafico_histograma(histograma, hist_path):
     fig, ax = plt.subplots(figsize=(10, 6))
-    bins = np.linspace(min_T2, max_T2, 200)
-    counts, _, _ = ax.hist(T2_map.flatten(), bins=bins, color='blue', alpha=0.7)
+    ax.stairs(histograma.counts, histograma.edges, fill=True, color='blue', alpha=0.7)
     ax.set_title('Histograma de valores T2')
     ax.set_xlabel('Tiempo T2 (ms)')
     ax.set_ylabel('Frecuencia')
+    fig.savefig(hist_path, dpi=300)
+    plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Histograma y estadísticas de mapas T2 (uno o varios archivos).")
+    parser.add_argument("archivos", nargs="*", help="Archivos DICOM de mapas T2; sin argumentos se abre un diálogo")
+    parser.add_argument("--rango", nargs=2, type=float, metavar=("MIN", "MAX"), default=None,
+                        help="Rango del histograma; por defecto, T2_MIN-T2_MAX para mapas en ms")
+    parser.add_argument("--bins", type=int, default=N_BINS)
+    parser.add_argument("--roi", default=None, help="Máscara de ROI en formato .npy (2D o 3D)")
+    parser.add_argument("--tejido", default=None, metavar="CARPETA_ECOS",
+                        help="Cuenta solo el tejido segmentado en el primer eco de la adquisición de origen")
+    parser.add_argument("--metodo-tejido", default="otsu", choices=METODOS_MASCARA)
+    parser.add_argument("--csv", default=None, help="Ruta del CSV con las cuentas (por defecto, junto al primer archivo)")
+    parser.add_argument("--sin-grafico", action="store_true")
+    args = parser.parse_args()
+
+    rutas = args.archivos
+    if not rutas:
+        root = Tk()
+        root.withdraw()
+        rutas = list(askopenfilenames(title="Seleccionar archivos DICOM de mapa T2", filetypes=[("DICOM files", "*.dcm")]))
+
+    if not rutas:
+        print("No se seleccionó ningún archivo.")
+        return
 
-    max_freq_index = np.argmax(counts)
-    T2_max_freq = bins[max_freq_index]
-    max_freq_value = counts[max_freq_index]
-    print(f"El valor de T2 con máxima frecuencia es aproximadamente: {T2_max_freq:.2f} ms con una frecuencia de {max_freq_value}")
+    roi = np.load(args.roi) != 0 if args.roi else None
+    if args.tejido:
+        # Sin el fondo ajustado como ruido, el histograma no tiene picos en los límites del ajuste
+        tejido = mascara_serie(args.tejido, args.metodo_tejido)
+        roi = tejido if roi is None else roi & tejido
+    histograma = histograma_archivos(sorted(rutas), args.rango, args.bins, roi)
+    estadisticas = histograma.estadisticas()
 
-    # Conectar la función de interacción con el mouse
-    fig.canvas.mpl_connect("motion_notify_event", on_hover)
+    print(f"Se analizaron {len(rutas)} archivos: {estadisticas['n']} vóxeles válidos "
+          f"({estadisticas['fuera_de_rango']} fuera del rango del histograma)")
+    print(f"Rango de valores T2: {estadisticas['minimo']:.2f} - {estadisticas['maximo']:.2f} ms")
+    print(f"Media: {estadisticas['media']:.2f} ms, desviación estándar: {estadisticas['desviacion']:.2f} ms")
+    print(", ".join(f"P{q}: {estadisticas[f'p{q}']:.2f} ms" for q in PERCENTILES))
+    print(f"El valor de T2 con máxima frecuencia es aproximadamente: {estadisticas['moda']:.2f} ms "
+          f"con una frecuencia de {estadisticas['frecuencia_moda']}")
 
+    carpeta = os.path.dirname(rutas[0])
+    csv_path = args.csv or os.path.join(carpeta, "histograma_T2.csv")
+    histograma.guardar_csv(csv_path)
+    print(f"Cuentas del histograma guardadas en: {csv_path}")
+
+    hist_path = os.path.join(carpeta, "histograma_T2.jpg")
+    guardar_grafico_histograma(histograma, hist_path)
+    print(f"Histograma guardado en: {hist_path}")
+
+    if args.sin_grafico:
+        return
+
+    # Explorador: mapa T2 y histograma enlazados; los cortes se leen a medida que se muestran
+    cortes = []
+    for ruta in sorted(rutas):
+        n_frames = n_cortes_mapa(pydicom.dcmread(ruta, stop_before_pixels=True))
+        cortes.extend((ruta, k) for k in range(n_frames))
+
+    def leer_corte(indice):
+        ruta, k = cortes[indice]
+        valores, fondo = leer_mapa(pydicom.dcmread(ruta))
+        return valores[k], fondo[k]
+
+    explorador = ExploradorT2(leer_corte, len(cortes), histograma)
     plt.show()
+    return explorador
 
-    hist_path = os.path.join(os.path.dirname(dicom_path), "histograma_T2.jpg")
-    fig.savefig(hist_path, dpi=300)
-    print(f"Histograma guardado en: {hist_path}")
\ No newline at end of file
+
+if __name__ == "__main__":
+    main()
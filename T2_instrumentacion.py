@@ -0,0 +1,183 @@
+import datetime
+import json
+import os
+import platform
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+from T2_ajuste import UMBRAL_SENAL
+
+# Etapas del mapeo T2, en el orden en que aparecen en el informe
+ETAPAS = ("escaneo", "decodificacion", "enmascarado", "ajuste", "calidad", "cuantizacion", "escritura")
+
+# Última décima de avance impresa por etapa
+_ultima_decima = {}
+
+
+def imprimir_progreso(etapa, hechos, totales):
+    """
+    Callback de progreso por defecto: imprime el avance de cada etapa cada 10%.
+
+    Funciona con cualquier número de elementos (también con menos de 10) porque
+    compara décimas completadas en lugar de usar el resto de una división.
+    """
+    if totales <= 0:
+        return
+    decima = min(10, (10 * hechos) // totales)
+    if decima > _ultima_decima.get(etapa, 0):
+        _ultima_decima[etapa] = decima
+        print(f"Progreso ({etapa}): {100 * hechos / totales:.1f}%")
+    if hechos >= totales:
+        _ultima_decima.pop(etapa, None)
+
+
+def etapa(registro, nombre, elementos=None):
+    """Contexto de la etapa nombre en registro, o un contexto vacío si no hay registro."""
+    return registro.etapa(nombre, elementos) if registro is not None else nullcontext()
+
+
+def progreso_de(registro, nombre):
+    """Callback progreso(hechos, totales) de la etapa nombre, o None si no hay registro."""
+    return registro.progreso_etapa(nombre) if registro is not None else None
+
+
+def contar_pixeles(T2_vol, volumen, umbral=UMBRAL_SENAL, mascara=None):
+    """
+    Cuenta los píxeles ajustados, enmascarados y fallidos de un mapa T2.
+
+    Un píxel está enmascarado si su señal máxima entre ecos es menor que el umbral o
+    queda fuera de la máscara de tejido (los motores no lo ajustan); fallido si no
+    estaba enmascarado y aun así quedó en NaN.
+
+    Parameters:
+        T2_vol (np.ndarray): Mapa T2 con forma (corte, fila, columna).
+        volumen (np.ndarray): Volumen multieco con forma (corte, eco, fila, columna).
+        umbral (float): Umbral de señal usado en el ajuste.
+        mascara (np.ndarray): Máscara de tejido usada en el ajuste (opcional).
+
+    Returns:
+        dict: pixeles, ajustados, enmascarados y fallidos.
+    """
+    enmascarados = volumen.max(axis=1) < umbral
+    if mascara is not None:
+        enmascarados |= ~mascara
+    ajustados = np.isfinite(T2_vol)
+    return {
+        "pixeles": int(T2_vol.size),
+        "ajustados": int(ajustados.sum()),
+        "enmascarados": int(enmascarados.sum()),
+        "fallidos": int((~enmascarados & ~ajustados).sum()),
+    }
+
+
+class RegistroEjecucion:
+    """
+    Registro de una ejecución del mapeo T2: tiempos y memoria por etapa, contadores y progreso.
+
+    Cada etapa se mide con el contexto etapa(); el pico de memoria es el de tracemalloc
+    dentro de la etapa (incluye las reservas de NumPy). El informe final es un dict
+    serializable a JSON para que lo recoja el planificador de lotes.
+
+    Parameters:
+        progreso (callable): Función progreso(etapa, hechos, totales); por defecto, imprimir_progreso.
+            None desactiva el progreso.
+        medir_memoria (bool): Activa tracemalloc durante la ejecución. Su coste es alto (puede
+            multiplicar varias veces la duración de la lectura y la escritura).
+        **parametros: Parámetros de la ejecución que se copian al informe (carpetas, método...).
+    """
+
+    def __init__(self, progreso=imprimir_progreso, medir_memoria=True, **parametros):
+        self.progreso = progreso
+        self.medir_memoria = medir_memoria
+        self.parametros = parametros
+        self.etapas = {}
+        self.contadores = {}
+        self.estado = "en_curso"
+        self.error = None
+        self.inicio = datetime.datetime.now()
+        self._inicio_reloj = time.perf_counter()
+        self.duracion = None
+        self._tracemalloc_propio = medir_memoria and not tracemalloc.is_tracing()
+        if self._tracemalloc_propio:
+            tracemalloc.start()
+
+    @contextmanager
+    def etapa(self, nombre, elementos=None):
+        """Mide el tiempo y el pico de memoria del bloque; los tiempos de una etapa repetida se suman."""
+        if self.medir_memoria:
+            tracemalloc.reset_peak()
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            datos = self.etapas.setdefault(nombre, {"segundos": 0.0})
+            datos["segundos"] += time.perf_counter() - inicio
+            if self.medir_memoria:
+                _, pico = tracemalloc.get_traced_memory()
+                datos["pico_memoria_mb"] = max(datos.get("pico_memoria_mb", 0.0), pico / 1e6)
+            if elementos is not None:
+                datos["elementos"] = datos.get("elementos", 0) + elementos
+
+    def progreso_etapa(self, nombre):
+        """Callback progreso(hechos, totales) que reenvía el avance de la etapa nombre."""
+        def progreso(hechos, totales):
+            if self.progreso is not None:
+                self.progreso(nombre, hechos, totales)
+        return progreso
+
+    def contar(self, **contadores):
+        """Suma los contadores indicados (p. ej. ajustados=..., fallidos=...)."""
+        for nombre, valor in contadores.items():
+            self.contadores[nombre] = self.contadores.get(nombre, 0) + int(valor)
+
+    def terminar(self, error=None):
+        """Cierra el registro; error (excepción o texto) marca la ejecución como fallida."""
+        self.duracion = time.perf_counter() - self._inicio_reloj
+        self.estado = "error" if error is not None else "ok"
+        self.error = str(error) if error is not None else None
+        if self._tracemalloc_propio:
+            tracemalloc.stop()
+            self._tracemalloc_propio = False
+
+    def informe(self):
+        """Informe de la ejecución como dict serializable a JSON."""
+        orden = {nombre: k for k, nombre in enumerate(ETAPAS)}
+        etapas = {nombre: dict(datos) for nombre, datos in
+                  sorted(self.etapas.items(), key=lambda item: orden.get(item[0], len(orden)))}
+        for datos in etapas.values():
+            if datos.get("elementos") and datos["segundos"] > 0:
+                datos["elementos_por_s"] = datos["elementos"] / datos["segundos"]
+        duracion = self.duracion if self.duracion is not None else time.perf_counter() - self._inicio_reloj
+        return {
+            "estado": self.estado,
+            "error": self.error,
+            "inicio": self.inicio.isoformat(timespec="seconds"),
+            "duracion_s": duracion,
+            "pico_memoria_mb": (max((datos["pico_memoria_mb"] for datos in etapas.values()), default=0.0)
+                                if self.medir_memoria else None),
+            "etapas": etapas,
+            "contadores": dict(self.contadores),
+            "parametros": self.parametros,
+            "entorno": {"python": platform.python_version(), "numpy": np.__version__, "pid": os.getpid()},
+        }
+
+    def guardar_json(self, ruta):
+        """Escribe el informe en ruta y devuelve la ruta."""
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(self.informe(), f, indent=2, ensure_ascii=False, default=str)
+        return ruta
+
+    def resumen(self):
+        """Texto breve con la duración de cada etapa y los contadores."""
+        lineas = []
+        for nombre, datos in self.informe()["etapas"].items():
+            linea = f"{nombre}: {datos['segundos']:.2f} s"
+            if "pico_memoria_mb" in datos:
+                linea += f", pico {datos['pico_memoria_mb']:.1f} MB"
+            lineas.append(linea)
+        if self.contadores:
+            lineas.append(", ".join(f"{nombre}={valor}" for nombre, valor in self.contadores.items()))
+        return "\n".join(lineas)
@@ -0,0 +1,226 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from indice_dicom import RUTA_INDICE, abrir_indice, actualizar_indice, consultar_archivos
+
+# Número mínimo de ecos para considerar una serie como adquisición multieco de T2
+# (con dos ecos suelen ser secuencias en fase/fuera de fase, no de relaxometría)
+MIN_ECOS = 3
+
+# A partir de este número de cortes el ajuste guarda un punto de control por corte
+CORTES_VOLUMEN_GRANDE = 16
+
+# Archivo de puntos de control del lote, en la raíz de la carpeta de salida
+ARCHIVO_CONTROL = "lote_T2.json"
+
+
+def _nombre_serie(numero, descripcion, serie_uid):
+    """Nombre de carpeta legible y único para una serie: número, descripción y un resumen del UID."""
+    descripcion = re.sub(r"[^\w.-]+", "_", descripcion or "serie").strip("_") or "serie"
+    resumen = hashlib.sha1(serie_uid.encode()).hexdigest()[:8]
+    numero = f"{numero:03d}" if numero is not None else "sn"
+    return f"{numero}_{descripcion}_{resumen}"
+
+
+def descubrir_series(raiz, raiz_salida=None, ruta_indice=RUTA_INDICE, min_ecos=MIN_ECOS):
+    """
+    Busca bajo raiz las series multieco candidatas al mapeo T2.
+
+    Usa el índice DICOM, así que en una segunda pasada solo se leen las cabeceras de
+    los archivos nuevos o modificados. Una serie es candidata si tiene al menos
+    min_ecos tiempos de eco distintos y el mismo número de imágenes para cada eco.
+
+    Parameters:
+        raiz (str): Carpeta raíz con los estudios.
+        raiz_salida (str): Carpeta de salida del lote; los archivos bajo ella se ignoran.
+        ruta_indice (str): Base de datos del índice DICOM.
+        min_ecos (int): Número mínimo de ecos distintos.
+
+    Returns:
+        list: Un dict por serie con id, carpeta, serie_uid, descripcion, ecos, cortes y salida relativa.
+    """
+    raiz = os.path.abspath(raiz)
+    excluida = os.path.join(os.path.abspath(raiz_salida), "") if raiz_salida else None
+
+    conexion = abrir_indice(ruta_indice)
+    try:
+        resumen = actualizar_indice(conexion, raiz)
+        print(f"Índice actualizado: {resumen['nuevos']} nuevos, {resumen['actualizados']} modificados, "
+              f"{resumen['sin_cambios']} sin cambios, {resumen['eliminados']} eliminados")
+        filas = consultar_archivos(conexion, raiz)
+    finally:
+        conexion.close()
+
+    # Las series se agrupan por carpeta y SeriesInstanceUID, que es lo que carga el pipeline
+    grupos = {}
+    for fila in filas:
+        if fila["series_uid"] is None or fila["echo_time"] is None:
+            continue
+        if excluida and fila["ruta"].startswith(excluida):
+            continue
+        grupo = grupos.setdefault((os.path.dirname(fila["ruta"]), fila["series_uid"]), {
+            "numero": fila["series_number"], "descripcion": fila["series_description"], "ecos": {},
+        })
+        TE = round(fila["echo_time"], 3)
+        grupo["ecos"][TE] = grupo["ecos"].get(TE, 0) + 1
+
+    series = []
+    for (carpeta, serie_uid), grupo in sorted(grupos.items()):
+        imagenes_por_eco = set(grupo["ecos"].values())
+        if len(grupo["ecos"]) < min_ecos or len(imagenes_por_eco) != 1:
+            continue
+        nombre = _nombre_serie(grupo["numero"], grupo["descripcion"], serie_uid)
+        salida = os.path.normpath(os.path.join(os.path.relpath(carpeta, raiz), nombre))
+        series.append({
+            "id": salida.replace(os.sep, "/"),
+            "carpeta": carpeta,
+            "serie_uid": serie_uid,
+            "descripcion": grupo["descripcion"],
+            "ecos": len(grupo["ecos"]),
+            "cortes": imagenes_por_eco.pop(),
+            "salida": salida,
+        })
+    return series
+
+
+def cargar_control(raiz_salida):
+    """Estado del lote guardado en raiz_salida (vacío si es la primera ejecución)."""
+    ruta = os.path.join(raiz_salida, ARCHIVO_CONTROL)
+    if not os.path.exists(ruta):
+        return {"series": {}}
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def guardar_control(raiz_salida, control):
+    """Guarda el estado del lote de forma atómica (archivo temporal y renombrado)."""
+    ruta = os.path.join(raiz_salida, ARCHIVO_CONTROL)
+    temporal = ruta + ".tmp"
+    control["actualizado"] = datetime.datetime.now().isoformat(timespec="seconds")
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(control, f, indent=2, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+
+def procesar_serie(serie, raiz_salida, metodo="lm", opciones=None):
+    """
+    Mapeo T2 de una serie del lote, con la salida de T2_mapping_DICOM_output_V2.
+
+    En la carpeta de salida de la serie quedan T2_map.dcm (o T2_map_NNN.dcm, uno por
+    corte), histograma_T2.jpg e informe_T2.json. En volúmenes grandes el ajuste guarda
+    un punto de control por corte, de modo que un reintento no repite los cortes hechos.
+
+    Returns:
+        dict: Estado de la serie para el archivo de control del lote.
+    """
+    from T2_pipeline import mapear_T2
+
+    output_folder = os.path.join(raiz_salida, serie["salida"])
+    carpeta_control = None
+    if serie["cortes"] >= CORTES_VOLUMEN_GRANDE:
+        carpeta_control = os.path.join(output_folder, ".cortes")
+    try:
+        resultado = mapear_T2(serie["carpeta"], output_folder, metodo=metodo, ventana=None, escala=4096,
+                              progreso=None, serie=serie["serie_uid"], carpeta_control=carpeta_control,
+                              **(opciones or {}))
+    except Exception as e:
+        return {"estado": "error", "error": f"{type(e).__name__}: {e}", "salida": output_folder}
+    informe = resultado["registro"].informe()
+    return {
+        "estado": "ok",
+        "salida": output_folder,
+        "archivos": [os.path.basename(ruta) for ruta in resultado["rutas"]],
+        "duracion_s": informe["duracion_s"],
+        "contadores": informe["contadores"],
+    }
+
+
+def ejecutar_lote(raiz, raiz_salida, metodo="lm", n_procesos=None, ruta_indice=RUTA_INDICE, min_ecos=MIN_ECOS,
+                  reintentar_errores=True, forzar=False, **opciones):
+    """
+    Ejecuta el mapeo T2 de todas las series multieco bajo raiz con un grupo acotado de procesos.
+
+    Tras cada serie terminada se actualiza el archivo de control del lote, así que si la
+    ejecución se interrumpe, la siguiente omite las series ya hechas y retoma las demás.
+
+    Parameters:
+        raiz (str): Carpeta raíz con los estudios.
+        raiz_salida (str): Carpeta de salida; cada serie escribe en una subcarpeta que
+            reproduce su ruta relativa bajo raiz.
+        metodo (str): Motor de ajuste.
+        n_procesos (int): Número de series procesadas a la vez; por defecto, todos los núcleos.
+        ruta_indice (str): Base de datos del índice DICOM.
+        min_ecos (int): Número mínimo de ecos de una serie candidata.
+        reintentar_errores (bool): Vuelve a procesar las series que fallaron en ejecuciones anteriores.
+        forzar (bool): Procesa de nuevo todas las series, aunque ya estén hechas.
+        **opciones: Argumentos adicionales para el motor de ajuste.
+
+    Returns:
+        dict: Número de series hechas, omitidas y con error.
+    """
+    os.makedirs(raiz_salida, exist_ok=True)
+    series = descubrir_series(raiz, raiz_salida, ruta_indice, min_ecos)
+    control = cargar_control(raiz_salida)
+    # Los estados guardados antes de registrar el método por serie usan el del lote
+    metodo_previo = control.get("metodo", metodo)
+    control.update({"raiz": os.path.abspath(raiz), "metodo": metodo})
+    estados = control["series"]
+
+    def pendiente(serie):
+        anterior = estados.get(serie["id"], {})
+        estado = anterior.get("estado")
+        # Una serie hecha con otro motor se repite (sus puntos de control por corte se descartan solos)
+        otro_metodo = anterior.get("metodo", metodo_previo) != metodo
+        return forzar or estado is None or otro_metodo or (estado == "error" and reintentar_errores)
+
+    cola = [serie for serie in series if pendiente(serie)]
+    omitidas = len(series) - len(cola)
+    print(f"{len(series)} series multieco encontradas: {len(cola)} por procesar, {omitidas} ya hechas.")
+
+    hechas = errores = 0
+    with ProcessPoolExecutor(max_workers=n_procesos) as pool:
+        tareas = {pool.submit(procesar_serie, serie, raiz_salida, metodo, opciones): serie for serie in cola}
+        for tarea in as_completed(tareas):
+            serie = tareas[tarea]
+            estado = tarea.result()
+            estado.update({"carpeta": serie["carpeta"], "serie_uid": serie["serie_uid"], "metodo": metodo})
+            estados[serie["id"]] = estado
+            guardar_control(raiz_salida, control)
+            if estado["estado"] == "ok":
+                hechas += 1
+            else:
+                errores += 1
+                print(f"Error en {serie['id']}: {estado['error']}")
+            print(f"[{hechas + errores}/{len(cola)}] {serie['id']}: {estado['estado']}")
+
+    guardar_control(raiz_salida, control)
+    print(f"Lote terminado: {hechas} series, {omitidas} omitidas, {errores} errores.")
+    return {"hechas": hechas, "omitidas": omitidas, "errores": errores}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mapeo T2 por lotes de todas las series multieco bajo una carpeta.")
+    parser.add_argument("raiz", help="Carpeta raíz con los estudios")
+    parser.add_argument("salida", help="Carpeta de salida del lote")
+    parser.add_argument("-m", "--metodo", default="lm", help="Motor de ajuste")
+    parser.add_argument("--procesos", type=int, default=None, help="Series procesadas a la vez")
+    parser.add_argument("--indice", default=RUTA_INDICE, help="Base de datos del índice DICOM")
+    parser.add_argument("--min-ecos", type=int, default=MIN_ECOS)
+    parser.add_argument("--sin-reintentos", action="store_true", help="No reintenta las series que fallaron")
+    parser.add_argument("--forzar", action="store_true", help="Reprocesa también las series ya hechas")
+    args = parser.parse_args(argv)
+
+    resumen = ejecutar_lote(args.raiz, args.salida, metodo=args.metodo, n_procesos=args.procesos,
+                            ruta_indice=args.indice, min_ecos=args.min_ecos,
+                            reintentar_errores=not args.sin_reintentos, forzar=args.forzar)
+    return 1 if resumen["errores"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import numpy as np
+
+# Métodos de umbralización del primer eco disponibles para la máscara de tejido
+METODOS_MASCARA = ("otsu", "percentil")
+
+# Intervalos del histograma con el que se calcula el umbral de Otsu
+BINS_OTSU = 256
+
+# Método del percentil: el umbral es una fracción de la intensidad de este percentil,
+# que representa el tejido brillante sin depender de unos pocos píxeles saturados
+PERCENTIL_REFERENCIA = 99
+FRACCION_PERCENTIL = 0.1
+
+
+def umbral_otsu(valores, bins=BINS_OTSU):
+    """
+    Umbral de Otsu de un conjunto de intensidades: maximiza la varianza entre clases.
+
+    Returns:
+        float: Intensidad que separa el fondo (por debajo) del tejido.
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    valores = valores[np.isfinite(valores)]
+    if valores.size == 0 or valores.min() == valores.max():
+        return float(valores.min()) if valores.size else 0.0
+    conteos, bordes = np.histogram(valores, bins=bins)
+    centros = (bordes[:-1] + bordes[1:]) / 2
+
+    # Peso y suma de intensidades de la clase inferior para cada posible corte
+    peso_fondo = np.cumsum(conteos)[:-1]
+    suma_fondo = np.cumsum(conteos * centros)[:-1]
+    peso_tejido = conteos.sum() - peso_fondo
+    suma_tejido = (conteos * centros).sum() - suma_fondo
+    with np.errstate(divide="ignore", invalid="ignore"):
+        diferencia = suma_fondo / peso_fondo - suma_tejido / peso_tejido
+        varianza_entre = peso_fondo * peso_tejido * diferencia ** 2
+    return float(bordes[np.nanargmax(varianza_entre) + 1])
+
+
+def umbral_tejido(primer_eco, metodo="otsu"):
+    """Umbral de intensidad del primer eco según el método de METODOS_MASCARA."""
+    if metodo == "otsu":
+        return umbral_otsu(primer_eco)
+    if metodo == "percentil":
+        return FRACCION_PERCENTIL * float(np.nanpercentile(primer_eco, PERCENTIL_REFERENCIA))
+    raise ValueError(f"Método de máscara desconocido: {metodo}. Opciones: {', '.join(METODOS_MASCARA)}")
+
+
+def mascara_tejido(primer_eco, metodo="otsu", radio=1, rellenar=True, mayor_componente=True):
+    """
+    Máscara del tejido a partir del primer eco, para ajustar solo los píxeles del primer plano.
+
+    El umbral se calcula sobre todo el volumen (los cortes de los extremos, con poco
+    tejido, darían un umbral de Otsu poco fiable); la limpieza morfológica, el relleno de
+    huecos y la selección de la mayor componente conexa se hacen en cada corte, pero con
+    una única llamada a scipy.ndimage sobre el volumen y un elemento estructurante plano.
+
+    Parameters:
+        primer_eco (np.ndarray): Imagen (fila, columna) o volumen (corte, fila, columna) del primer eco.
+        metodo (str): "otsu" o "percentil" (ver umbral_tejido).
+        radio (int): Iteraciones de la apertura morfológica; 0 la desactiva.
+        rellenar (bool): Rellena los huecos interiores (vasos, quistes y otras zonas oscuras del tejido).
+        mayor_componente (bool): Conserva solo la mayor componente conexa de cada corte.
+
+    Returns:
+        np.ndarray: Máscara booleana con la forma de primer_eco.
+    """
+    # SciPy solo se importa al crear la máscara: el resto del mapeo no lo necesita
+    from scipy import ndimage
+
+    primer_eco = np.asarray(primer_eco)
+    volumen = primer_eco[np.newaxis] if primer_eco.ndim == 2 else primer_eco
+    mascara = volumen > umbral_tejido(volumen, metodo)
+
+    # Conectividad 8 dentro de cada corte y ninguna entre cortes
+    estructura = np.zeros((3, 3, 3), dtype=bool)
+    estructura[1] = True
+    if radio:
+        mascara = ndimage.binary_opening(mascara, structure=estructura, iterations=radio)
+    if rellenar:
+        # binary_fill_holes tomaría como borde los cortes primero y último enteros: el fondo
+        # exterior es el conectado con los bordes de cada corte y el resto son huecos
+        fondo, _ = ndimage.label(~mascara, structure=estructura)
+        bordes = np.concatenate([fondo[:, 0].ravel(), fondo[:, -1].ravel(), fondo[:, :, 0].ravel(),
+                                 fondo[:, :, -1].ravel()])
+        exteriores = np.unique(bordes[bordes > 0])
+        mascara = ~np.isin(fondo, exteriores)
+
+    if mayor_componente:
+        etiquetas, n_etiquetas = ndimage.label(mascara, structure=estructura)
+        if n_etiquetas:
+            tamanos = np.bincount(etiquetas.ravel(), minlength=n_etiquetas + 1)[1:]
+            # Corte al que pertenece cada etiqueta (con este elemento estructurante, solo uno)
+            corte_de = np.zeros(n_etiquetas + 1, dtype=np.intp)
+            corte_de[etiquetas.reshape(volumen.shape[0], -1)] = np.arange(volumen.shape[0])[:, np.newaxis]
+            corte_de = corte_de[1:]
+            # Ordenadas por corte y tamaño, la última de cada corte es la mayor
+            orden = np.lexsort((tamanos, corte_de))
+            ultima = np.r_[corte_de[orden][1:] != corte_de[orden][:-1], True]
+            conservar = np.zeros(n_etiquetas + 1, dtype=bool)
+            conservar[orden[ultima] + 1] = True
+            mascara = conservar[etiquetas]
+
+    return mascara.reshape(primer_eco.shape)
+
+
+def mascara_serie(dicom_folder, metodo="otsu", serie=None, **opciones):
+    """
+    Máscara de tejido de una adquisición multieco leyendo solo los archivos del primer eco.
+
+    Returns:
+        np.ndarray: Máscara booleana con forma (corte, fila, columna).
+    """
+    import pydicom
+    from T2_volumen import agrupar_serie
+
+    n_cortes, _, rutas = agrupar_serie(dicom_folder, serie=serie)
+    primer_eco = np.stack([pydicom.dcmread(rutas[k, 0]).pixel_array for k in range(n_cortes)])
+    return mascara_tejido(primer_eco, metodo, **opciones)
@@ -0,0 +1,179 @@
+import os
+
+import numpy as np
+
+from T2_ajuste import T2_MAX, T2_MIN, UMBRAL_SENAL, ajustar_mapa_T2, calidad_ajuste
+from T2_instrumentacion import etapa, progreso_de
+from T2_volumen import agrupar_serie
+
+# Píxeles que se ajustan a la vez: con 32 ecos, un bloque ocupa unos 8 MB en float32
+# (y el doble en las copias float64 de los motores)
+PIXELES_POR_BLOQUE = 65536
+
+# Resolución del histograma con el que se calculan los percentiles sin cargar el mapa
+BINS_PERCENTILES = 19000
+
+
+def volcar_pila(dicom_folder, ruta_pila, registro=None, serie=None):
+    """
+    Escribe la pila de ecos en un archivo mapeado en memoria con orden píxel-eco.
+
+    La pila tiene forma (n_pixeles, n_ecos) en float32, de modo que los ecos de cada
+    píxel son contiguos y un bloque de píxeles es una región contigua del archivo.
+    Se decodifica un corte cada vez, así que la memoria usada es la de un corte con
+    todos sus ecos, no la del volumen.
+
+    Parameters:
+        dicom_folder (str): Carpeta con la adquisición multieco.
+        ruta_pila (str): Archivo .npy de trabajo donde se escribe la pila.
+        registro (RegistroEjecucion): Registro opcional de las etapas.
+        serie (str): SeriesInstanceUID que se carga; por defecto, la serie mayoritaria.
+
+    Returns:
+        tuple: (pila, forma (corte, fila, columna), TE_values, referencias).
+    """
+    import pydicom
+
+    n_cortes, TE_values, rutas = agrupar_serie(dicom_folder, registro, serie)
+    n_ecos = len(TE_values)
+    n_archivos = n_cortes * n_ecos
+    progreso = progreso_de(registro, "decodificacion")
+
+    pila = None
+    with etapa(registro, "decodificacion", n_archivos):
+        for k in range(n_cortes):
+            ecos = [pydicom.dcmread(rutas[k, e]).pixel_array for e in range(n_ecos)]
+            if pila is None:
+                forma = (n_cortes,) + ecos[0].shape
+                pixeles_corte = ecos[0].size
+                pila = np.lib.format.open_memmap(ruta_pila, mode="w+", dtype=np.float32,
+                                                 shape=(n_cortes * pixeles_corte, n_ecos))
+            pila[k * pixeles_corte:(k + 1) * pixeles_corte] = np.stack(ecos, axis=-1).reshape(pixeles_corte, n_ecos)
+            if progreso is not None:
+                progreso((k + 1) * n_ecos, n_archivos)
+        pila.flush()
+
+    referencias = [rutas[k, 0] for k in range(n_cortes)]
+    return pila, forma, TE_values, referencias
+
+
+def ajustar_por_bloques(pila, forma, TE_values, carpeta_salida, metodo="lm", pixeles_por_bloque=PIXELES_POR_BLOQUE,
+                        registro=None, calidad=False, mascara=None, **opciones):
+    """
+    Ajusta una pila mapeada en memoria por bloques de píxeles y escribe los mapas en disco.
+
+    Cada bloque se lee de la pila, se ajusta con el motor indicado y se escribe en los
+    mapas de salida (T2_map.npy y S0_map.npy, también mapeados en memoria), de modo que
+    el pico de memoria depende del tamaño del bloque y no del volumen.
+
+    Parameters:
+        pila (np.ndarray): Pila (n_pixeles, n_ecos) de volcar_pila.
+        forma (tuple): Forma (corte, fila, columna) de los mapas.
+        TE_values (list): Tiempos de eco en ms.
+        carpeta_salida (str): Carpeta donde se crean T2_map.npy y S0_map.npy.
+        metodo (str): Motor de ajuste de T2_ajuste.
+        pixeles_por_bloque (int): Píxeles ajustados en cada bloque.
+        registro (RegistroEjecucion): Registro opcional; recibe el progreso y los contadores.
+        calidad (bool): Calcula también R² y el residuo RMS de cada bloque mientras está en
+            memoria (R2_map.npy y residuo_map.npy).
+        mascara (np.ndarray): Máscara de tejido con forma (corte, fila, columna); los píxeles
+            fuera de ella no llegan al motor.
+        **opciones: Argumentos adicionales para el motor.
+
+    Returns:
+        tuple: (T2_map, S0_map), o (T2_map, S0_map, R2_map, residuo_map) con calidad=True,
+        mapeados en memoria con forma (corte, fila, columna).
+    """
+    n_pixeles = pila.shape[0]
+    T2_map = np.lib.format.open_memmap(os.path.join(carpeta_salida, "T2_map.npy"), mode="w+", dtype=np.float32,
+                                       shape=forma)
+    S0_map = np.lib.format.open_memmap(os.path.join(carpeta_salida, "S0_map.npy"), mode="w+", dtype=np.float32,
+                                       shape=forma)
+    mapas = [T2_map, S0_map]
+    if calidad:
+        for nombre in ("R2_map.npy", "residuo_map.npy"):
+            mapas.append(np.lib.format.open_memmap(os.path.join(carpeta_salida, nombre), mode="w+",
+                                                   dtype=np.float32, shape=forma))
+    T2_plano = T2_map.reshape(-1)
+    S0_plano = S0_map.reshape(-1)
+    mascara_plana = mascara.reshape(-1) if mascara is not None else None
+    umbral = opciones.get("umbral", UMBRAL_SENAL)
+    progreso = progreso_de(registro, "ajuste")
+
+    # Cada bloque suma su ajuste y su calidad a etapas distintas del registro
+    for inicio in range(0, n_pixeles, pixeles_por_bloque):
+        fin = min(inicio + pixeles_por_bloque, n_pixeles)
+        bloque = np.asarray(pila[inicio:fin])
+        mascara_bloque = mascara_plana[None, inicio:fin] if mascara is not None else None
+        with etapa(registro, "ajuste", fin - inicio):
+            # Los motores esperan (n_ecos, filas, columnas): el bloque se presenta como una sola fila
+            T2_bloque, S0_bloque = ajustar_mapa_T2(bloque.T[:, None, :], TE_values, metodo=metodo,
+                                                   mascara=mascara_bloque, **opciones)
+            T2_plano[inicio:fin] = T2_bloque.reshape(-1)
+            S0_plano[inicio:fin] = S0_bloque.reshape(-1)
+        if calidad:
+            with etapa(registro, "calidad", fin - inicio):
+                R2_bloque, residuo_bloque = calidad_ajuste(bloque.T, TE_values, T2_bloque, S0_bloque)
+                mapas[2].reshape(-1)[inicio:fin] = R2_bloque.reshape(-1)
+                mapas[3].reshape(-1)[inicio:fin] = residuo_bloque.reshape(-1)
+
+        if registro is not None:
+            enmascarados = bloque.max(axis=1) < umbral
+            if mascara is not None:
+                enmascarados |= ~mascara_bloque[0]
+            ajustados = np.isfinite(T2_plano[inicio:fin])
+            registro.contar(pixeles=fin - inicio, ajustados=ajustados.sum(), enmascarados=enmascarados.sum(),
+                            fallidos=(~enmascarados & ~ajustados).sum())
+        if progreso is not None:
+            progreso(fin, n_pixeles)
+    for mapa in mapas:
+        mapa.flush()
+    return tuple(mapas)
+
+
+def histograma_por_bloques(mapa, bins, rango, pixeles_por_bloque=PIXELES_POR_BLOQUE):
+    """Histograma de los valores finitos de un mapa (posiblemente en disco) recorrido por bloques."""
+    plano = mapa.reshape(-1)
+    conteos = np.zeros(bins, dtype=np.int64)
+    for inicio in range(0, plano.size, pixeles_por_bloque):
+        valores = np.asarray(plano[inicio:inicio + pixeles_por_bloque])
+        conteos += np.histogram(valores[np.isfinite(valores)], bins=bins, range=rango)[0]
+    return conteos, np.linspace(rango[0], rango[1], bins + 1)
+
+
+def percentiles_por_bloques(mapa, percentiles, pixeles_por_bloque=PIXELES_POR_BLOQUE):
+    """
+    Percentiles de los valores finitos de un mapa T2 sin cargarlo entero.
+
+    Los mapas están recortados a [T2_MIN, T2_MAX], así que un histograma fino de ese
+    rango da los percentiles con un error menor que 0,01 ms.
+    """
+    conteos, bordes = histograma_por_bloques(mapa, BINS_PERCENTILES, (T2_MIN, T2_MAX), pixeles_por_bloque)
+    acumulado = np.cumsum(conteos)
+    if acumulado[-1] == 0:
+        return [np.nan for _ in percentiles]
+    posiciones = np.searchsorted(acumulado, np.asarray(percentiles) / 100 * acumulado[-1])
+    return [float(bordes[min(p, len(bordes) - 2)] + (bordes[1] - bordes[0]) / 2) for p in posiciones]
+
+
+def cuantizar_por_bloques(T2_map, ruta_salida, window_min, window_max, escala, pixeles_por_bloque=PIXELES_POR_BLOQUE,
+                          registro=None):
+    """
+    Cuantiza un mapa T2 mapeado en memoria a uint16 escribiendo en otro archivo mapeado.
+
+    Como T2_pipeline.cuantizar, la ventana se lleva a 1..escala y el 0 queda para los NaN.
+
+    Returns:
+        tuple: (mapa uint16 mapeado en memoria con la forma de T2_map, pendiente, ordenada).
+    """
+    salida = np.lib.format.open_memmap(ruta_salida, mode="w+", dtype=np.uint16, shape=T2_map.shape)
+    origen = T2_map.reshape(-1)
+    destino = salida.reshape(-1)
+    pendiente = max(float(window_max - window_min), 1e-6) / (escala - 1)
+    with etapa(registro, "cuantizacion", origen.size):
+        for inicio in range(0, origen.size, pixeles_por_bloque):
+            fin = min(inicio + pixeles_por_bloque, origen.size)
+            normalizado = (np.clip(origen[inicio:fin], window_min, window_max) - window_min) / pendiente + 1
+            destino[inicio:fin] = np.nan_to_num(normalizado, nan=0).astype(np.uint16)
+        salida.flush()
+    return salida, pendiente, float(window_min) - pendiente
@@ -0,0 +1,140 @@
+import math
+import warnings
+
+import numpy as np
+
+from T2_ajuste import (T2_INICIAL, T2_MAX, T2_MIN, UMBRAL_SENAL, _componer_mapas, _preparar_senales,
+                       _regresion_loglineal, ajustar_T2_lm)
+
+try:
+    from numba import njit, prange
+    NUMBA_DISPONIBLE = True
+except ImportError:
+    NUMBA_DISPONIBLE = False
+
+    # Sin Numba el núcleo sigue siendo Python válido (útil para depurarlo), pero el
+    # ajuste pasa al Levenberg-Marquardt vectorizado de NumPy, que es el mismo algoritmo
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda funcion: funcion
+
+    prange = range
+
+
+@njit(cache=True)
+def _coste(y, TE, S0, T2):
+    total = 0.0
+    for e in range(TE.size):
+        diferencia = S0 * math.exp(-TE[e] / T2) - y[e]
+        total += diferencia * diferencia
+    return total
+
+
+@njit(cache=True)
+def _ajustar_pixel(y, TE, S0, T2, tol, max_iter, lambda_inicial, T2_min, T2_max):
+    """
+    Levenberg-Marquardt de exp_decay para un píxel, con los pasos proyectados sobre los
+    límites de curve_fit (S0 >= 0, T2_min <= T2 <= T2_max). Devuelve (S0, T2).
+    """
+    lam = lambda_inicial
+    coste = _coste(y, TE, S0, T2)
+    for _ in range(max_iter):
+        A00 = A01 = A11 = g0 = g1 = 0.0
+        for e in range(TE.size):
+            decaimiento = math.exp(-TE[e] / T2)
+            residuo = S0 * decaimiento - y[e]
+            J_T2 = S0 * decaimiento * TE[e] / (T2 * T2)
+            A00 += decaimiento * decaimiento
+            A01 += decaimiento * J_T2
+            A11 += J_T2 * J_T2
+            g0 += decaimiento * residuo
+            g1 += J_T2 * residuo
+
+        B00 = A00 * (1 + lam)
+        B11 = A11 * (1 + lam)
+        det = B00 * B11 - A01 * A01
+        if det == 0.0 or not math.isfinite(det):
+            break
+        S0_nuevo = max(S0 - (B11 * g0 - A01 * g1) / det, 0.0)
+        T2_nuevo = min(max(T2 - (B00 * g1 - A01 * g0) / det, T2_min), T2_max)
+        coste_nuevo = _coste(y, TE, S0_nuevo, T2_nuevo)
+
+        if coste_nuevo < coste:
+            cambio = max(abs(S0_nuevo - S0) / max(S0, 1e-12), abs(T2_nuevo - T2) / T2)
+            reduccion = (coste - coste_nuevo) / max(coste, 1e-12)
+            S0, T2, coste = S0_nuevo, T2_nuevo, coste_nuevo
+            lam /= 10
+            if reduccion <= tol or cambio <= tol:
+                break
+        else:
+            lam *= 10
+            if lam > 1e10:
+                break
+    return S0, T2
+
+
+@njit(cache=True, parallel=True)
+def _ajustar_pixeles(y, TE, S0_inicial, T2_inicial, tol, max_iter, lambda_inicial, T2_min, T2_max):
+    """Ajusta cada fila de y (n_pixeles, n_ecos) en un bucle paralelo."""
+    n_pixeles = y.shape[0]
+    S0 = np.empty(n_pixeles)
+    T2 = np.empty(n_pixeles)
+    for j in prange(n_pixeles):
+        S0_pixel, T2_pixel = _ajustar_pixel(y[j], TE, S0_inicial[j], T2_inicial[j], tol, max_iter,
+                                            lambda_inicial, T2_min, T2_max)
+        S0[j] = S0_pixel
+        T2[j] = T2_pixel
+    return S0, T2
+
+
+def ajustar_T2_numba(images_array, TE_values, umbral=UMBRAL_SENAL, tol=1e-6, max_iter=100, lambda_inicial=1e-3):
+    """
+    Ajuste no lineal exacto píxel a píxel compilado con Numba.
+
+    Cada píxel se ajusta con su propio Levenberg-Marquardt (mismo algoritmo, límites y
+    estimación inicial que ajustar_T2_lm) dentro de un bucle paralelo. La compilación
+    se guarda en disco (cache=True), así que solo la primera ejecución paga el coste
+    de compilar. Si Numba no está instalado se usa ajustar_T2_lm.
+
+    Parameters:
+        images_array (np.ndarray): Pila de ecos con forma (n_ecos, ...).
+        TE_values (list): Tiempos de eco en ms.
+        umbral (float): Umbral de señal máxima por debajo del cual el píxel queda en NaN.
+        tol (float): Tolerancia relativa sobre el paso y sobre la reducción del coste.
+        max_iter (int): Número máximo de iteraciones por píxel.
+        lambda_inicial (float): Amortiguamiento inicial de Levenberg-Marquardt.
+
+    Returns:
+        tuple: (T2_map, S0_map) con la forma espacial de la pila y dtype float32.
+    """
+    if not NUMBA_DISPONIBLE:
+        # Con el filtro por defecto el aviso se muestra una sola vez por proceso, aunque el
+        # motor se llame por cada bloque o corte
+        warnings.warn("Numba no está instalado; se usa el ajuste Levenberg-Marquardt vectorizado de NumPy.",
+                      RuntimeWarning)
+        return ajustar_T2_lm(images_array, TE_values, umbral=umbral, tol=tol, max_iter=max_iter,
+                             lambda_inicial=lambda_inicial)
+    return _ajustar_compilado(images_array, TE_values, umbral, tol, max_iter, lambda_inicial)
+
+
+def _ajustar_compilado(images_array, TE_values, umbral, tol, max_iter, lambda_inicial):
+    senales, TE, mascara, forma = _preparar_senales(images_array, TE_values, umbral)
+    indices = np.flatnonzero(mascara)
+    y = senales[:, indices]
+
+    # Estimación inicial log-lineal, con el valor inicial de los scripts como respaldo
+    T2, S0 = _regresion_loglineal(y, TE)
+    iniciales_validos = np.isfinite(T2) & np.isfinite(S0)
+    T2 = np.clip(np.where(iniciales_validos, T2, T2_INICIAL), T2_MIN, T2_MAX)
+    S0 = np.where(iniciales_validos, S0, y.max(axis=0) if y.size else S0)
+
+    # Cada píxel contiguo en memoria para el bucle compilado
+    S0, T2 = _ajustar_pixeles(np.ascontiguousarray(y.T), TE, S0.astype(np.float64), T2.astype(np.float64),
+                              float(tol), int(max_iter), float(lambda_inicial), float(T2_MIN), float(T2_MAX))
+
+    T2_completo = np.full(mascara.size, np.nan)
+    S0_completo = np.full(mascara.size, np.nan)
+    T2_completo[indices] = T2
+    S0_completo[indices] = S0
+    return _componer_mapas(T2_completo, S0_completo, mascara, forma)
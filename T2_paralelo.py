@@ -0,0 +1,102 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from T2_ajuste import UMBRAL_SENAL, ajustar_mapa_T2
+
+# Estado de cada proceso trabajador: vistas sobre la memoria compartida
+_compartido = {}
+
+
+def _inicializar_trabajador(nombre_pila, forma_pila, dtype_pila, nombre_salida, TE_values, metodo, opciones):
+    """Abre la pila de ecos y los mapas de salida una sola vez por proceso."""
+    memoria_pila = shared_memory.SharedMemory(name=nombre_pila)
+    memoria_salida = shared_memory.SharedMemory(name=nombre_salida)
+    _compartido["memorias"] = (memoria_pila, memoria_salida)
+    _compartido["pila"] = np.ndarray(forma_pila, dtype=dtype_pila, buffer=memoria_pila.buf)
+    _compartido["salida"] = np.ndarray((2,) + forma_pila[1:], dtype=np.float32, buffer=memoria_salida.buf)
+    _compartido["TE_values"] = TE_values
+    _compartido["metodo"] = metodo
+    _compartido["opciones"] = opciones
+
+
+def _ajustar_bloque(inicio, fin):
+    """Ajusta las filas [inicio, fin) y escribe T2 y S0 directamente en la salida compartida."""
+    pila = _compartido["pila"]
+    T2_bloque, S0_bloque = ajustar_mapa_T2(
+        pila[:, inicio:fin], _compartido["TE_values"], metodo=_compartido["metodo"], **_compartido["opciones"]
+    )
+    salida = _compartido["salida"]
+    salida[0, inicio:fin] = T2_bloque
+    salida[1, inicio:fin] = S0_bloque
+    return fin - inicio
+
+
+def ajustar_T2_paralelo(images_array, TE_values, umbral=UMBRAL_SENAL, n_procesos=None, filas_por_bloque=8,
+                        progreso=None, metodo_bloque="curve_fit", **opciones):
+    """
+    Ajusta el mapa T2 repartiendo bloques de filas entre varios procesos.
+
+    La pila de ecos se copia una sola vez a memoria compartida y cada trabajador escribe
+    sus filas directamente en los mapas compartidos, de modo que no se serializan datos
+    de imagen por tarea.
+
+    Parameters:
+        images_array (np.ndarray): Pila de ecos con forma (n_ecos, filas, columnas).
+        TE_values (list): Tiempos de eco en ms.
+        umbral (float): Umbral de señal máxima por debajo del cual el píxel queda en NaN.
+        n_procesos (int): Número de procesos; por defecto, todos los núcleos.
+        filas_por_bloque (int): Filas que ajusta cada tarea.
+        progreso (callable): Función opcional progreso(filas_hechas, filas_totales).
+        metodo_bloque (str): Motor de ajuste que ejecuta cada trabajador (por defecto, píxel a píxel).
+        **opciones: Argumentos adicionales para el motor.
+
+    Returns:
+        tuple: (T2_map, S0_map) con dtype float32.
+    """
+    images_array = np.ascontiguousarray(images_array)
+    if images_array.ndim != 3:
+        raise ValueError("La pila de ecos debe tener forma (n_ecos, filas, columnas)")
+    n_procesos = n_procesos or os.cpu_count() or 1
+    filas = images_array.shape[1]
+
+    opciones["umbral"] = umbral
+    if metodo_bloque == "curve_fit":
+        opciones.setdefault("mostrar_progreso", False)
+
+    memoria_pila = shared_memory.SharedMemory(create=True, size=max(images_array.nbytes, 1))
+    memoria_salida = shared_memory.SharedMemory(
+        create=True, size=max(2 * images_array[0].size * np.dtype(np.float32).itemsize, 1)
+    )
+    try:
+        pila = np.ndarray(images_array.shape, dtype=images_array.dtype, buffer=memoria_pila.buf)
+        pila[:] = images_array
+        salida = np.ndarray((2,) + images_array.shape[1:], dtype=np.float32, buffer=memoria_salida.buf)
+        salida[:] = np.nan
+
+        bloques = [(inicio, min(inicio + filas_por_bloque, filas)) for inicio in range(0, filas, filas_por_bloque)]
+        argumentos = (
+            memoria_pila.name, images_array.shape, images_array.dtype.str, memoria_salida.name,
+            list(TE_values), metodo_bloque, opciones,
+        )
+        filas_hechas = 0
+        with ProcessPoolExecutor(max_workers=n_procesos, initializer=_inicializar_trabajador,
+                                 initargs=argumentos) as pool:
+            tareas = [pool.submit(_ajustar_bloque, inicio, fin) for inicio, fin in bloques]
+            for tarea in as_completed(tareas):
+                filas_hechas += tarea.result()
+                if progreso is not None:
+                    progreso(filas_hechas, filas)
+
+        T2_map = salida[0].copy()
+        S0_map = salida[1].copy()
+        del pila, salida
+    finally:
+        memoria_pila.close()
+        memoria_pila.unlink()
+        memoria_salida.close()
+        memoria_salida.unlink()
+
+    return T2_map, S0_map
@@ -0,0 +1,387 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+from T2_ajuste import METODOS_AJUSTE, UMBRAL_SENAL, mascara_validez
+from T2_instrumentacion import RegistroEjecucion, contar_pixeles, etapa, imprimir_progreso, progreso_de
+
+# Ventana de cuantización por defecto (ms) y valor máximo almacenado en los mapas uint16
+VENTANA_POR_DEFECTO = (10, 200)
+ESCALA_UINT16 = 65535
+
+
+def cargar_serie(dicom_folder, registro=None, serie=None):
+    """
+    Carga la adquisición multieco de una carpeta (la serie indicada o la mayoritaria).
+
+    Returns:
+        tuple: (volumen, TE_values, referencias), como cargar_volumen_multieco.
+    """
+    from T2_volumen import cargar_volumen_multieco
+    return cargar_volumen_multieco(dicom_folder, registro=registro, serie=serie)
+
+
+def enmascarar(primer_eco, metodo="otsu", registro=None):
+    """
+    Máscara de tejido del primer eco (ver T2_mascara.mascara_tejido), medida como etapa propia.
+
+    Returns:
+        np.ndarray: Máscara booleana con forma (corte, fila, columna).
+    """
+    from T2_mascara import mascara_tejido
+
+    with etapa(registro, "enmascarado", primer_eco.size):
+        tejido = mascara_tejido(primer_eco, metodo)
+    if registro is not None:
+        registro.contar(tejido=tejido.sum())
+    print(f"Máscara de tejido ({metodo}): {100 * tejido.mean():.1f}% de los píxeles")
+    return tejido
+
+
+def ajustar(volumen, TE_values, metodo="lm", registro=None, mascara=None, **opciones):
+    """
+    Ajusta T2 y S0 en todos los cortes del volumen y cuenta los píxeles ajustados, enmascarados y fallidos.
+
+    Con mascara (corte, fila, columna), solo los píxeles de la máscara llegan al motor.
+
+    Returns:
+        tuple: (T2_vol, S0_vol) con forma (corte, fila, columna).
+    """
+    from T2_volumen import ajustar_volumen_T2
+
+    n_pixeles = volumen.shape[0] * volumen.shape[2] * volumen.shape[3]
+    progreso = progreso_de(registro, "ajuste")
+    if progreso is not None:
+        opciones["progreso"] = progreso
+    with etapa(registro, "ajuste", n_pixeles):
+        T2_vol, S0_vol = ajustar_volumen_T2(volumen, TE_values, metodo=metodo, mascara=mascara, **opciones)
+    if registro is not None:
+        registro.contar(**contar_pixeles(T2_vol, volumen, opciones.get("umbral", UMBRAL_SENAL), mascara))
+    return T2_vol, S0_vol
+
+
+def _huella_corte(metodo, TE_values, serie, mascara_corte, opciones):
+    """Parámetros que determinan el ajuste de un corte, como texto para guardarlo en su punto de control."""
+    huella = {
+        "metodo": metodo,
+        "TE": [float(TE) for TE in TE_values],
+        "umbral": float(opciones.get("umbral", UMBRAL_SENAL)),
+        "serie": serie,
+        "mascara": hashlib.sha1(np.packbits(mascara_corte)).hexdigest() if mascara_corte is not None else None,
+        "opciones": {nombre: valor for nombre, valor in opciones.items() if nombre != "umbral"},
+    }
+    return json.dumps(huella, sort_keys=True, default=str)
+
+
+def ajustar_por_cortes(volumen, TE_values, carpeta_control, metodo="lm", registro=None, mascara=None, serie=None,
+                       **opciones):
+    """
+    Ajusta el volumen corte a corte guardando cada corte terminado como punto de control.
+
+    Los cortes cuyo punto de control ya existe en carpeta_control se cargan en lugar de
+    ajustarse, de modo que una ejecución interrumpida continúa donde se quedó. Cada
+    archivo se escribe con un nombre temporal y se renombra al terminar, así que un
+    corte a medio guardar nunca se toma por válido. Cada punto de control guarda los
+    parámetros del ajuste (método, TE, umbral, serie, máscara y opciones del motor); si
+    no coinciden con los de la ejecución actual, se descarta y el corte se ajusta de nuevo.
+
+    Returns:
+        tuple: (T2_vol, S0_vol) con forma (corte, fila, columna).
+    """
+    os.makedirs(carpeta_control, exist_ok=True)
+    n_cortes = volumen.shape[0]
+    T2_vol = np.empty((n_cortes,) + volumen.shape[2:], dtype=np.float32)
+    S0_vol = np.empty_like(T2_vol)
+    for k in range(n_cortes):
+        mascara_corte = mascara[k:k + 1] if mascara is not None else None
+        huella = _huella_corte(metodo, TE_values, serie, mascara_corte, opciones)
+        ruta = os.path.join(carpeta_control, f"corte_{k:04d}.npz")
+        reanudado = False
+        if os.path.exists(ruta):
+            with np.load(ruta) as guardado:
+                reanudado = "parametros" in guardado and str(guardado["parametros"]) == huella
+                if reanudado:
+                    T2_vol[k], S0_vol[k] = guardado["T2"], guardado["S0"]
+            if not reanudado:
+                # Punto de control de otra ejecución (otro método, serie o máscara)
+                os.remove(ruta)
+                if registro is not None:
+                    registro.contar(cortes_descartados=1)
+        if reanudado:
+            if registro is not None:
+                registro.contar(cortes_reanudados=1, **contar_pixeles(T2_vol[k:k + 1], volumen[k:k + 1],
+                                                                      opciones.get("umbral", UMBRAL_SENAL),
+                                                                      mascara_corte))
+            continue
+        T2_vol[k], S0_vol[k] = ajustar(volumen[k:k + 1], TE_values, metodo, registro, mascara_corte, **opciones)
+        temporal = os.path.join(carpeta_control, f"corte_{k:04d}.tmp.npz")
+        np.savez(temporal, T2=T2_vol[k], S0=S0_vol[k], parametros=huella)
+        os.replace(temporal, ruta)
+    return T2_vol, S0_vol
+
+
+def cuantizar(T2_map, ventana=VENTANA_POR_DEFECTO, escala=ESCALA_UINT16, registro=None):
+    """
+    Lleva el mapa T2 a enteros sin signo dentro de una ventana; los NaN se guardan como 0.
+
+    El 0 queda reservado para los NaN: la ventana se lleva a 1..escala, de modo que los
+    vóxeles válidos recortados al mínimo de la ventana no se confunden con el fondo.
+
+    Parameters:
+        T2_map (np.ndarray): Mapa T2 en ms.
+        ventana (tuple): (mínimo, máximo) en ms, o None para usar los percentiles 1 y 99 del mapa.
+        escala (int): Valor almacenado que corresponde al máximo de la ventana (el mínimo es 1).
+
+    Returns:
+        tuple: (mapa uint16, pendiente, ordenada), donde valor_ms = almacenado * pendiente + ordenada.
+    """
+    with etapa(registro, "cuantizacion", T2_map.size):
+        if ventana is None:
+            window_min, window_max = np.nanpercentile(T2_map, 1), np.nanpercentile(T2_map, 99)
+        else:
+            window_min, window_max = ventana
+        pendiente = max(float(window_max - window_min), 1e-6) / (escala - 1)
+        T2_map_clipped = np.clip(T2_map, window_min, window_max)
+        T2_map_normalized = (T2_map_clipped - window_min) / pendiente + 1
+        T2_uint16 = np.nan_to_num(T2_map_normalized, nan=0).astype(np.uint16)
+    return T2_uint16, pendiente, float(window_min) - pendiente
+
+
+def guardar_histograma(T2_map, ruta, bins=100, conteos=None):
+    """
+    Guarda el histograma de los valores T2 válidos como imagen, sin necesidad de pantalla.
+
+    Con conteos=(conteos, bordes) se dibuja un histograma ya calculado (p. ej. por
+    bloques sobre un mapa en disco) y T2_map no se usa.
+    """
+    import matplotlib
+    if "matplotlib.pyplot" not in sys.modules:
+        # Sin una interfaz ya abierta se usa un backend que no necesita pantalla
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    if conteos is None:
+        conteos = np.histogram(T2_map[np.isfinite(T2_map)], bins=bins)
+    conteos, bordes = conteos
+    plt.figure(figsize=(6, 5))
+    plt.hist(bordes[:-1], bins=bordes, weights=conteos, color='blue', alpha=0.7)
+    plt.title('Histograma de valores T2')
+    plt.xlabel('Tiempo T2 (ms)')
+    plt.ylabel('Frecuencia')
+    plt.savefig(ruta, dpi=300)
+    plt.close()
+    return ruta
+
+
+def escribir(T2_uint16, referencias, output_folder, pendiente=None, ordenada=None, registro=None, **opciones):
+    """
+    Escribe la serie DICOM del mapa T2 (un archivo por corte).
+
+    Returns:
+        list: Rutas de los archivos escritos.
+    """
+    from T2_volumen import guardar_volumen_dicom
+
+    with etapa(registro, "escritura", len(referencias)):
+        return guardar_volumen_dicom(T2_uint16, referencias, output_folder, pendiente=pendiente, ordenada=ordenada,
+                                     progreso=progreso_de(registro, "escritura"), **opciones)
+
+
+def mapear_T2(dicom_folder, output_folder=None, metodo="lm", ventana=VENTANA_POR_DEFECTO, escala=ESCALA_UINT16,
+              reescalar=False, histograma=True, informe=True, progreso=imprimir_progreso, medir_memoria=False,
+              registro=None, serie=None, carpeta_control=None, fuera_de_memoria=False, carpeta_temporal=None,
+              pixeles_por_bloque=None, multiparametrico=False, mascara_tejido=None, **opciones):
+    """
+    Mapeo T2 completo sin interfaz: carga la serie, ajusta, cuantiza y escribe los resultados.
+
+    Parameters:
+        dicom_folder (str): Carpeta con la adquisición multieco.
+        output_folder (str): Carpeta de salida; por defecto, la de origen.
+        metodo (str): Motor de ajuste de T2_ajuste.
+        ventana (tuple): Ventana de cuantización en ms, o None para los percentiles 1 y 99.
+        escala (int): Valor almacenado para el máximo de la ventana (65535, o 4096 como el script V2).
+        reescalar (bool): Escribe RescaleSlope/RescaleIntercept para recuperar los ms.
+        histograma (bool): Guarda histograma_T2.jpg en la carpeta de salida.
+        informe (bool): Guarda el informe de la ejecución en informe_T2.json.
+        progreso (callable): Callback progreso(etapa, hechos, totales) del registro.
+        medir_memoria (bool): Mide el pico de memoria de cada etapa con tracemalloc (lento).
+        registro (RegistroEjecucion): Registro existente; por defecto se crea uno.
+        serie (str): SeriesInstanceUID que se procesa; por defecto, la serie mayoritaria de la carpeta.
+        carpeta_control (str): Si se indica, el ajuste se hace corte a corte con puntos de control
+            en esta carpeta (ver ajustar_por_cortes), que se borra al terminar.
+        fuera_de_memoria (bool): Vuelca la pila de ecos a un archivo mapeado en memoria y la ajusta
+            por bloques (ver T2_memmap); T2_map.npy y S0_map.npy quedan en la carpeta de salida.
+        carpeta_temporal (str): Carpeta de la pila de trabajo; por defecto, la de salida.
+        pixeles_por_bloque (int): Píxeles por bloque en el modo fuera de memoria.
+        multiparametrico (bool): En lugar de la serie T2_map, escribe T2_parametros.dcm: un único
+            DICOM Enhanced MR multiframe con T2, S0, R², residuo y máscara de validez, con valores
+            físicos recuperables (ver T2_volumen.guardar_multiparametrico_dicom).
+        mascara_tejido (str): "otsu" o "percentil" para ajustar solo el tejido segmentado en el
+            primer eco (ver T2_mascara.mascara_tejido); None ajusta todos los píxeles con señal.
+        **opciones: Argumentos adicionales para el motor de ajuste.
+
+    Returns:
+        dict: Mapas T2/S0, rutas escritas, ventana usada y registro de la ejecución.
+
+    Raises:
+        ValueError: Si la carpeta no contiene una adquisición válida o ningún píxel se pudo ajustar.
+    """
+    from T2_volumen import guardar_multiparametrico_dicom, mapas_calidad
+
+    output_folder = output_folder or dicom_folder
+    os.makedirs(output_folder, exist_ok=True)
+    if registro is None:
+        registro = RegistroEjecucion(progreso=progreso, medir_memoria=medir_memoria, dicom_folder=dicom_folder,
+                                     output_folder=output_folder, metodo=metodo)
+    resultado = {"registro": registro, "rutas": [], "histograma": None, "informe": None}
+    temporales = []
+    try:
+        if fuera_de_memoria:
+            from T2_memmap import (PIXELES_POR_BLOQUE, ajustar_por_bloques, cuantizar_por_bloques,
+                                   histograma_por_bloques, percentiles_por_bloques, volcar_pila)
+            pixeles_por_bloque = pixeles_por_bloque or PIXELES_POR_BLOQUE
+            carpeta_temporal = carpeta_temporal or output_folder
+            os.makedirs(carpeta_temporal, exist_ok=True)
+            temporales = [os.path.join(carpeta_temporal, "pila_ecos.tmp.npy"),
+                          os.path.join(carpeta_temporal, "T2_map_uint16.tmp.npy")]
+
+            pila, forma, TE_values, referencias = volcar_pila(dicom_folder, temporales[0], registro, serie)
+            print(f"Se leyeron {forma[0]} cortes con {len(TE_values)} ecos cada uno.")
+            tejido = None
+            if mascara_tejido is not None:
+                tejido = enmascarar(np.asarray(pila[:, 0]).reshape(forma), mascara_tejido, registro)
+            print(f"Comenzando el ajuste exponencial por bloques ({metodo})...")
+            mapas = ajustar_por_bloques(pila, forma, TE_values, output_folder, metodo, pixeles_por_bloque, registro,
+                                        calidad=multiparametrico, mascara=tejido, **opciones)
+            T2_vol, S0_vol = mapas[:2]
+            if multiparametrico:
+                R2_vol, residuo_vol = mapas[2:]
+            del pila, mapas
+        else:
+            volumen, TE_values, referencias = cargar_serie(dicom_folder, registro, serie)
+            print(f"Se leyeron {volumen.shape[0]} cortes con {len(TE_values)} ecos cada uno.")
+            tejido = None
+            if mascara_tejido is not None:
+                tejido = enmascarar(volumen[:, 0], mascara_tejido, registro)
+
+            print(f"Comenzando el ajuste exponencial ({metodo})...")
+            if carpeta_control is None:
+                T2_vol, S0_vol = ajustar(volumen, TE_values, metodo, registro, tejido, **opciones)
+            else:
+                if serie is None:
+                    import pydicom
+                    serie = str(pydicom.dcmread(referencias[0], stop_before_pixels=True).SeriesInstanceUID)
+                T2_vol, S0_vol = ajustar_por_cortes(volumen, TE_values, carpeta_control, metodo, registro, tejido,
+                                                    serie, **opciones)
+            if multiparametrico:
+                # La calidad se evalúa con los mismos ecos y mapas, sin repetir el ajuste
+                with etapa(registro, "calidad", T2_vol.size):
+                    R2_vol, residuo_vol, _ = mapas_calidad(volumen, TE_values, T2_vol, S0_vol)
+            del volumen
+        resultado["T2"], resultado["S0"] = T2_vol, S0_vol
+
+        if fuera_de_memoria:
+            # Percentiles, cuantización e histograma recorren el mapa en disco por bloques
+            minimo, p1, p99, maximo = percentiles_por_bloques(T2_vol, [0, 1, 99, 100], pixeles_por_bloque)
+            if np.isnan(minimo):
+                raise ValueError("Todos los valores del mapa T2 son NaN.")
+            conteos = histograma_por_bloques(T2_vol, 100, (minimo, maximo), pixeles_por_bloque)
+            if not multiparametrico:
+                window_min, window_max = (p1, p99) if ventana is None else ventana
+                T2_uint16, pendiente, ordenada = cuantizar_por_bloques(T2_vol, temporales[1], window_min, window_max,
+                                                                       escala, pixeles_por_bloque, registro)
+        else:
+            if np.isnan(T2_vol).all():
+                raise ValueError("Todos los valores del mapa T2 son NaN.")
+            conteos = None
+            if not multiparametrico:
+                T2_uint16, pendiente, ordenada = cuantizar(T2_vol, ventana, escala, registro)
+        if not multiparametrico:
+            resultado["ventana"] = (ordenada + pendiente, ordenada + pendiente * escala)
+            print(f"Ventana de T2: {resultado['ventana'][0]:.2f} - {resultado['ventana'][1]:.2f} ms")
+
+        if histograma:
+            with etapa(registro, "escritura"):
+                resultado["histograma"] = guardar_histograma(T2_vol, os.path.join(output_folder, "histograma_T2.jpg"),
+                                                             conteos=conteos)
+            print(f"Histograma guardado en: {resultado['histograma']}")
+
+        if multiparametrico:
+            validez = mascara_validez(T2_vol, S0_vol)
+            registro.contar(validos=validez.sum())
+            mapas = {"T2": T2_vol, "S0": S0_vol, "R2": R2_vol, "residuo": residuo_vol, "validez": validez}
+            with etapa(registro, "escritura", 1):
+                resultado["rutas"] = [guardar_multiparametrico_dicom(
+                    mapas, referencias, os.path.join(output_folder, "T2_parametros.dcm"))]
+            print(f"Mapas T2, S0, R², residuo y validez guardados en: {resultado['rutas'][0]}")
+        else:
+            if not reescalar:
+                pendiente = ordenada = None
+            resultado["rutas"] = escribir(T2_uint16, referencias, output_folder, pendiente, ordenada, registro)
+            print(f"Mapa T2 guardado en: {', '.join(resultado['rutas'])}")
+        if carpeta_control is not None:
+            shutil.rmtree(carpeta_control, ignore_errors=True)
+    except Exception as e:
+        registro.terminar(error=e)
+        raise
+    else:
+        registro.terminar()
+    finally:
+        # Se suelta el mapeo antes de borrar la pila de trabajo (en Windows no se borra un archivo mapeado)
+        T2_uint16 = None
+        for ruta in temporales:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        if informe:
+            resultado["informe"] = registro.guardar_json(os.path.join(output_folder, "informe_T2.json"))
+    return resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mapeo T2 de una adquisición DICOM multieco, sin interfaz gráfica.")
+    parser.add_argument("dicom_folder", help="Carpeta con la adquisición multieco")
+    parser.add_argument("-o", "--salida", default=None, help="Carpeta de salida (por defecto, la de origen)")
+    parser.add_argument("-m", "--metodo", default="lm", choices=sorted(METODOS_AJUSTE), help="Motor de ajuste")
+    parser.add_argument("--ventana", nargs=2, type=float, default=VENTANA_POR_DEFECTO, metavar=("MIN", "MAX"),
+                        help="Ventana de cuantización en ms")
+    parser.add_argument("--percentiles", action="store_true", help="Usa los percentiles 1 y 99 como ventana")
+    parser.add_argument("--escala", type=int, default=ESCALA_UINT16, help="Valor almacenado para el máximo")
+    parser.add_argument("--reescalar", action="store_true", help="Escribe RescaleSlope/RescaleIntercept en ms")
+    parser.add_argument("--sin-histograma", action="store_true", help="No guarda histograma_T2.jpg")
+    parser.add_argument("--sin-informe", action="store_true", help="No guarda informe_T2.json")
+    parser.add_argument("--silencioso", action="store_true", help="No muestra el progreso")
+    parser.add_argument("--medir-memoria", action="store_true", help="Mide el pico de memoria por etapa (lento)")
+    parser.add_argument("--fuera-de-memoria", action="store_true",
+                        help="Ajusta por bloques desde una pila en disco (volúmenes que no caben en memoria)")
+    parser.add_argument("--temporal", default=None, help="Carpeta de la pila de trabajo del modo fuera de memoria")
+    parser.add_argument("--pixeles-por-bloque", type=int, default=None)
+    parser.add_argument("--multiparametrico", action="store_true",
+                        help="Guarda T2, S0, R², residuo y validez en un único DICOM multiframe")
+    parser.add_argument("--mascara-tejido", default=None, choices=("otsu", "percentil"),
+                        help="Ajusta solo el tejido segmentado en el primer eco")
+    args = parser.parse_args(argv)
+
+    try:
+        resultado = mapear_T2(args.dicom_folder, args.salida, metodo=args.metodo,
+                              ventana=None if args.percentiles else tuple(args.ventana), escala=args.escala,
+                              reescalar=args.reescalar, histograma=not args.sin_histograma,
+                              informe=not args.sin_informe, progreso=None if args.silencioso else imprimir_progreso,
+                              medir_memoria=args.medir_memoria, fuera_de_memoria=args.fuera_de_memoria,
+                              carpeta_temporal=args.temporal, pixeles_por_bloque=args.pixeles_por_bloque,
+                              multiparametrico=args.multiparametrico, mascara_tejido=args.mascara_tejido)
+    except ValueError as e:
+        print(e)
+        return 1
+    print(resultado["registro"].resumen())
+    if resultado["informe"]:
+        print(f"Informe de la ejecución guardado en: {resultado['informe']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,482 @@
+import datetime
+import io
+import os
+
+import numpy as np
+
+from T2_ajuste import ajustar_mapa_T2, calidad_ajuste, mascara_validez
+from T2_instrumentacion import etapa, progreso_de
+
+
+def _posicion_corte(ds):
+    """
+    Devuelve la posición del corte a lo largo de la normal al plano de la imagen.
+
+    Usa ImagePositionPatient proyectada sobre la normal de ImageOrientationPatient y,
+    si faltan, SliceLocation. Sin ninguna de las dos se asume un único corte.
+    """
+    posicion = ds.get("ImagePositionPatient")
+    orientacion = ds.get("ImageOrientationPatient")
+    if posicion is not None and orientacion is not None:
+        fila = np.array(orientacion[:3], dtype=np.float64)
+        columna = np.array(orientacion[3:], dtype=np.float64)
+        normal = np.cross(fila, columna)
+        return round(float(np.dot(normal, np.array(posicion, dtype=np.float64))), 2)
+    if posicion is not None:
+        return round(float(posicion[2]), 2)
+    if "SliceLocation" in ds:
+        return round(float(ds.SliceLocation), 2)
+    return 0.0
+
+
+def leer_cabeceras(dicom_folder):
+    """
+    Lee solo las cabeceras de los archivos DICOM de una carpeta.
+
+    Parameters:
+        dicom_folder (str): Ruta de la carpeta con archivos DICOM.
+
+    Returns:
+        list: Lista de tuplas (ruta, posición del corte, tiempo de eco en ms, SeriesInstanceUID).
+    """
+    # pydicom se importa al usarse: así importar este módulo (y la CLI) es rápido
+    import pydicom
+
+    cabeceras = []
+    for archivo in sorted(os.listdir(dicom_folder)):
+        if not archivo.lower().endswith(".dcm"):
+            continue
+        ruta = os.path.join(dicom_folder, archivo)
+        try:
+            ds = pydicom.dcmread(ruta, stop_before_pixels=True)
+            TE = round(float(ds[0x0018, 0x0081].value), 3)  # Echo Time (TE)
+        except Exception as e:
+            print(f"Error leyendo la cabecera de {ruta}: {e}")
+            continue
+        cabeceras.append((ruta, _posicion_corte(ds), TE, ds.get("SeriesInstanceUID", "")))
+    return cabeceras
+
+
+def agrupar_serie(dicom_folder, registro=None, serie=None):
+    """
+    Agrupa los archivos de una adquisición multieco por corte y tiempo de eco a partir de las cabeceras.
+
+    Parameters:
+        dicom_folder (str): Ruta de la carpeta con la adquisición multieco.
+        registro (RegistroEjecucion): Registro opcional donde se mide la etapa de escaneo.
+        serie (str): SeriesInstanceUID que se agrupa; por defecto, la serie con más imágenes.
+
+    Returns:
+        tuple: (número de cortes, TE_values, rutas) donde rutas[k, e] es el archivo del
+        corte k y el eco e, con los cortes ordenados por posición.
+
+    Raises:
+        ValueError: Si no hay archivos DICOM, la serie no existe o falta algún eco.
+    """
+    with etapa(registro, "escaneo"):
+        cabeceras = leer_cabeceras(dicom_folder)
+    if registro is not None:
+        registro.contar(archivos=len(cabeceras))
+    if not cabeceras:
+        raise ValueError(f"No se encontraron archivos DICOM en {dicom_folder}")
+
+    # Si la carpeta contiene otras series (p. ej. un T2_map.dcm generado antes) se usa la mayoritaria
+    series = [uid for *_, uid in cabeceras]
+    if serie is not None:
+        if serie not in series:
+            raise ValueError(f"La serie {serie} no está en {dicom_folder}")
+        serie_principal = serie
+    else:
+        serie_principal = max(set(series), key=series.count)
+        if len(set(series)) > 1:
+            print(f"La carpeta contiene {len(set(series))} series; se usa la que tiene más imágenes.")
+    cabeceras = [(ruta, posicion, TE) for ruta, posicion, TE, uid in cabeceras if uid == serie_principal]
+
+    posiciones = sorted({posicion for _, posicion, _ in cabeceras})
+    TE_values = sorted({TE for _, _, TE in cabeceras})
+    indice_corte = {posicion: k for k, posicion in enumerate(posiciones)}
+    indice_eco = {TE: e for e, TE in enumerate(TE_values)}
+
+    rutas = {}
+    for ruta, posicion, TE in cabeceras:
+        clave = (indice_corte[posicion], indice_eco[TE])
+        if clave in rutas:
+            print(f"Imagen duplicada para el corte {posicion} y TE {TE} ms, se ignora: {ruta}")
+            continue
+        rutas[clave] = ruta
+
+    for k, posicion in enumerate(posiciones):
+        for e, TE in enumerate(TE_values):
+            if (k, e) not in rutas:
+                raise ValueError(f"Falta el eco TE={TE} ms en el corte {posicion}")
+    return len(posiciones), TE_values, rutas
+
+
+def cargar_volumen_multieco(dicom_folder, registro=None, serie=None):
+    """
+    Construye un volumen multieco (corte, eco, fila, columna) agrupando por posición y TE.
+
+    Los archivos se agrupan a partir de las cabeceras, de modo que el orden de los
+    nombres de archivo no influye, y los píxeles se decodifican directamente en su
+    lugar dentro del volumen.
+
+    Parameters:
+        dicom_folder (str): Ruta de la carpeta con la adquisición multieco.
+        registro (RegistroEjecucion): Registro opcional donde se miden las etapas de
+            escaneo y decodificación.
+        serie (str): SeriesInstanceUID que se carga; por defecto, la serie con más imágenes.
+
+    Returns:
+        tuple: (volumen, TE_values, referencias) donde referencias contiene, para cada
+        corte, la ruta del archivo del primer eco.
+    """
+    n_cortes, TE_values, rutas = agrupar_serie(dicom_folder, registro, serie)
+
+    import pydicom
+
+    volumen = None
+    n_archivos = n_cortes * len(TE_values)
+    progreso = progreso_de(registro, "decodificacion")
+    with etapa(registro, "decodificacion", n_archivos):
+        for k in range(n_cortes):
+            for e in range(len(TE_values)):
+                pixeles = pydicom.dcmread(rutas[k, e]).pixel_array
+                if volumen is None:
+                    volumen = np.empty((n_cortes, len(TE_values)) + pixeles.shape, dtype=pixeles.dtype)
+                volumen[k, e] = pixeles
+                if progreso is not None:
+                    progreso(k * len(TE_values) + e + 1, n_archivos)
+
+    referencias = [rutas[k, 0] for k in range(n_cortes)]
+    return volumen, TE_values, referencias
+
+
+def ajustar_volumen_T2(volumen, TE_values, metodo="lm", mascara=None, **opciones):
+    """
+    Ajusta todos los cortes de un volumen multieco en una sola pasada.
+
+    Parameters:
+        volumen (np.ndarray): Volumen con forma (corte, eco, fila, columna).
+        TE_values (list): Tiempos de eco en ms.
+        metodo (str): Motor de ajuste de T2_ajuste.
+        mascara (np.ndarray): Máscara (corte, fila, columna) de los píxeles que se ajustan (opcional).
+        **opciones: Argumentos adicionales para el motor.
+
+    Returns:
+        tuple: (T2_vol, S0_vol) con forma (corte, fila, columna).
+    """
+    n_cortes, n_ecos, filas, columnas = volumen.shape
+    # Los cortes se apilan como filas para que también sirvan los motores 2D
+    pila = volumen.transpose(1, 0, 2, 3).reshape(n_ecos, n_cortes * filas, columnas)
+    if mascara is not None:
+        mascara = np.asarray(mascara).reshape(n_cortes * filas, columnas)
+    T2_map, S0_map = ajustar_mapa_T2(pila, TE_values, metodo=metodo, mascara=mascara, **opciones)
+    return T2_map.reshape(n_cortes, filas, columnas), S0_map.reshape(n_cortes, filas, columnas)
+
+
+def mapas_calidad(volumen, TE_values, T2_vol, S0_vol):
+    """
+    R², residuo RMS y máscara de validez de un volumen ya ajustado, corte a corte.
+
+    Returns:
+        tuple: (R2_vol, residuo_vol, validez_vol) con forma (corte, fila, columna).
+    """
+    R2_vol = np.empty(T2_vol.shape, dtype=np.float32)
+    residuo_vol = np.empty(T2_vol.shape, dtype=np.float32)
+    for k in range(volumen.shape[0]):
+        R2_vol[k], residuo_vol[k] = calidad_ajuste(volumen[k], TE_values, T2_vol[k], S0_vol[k])
+    return R2_vol, residuo_vol, mascara_validez(T2_vol, S0_vol)
+
+
+def guardar_volumen_dicom(volumen_uint16, referencias, output_folder, nombre_base="T2_map",
+                          pendiente=None, ordenada=None, descripcion=None, progreso=None):
+    """
+    Guarda un volumen uint16 como una serie DICOM, un archivo por corte.
+
+    Cada corte hereda la cabecera del primer eco de su posición. Todos los cortes
+    comparten un SeriesInstanceUID nuevo. Con un único corte el archivo se llama
+    nombre_base.dcm, como en los scripts originales.
+
+    Parameters:
+        volumen_uint16 (np.ndarray): Mapas cuantizados con forma (corte, fila, columna).
+        referencias (list): Ruta del DICOM de referencia para cada corte.
+        output_folder (str): Carpeta de salida.
+        nombre_base (str): Prefijo de los archivos generados.
+        pendiente (float): RescaleSlope que devuelve los valores reales (opcional).
+        ordenada (float): RescaleIntercept que devuelve los valores reales (opcional).
+        descripcion (str): SeriesDescription de la nueva serie (opcional).
+        progreso (callable): Función opcional progreso(cortes_escritos, cortes_totales).
+
+    Returns:
+        list: Rutas de los archivos escritos.
+    """
+    import pydicom
+
+    serie_uid = pydicom.uid.generate_uid()
+    rutas_salida = []
+    for k, (mapa, ref_dicom_path) in enumerate(zip(volumen_uint16, referencias)):
+        new_ds = pydicom.dcmread(ref_dicom_path)
+
+        if new_ds.file_meta.TransferSyntaxUID not in [
+            pydicom.uid.ExplicitVRLittleEndian, pydicom.uid.ImplicitVRLittleEndian
+        ]:
+            new_ds.file_meta.TransferSyntaxUID = pydicom.uid.ExplicitVRLittleEndian
+
+        new_ds.SeriesInstanceUID = serie_uid
+        new_ds.SOPInstanceUID = pydicom.uid.generate_uid()
+        new_ds.file_meta.MediaStorageSOPInstanceUID = new_ds.SOPInstanceUID
+        new_ds.InstanceNumber = k + 1
+
+        new_ds.PixelData = np.ascontiguousarray(mapa, dtype=np.uint16).tobytes()
+        new_ds.Rows, new_ds.Columns = mapa.shape
+        new_ds.SamplesPerPixel = 1
+        new_ds.PhotometricInterpretation = "MONOCHROME2"
+        new_ds.BitsAllocated = 16
+        new_ds.BitsStored = 16
+        new_ds.HighBit = 15
+        new_ds.PixelRepresentation = 0
+        if pendiente is not None or ordenada is not None:
+            new_ds.RescaleSlope = f"{pendiente if pendiente is not None else 1:.10g}"
+            new_ds.RescaleIntercept = f"{ordenada if ordenada is not None else 0:.10g}"
+        if descripcion is not None:
+            new_ds.SeriesDescription = descripcion
+
+        if len(referencias) == 1:
+            nombre = f"{nombre_base}.dcm"
+        else:
+            nombre = f"{nombre_base}_{k + 1:03d}.dcm"
+        output_dicom_path = os.path.join(output_folder, nombre)
+        pydicom.dcmwrite(output_dicom_path, new_ds)
+        rutas_salida.append(output_dicom_path)
+        if progreso is not None:
+            progreso(k + 1, len(referencias))
+    return rutas_salida
+
+
+# Unidades UCUM de los parámetros del archivo multiparamétrico: (código, significado)
+UNIDADES_PARAMETROS = {
+    "T2": ("ms", "millisecond"),
+    "S0": ("1", "no units"),
+    "R2": ("1", "no units"),
+    "residuo": ("1", "no units"),
+    "validez": ("1", "no units"),
+}
+
+# Atributos de paciente, estudio y equipo que el archivo multiparamétrico copia de la referencia
+_ATRIBUTOS_REFERENCIA = [
+    "PatientName", "PatientID", "PatientBirthDate", "PatientSex", "PatientAge", "PatientWeight",
+    "StudyInstanceUID", "StudyDate", "StudyTime", "StudyID", "AccessionNumber", "ReferringPhysicianName",
+    "StudyDescription", "FrameOfReferenceUID", "PositionReferenceIndicator", "Manufacturer",
+    "ManufacturerModelName", "DeviceSerialNumber", "InstitutionName", "MagneticFieldStrength", "BodyPartExamined",
+]
+
+
+def _cuantizar_parametro(valores):
+    """
+    Cuantiza un mapa a uint16 reservando el 0 para los píxeles sin valor (NaN).
+
+    Returns:
+        tuple: (almacenados uint16, pendiente, ordenada) con valor = almacenado * pendiente + ordenada.
+    """
+    finitos = np.isfinite(valores)
+    if not finitos.any():
+        return np.zeros(valores.shape, dtype=np.uint16), 1.0, 0.0
+    minimo, maximo = float(np.min(valores[finitos])), float(np.max(valores[finitos]))
+    pendiente = (maximo - minimo) / 65534 if maximo > minimo else 1.0
+    ordenada = minimo - pendiente
+    with np.errstate(invalid="ignore"):
+        almacenados = np.where(finitos, np.round((valores - ordenada) / pendiente), 0)
+    return np.clip(almacenados, 0, 65535).astype(np.uint16), pendiente, ordenada
+
+
+def guardar_multiparametrico_dicom(mapas, referencias, ruta_salida, descripcion="Mapas T2 multiparamétricos"):
+    """
+    Guarda varios mapas de un volumen en un único DICOM Enhanced MR multiframe.
+
+    Cada par (parámetro, corte) es un frame. Los frames llevan su propio
+    RescaleSlope/RescaleIntercept (Pixel Value Transformation) y un Real World Value
+    Mapping con las unidades, de modo que los valores físicos (ms para T2) se
+    recuperan exactamente hasta la resolución de 16 bits del rango de cada parámetro.
+    El valor almacenado 0 se reserva para los píxeles sin ajuste. La máscara de
+    validez ('validez') se guarda sin reescalar (0/1).
+
+    Todo el archivo se compone en memoria y se escribe al disco de una sola vez.
+
+    Parameters:
+        mapas (dict): Nombre del parámetro -> volumen (corte, fila, columna), en orden de escritura.
+        referencias (list): Ruta del DICOM de referencia de cada corte (primer eco).
+        ruta_salida (str): Archivo .dcm de salida.
+        descripcion (str): SeriesDescription del nuevo archivo.
+
+    Returns:
+        str: Ruta del archivo escrito.
+    """
+    import pydicom
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.sequence import Sequence
+    from pydicom.uid import EnhancedMRImageStorage, ExplicitVRLittleEndian, generate_uid
+
+    cabeceras = [pydicom.dcmread(ruta, stop_before_pixels=True) for ruta in referencias]
+    ref = cabeceras[0]
+    nombres = list(mapas)
+    n_cortes, filas, columnas = np.shape(mapas[nombres[0]])
+
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.MediaStorageSOPClassUID = EnhancedMRImageStorage
+    ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    for atributo in _ATRIBUTOS_REFERENCIA:
+        if atributo in ref:
+            setattr(ds, atributo, ref.data_element(atributo).value)
+
+    ahora = datetime.datetime.now()
+    ds.SOPClassUID = EnhancedMRImageStorage
+    ds.SOPInstanceUID = generate_uid()
+    ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+    ds.SeriesInstanceUID = generate_uid()
+    ds.Modality = "MR"
+    ds.SeriesNumber = int(ref.get("SeriesNumber", 0) or 0) + 1000
+    ds.SeriesDescription = descripcion
+    ds.InstanceNumber = 1
+    ds.ContentDate = ds.SeriesDate = ahora.strftime("%Y%m%d")
+    ds.ContentTime = ds.SeriesTime = ahora.strftime("%H%M%S")
+    ds.ImageType = ["DERIVED", "PRIMARY", "T2_MAP", "NONE"]
+    ds.PixelPresentation = "MONOCHROME"
+    ds.VolumetricProperties = "VOLUME"
+    ds.VolumeBasedCalculationTechnique = "NONE"
+    ds.ComplexImageComponent = "MAGNITUDE"
+    ds.AcquisitionContrast = "T2"
+    ds.BurnedInAnnotation = "NO"
+
+    ds.NumberOfFrames = len(nombres) * n_cortes
+    ds.Rows, ds.Columns = filas, columnas
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 0
+
+    # Dimensiones: parámetro (etiqueta del frame) y posición dentro de la pila de cortes
+    organizacion_uid = generate_uid()
+    ds.DimensionOrganizationSequence = Sequence([Dataset()])
+    ds.DimensionOrganizationSequence[0].DimensionOrganizationUID = organizacion_uid
+    dimensiones = []
+    for puntero, descripcion_dimension in ((0x00209453, "Parámetro"), (0x00209057, "Corte")):
+        dimension = Dataset()
+        dimension.DimensionOrganizationUID = organizacion_uid
+        dimension.DimensionIndexPointer = puntero
+        dimension.FunctionalGroupPointer = 0x00209111  # FrameContentSequence
+        dimension.DimensionDescriptionLabel = descripcion_dimension
+        dimensiones.append(dimension)
+    ds.DimensionIndexSequence = Sequence(dimensiones)
+
+    # Geometría común a todos los frames
+    compartido = Dataset()
+    medidas = Dataset()
+    if "PixelSpacing" in ref:
+        medidas.PixelSpacing = ref.PixelSpacing
+    if "SliceThickness" in ref:
+        medidas.SliceThickness = ref.SliceThickness
+    compartido.PixelMeasuresSequence = Sequence([medidas])
+    if "ImageOrientationPatient" in ref:
+        orientacion = Dataset()
+        orientacion.ImageOrientationPatient = ref.ImageOrientationPatient
+        compartido.PlaneOrientationSequence = Sequence([orientacion])
+    ds.SharedFunctionalGroupsSequence = Sequence([compartido])
+
+    pixeles = np.empty((ds.NumberOfFrames, filas, columnas), dtype=np.uint16)
+    por_frame = []
+    for p, nombre in enumerate(nombres):
+        valores = np.asarray(mapas[nombre])
+        if nombre == "validez":
+            almacenados, pendiente, ordenada = valores.astype(np.uint16), 1.0, 0.0
+        else:
+            almacenados, pendiente, ordenada = _cuantizar_parametro(valores.astype(np.float64))
+        codigo, significado = UNIDADES_PARAMETROS.get(nombre, ("1", "no units"))
+
+        for k in range(n_cortes):
+            pixeles[p * n_cortes + k] = almacenados[k]
+            frame = Dataset()
+
+            contenido = Dataset()
+            contenido.FrameLabel = nombre
+            contenido.DimensionIndexValues = [p + 1, k + 1]
+            contenido.StackID = "1"
+            contenido.InStackPositionNumber = k + 1
+            frame.FrameContentSequence = Sequence([contenido])
+
+            if "ImagePositionPatient" in cabeceras[k]:
+                posicion = Dataset()
+                posicion.ImagePositionPatient = cabeceras[k].ImagePositionPatient
+                frame.PlanePositionSequence = Sequence([posicion])
+
+            transformacion = Dataset()
+            transformacion.RescaleSlope = f"{pendiente:.10g}"
+            transformacion.RescaleIntercept = f"{ordenada:.10g}"
+            transformacion.RescaleType = "US"
+            frame.PixelValueTransformationSequence = Sequence([transformacion])
+
+            unidades = Dataset()
+            unidades.CodeValue = codigo
+            unidades.CodingSchemeDesignator = "UCUM"
+            unidades.CodeMeaning = significado
+            mapeo = Dataset()
+            # El 0 almacenado es "sin ajuste" salvo en la validez: no se mapea a un valor físico
+            mapeo.RealWorldValueFirstValueMapped = 0 if nombre == "validez" else 1
+            mapeo.RealWorldValueLastValueMapped = 1 if nombre == "validez" else 65535
+            mapeo.RealWorldValueSlope = pendiente
+            mapeo.RealWorldValueIntercept = ordenada
+            mapeo.LUTExplanation = nombre
+            mapeo.LUTLabel = nombre
+            mapeo.MeasurementUnitsCodeSequence = Sequence([unidades])
+            frame.RealWorldValueMappingSequence = Sequence([mapeo])
+            por_frame.append(frame)
+
+    ds.PerFrameFunctionalGroupsSequence = Sequence(por_frame)
+    ds.PixelData = pixeles.tobytes()
+
+    # Se compone el archivo completo en memoria y se escribe con una única operación secuencial
+    buffer = io.BytesIO()
+    ds.save_as(buffer, enforce_file_format=True)
+    with open(ruta_salida, "wb") as f:
+        f.write(buffer.getbuffer())
+    return ruta_salida
+
+
+def leer_multiparametrico_dicom(ruta):
+    """
+    Lee un DICOM multiparamétrico de guardar_multiparametrico_dicom.
+
+    Returns:
+        dict: Nombre del parámetro -> volumen float32 (corte, fila, columna) en unidades
+        físicas, con NaN en los píxeles sin valor (la máscara de validez se devuelve como bool).
+    """
+    import pydicom
+
+    return mapas_multiparametricos(pydicom.dcmread(ruta))
+
+
+def mapas_multiparametricos(ds):
+    """Como leer_multiparametrico_dicom, para un dataset ya leído."""
+    pixeles = ds.pixel_array.reshape(-1, ds.Rows, ds.Columns)
+    frames = {}
+    for i, frame in enumerate(ds.PerFrameFunctionalGroupsSequence):
+        contenido = frame.FrameContentSequence[0]
+        transformacion = frame.PixelValueTransformationSequence[0]
+        frames.setdefault(contenido.FrameLabel, []).append(
+            (int(contenido.InStackPositionNumber), i, float(transformacion.RescaleSlope),
+             float(transformacion.RescaleIntercept))
+        )
+
+    mapas = {}
+    for nombre, lista in frames.items():
+        lista.sort()
+        almacenados = pixeles[[i for _, i, _, _ in lista]]
+        if nombre == "validez":
+            mapas[nombre] = almacenados.astype(bool)
+            continue
+        pendientes = np.array([pendiente for _, _, pendiente, _ in lista], dtype=np.float32)[:, None, None]
+        ordenadas = np.array([ordenada for _, _, _, ordenada in lista], dtype=np.float32)[:, None, None]
+        mapas[nombre] = np.where(almacenados > 0, almacenados * pendientes + ordenadas, np.nan).astype(np.float32)
+    return mapas
@@ -1,80 +1,68 @@
-import os
-import matplotlib.pyplot as plt
-import pydicom
-import numpy as np
 import tkinter as tk
 from tkinter import Button
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
-# --- Paso 1: Cargar todas las imágenes DICOM de una carpeta ---
-def cargar_imagenes_dicom(dicom_dir):
-    slices = []
-    
-    for f in os.listdir(dicom_dir):
-        if f.endswith(".dcm"):
-            dicom_path = os.path.join(dicom_dir, f)
-            ds = pydicom.dcmread(dicom_path)
-            slices.append(ds)
-    
-    slices.sort(key=lambda x: float(x.ImagePositionPatient[2]))  # Ordenar según la posición en z
-    
-    return slices
+from visor_cortes import VisorCortes, VisorMPR
+from volumen_perezoso import cargar_volumen_perezoso
+
+# --- Paso 1: Preparar el volumen leyendo solo las cabeceras de la carpeta ---
+def cargar_imagenes_dicom(dicom_dir, limite_memoria_mb=512):
+    # Los píxeles se decodifican bajo demanda y se guardan en una caché limitada en memoria
+    return cargar_volumen_perezoso(dicom_dir, limite_memoria_mb=limite_memoria_mb)
 
 # --- Paso 2: Crear un volumen 3D apilando las imágenes ---
 def crear_volumen(slices):
-    # Apilar las imágenes en un volumen 3D (eje z)
-    volumen_3d = np.stack([s.pixel_array for s in slices], axis=-1)
+    # Apilar las imágenes en un volumen 3D contiguo (corte, fila, columna); decodifica todos los cortes
+    volumen_3d = slices.como_array()
     return volumen_3d
 
-# --- Paso 3: Visualizar una "rebanada" del volumen 3D ---
-def visualizar_imagen(volumen_3d, slice_index, canvas, fig, ax):
-    ax.clear()  # Limpiar el eje
-    ax.imshow(volumen_3d[:, :, slice_index], cmap="gray")
-    ax.set_title(f"Slice {slice_index+1}")
-    canvas.draw()
+# --- Paso 3: Visualizar las "rebanadas" del volumen 3D ---
+# VisorCortes mantiene una única imagen que se actualiza por blitting; se navega con la
+# rueda del ratón, las flechas, RePág/AvPág e Inicio/Fin, y la barra espaciadora activa el cine.
 
-# --- Paso 4: Función para avanzar a la siguiente imagen ---
-def siguiente_imagen(volumen_3d, slice_index, canvas, fig, ax):
-    if slice_index < volumen_3d.shape[2] - 1:
-        slice_index += 1
-        visualizar_imagen(volumen_3d, slice_index, canvas, fig, ax)
-    return slice_index
+# --- Paso 4: Reformateo multiplanar (axial/coronal/sagital) en una ventana aparte ---
+def abrir_mpr(root, volumen_apilado, slices):
+    ventana = tk.Toplevel(root)
+    ventana.title("Reformateo multiplanar")
+    # El espaciado real entre cortes y PixelSpacing dan la relación de aspecto de cada vista.
+    # Se guarda en la ventana para que el visor (y sus eventos) vivan mientras esté abierta.
+    ventana.visor_mpr = VisorMPR(ventana, volumen_apilado, slices.espaciado(), cabecera=slices.cabeceras[0])
+    return ventana.visor_mpr
 
 # --- Función principal que crea la ventana de Tkinter ---
 def main(dicom_dir):
-    slices = cargar_imagenes_dicom(dicom_dir)
+    volumen_3d = cargar_imagenes_dicom(dicom_dir)  # El volumen se lee corte a corte al visualizarlo
     
-    if not slices:
+    if not volumen_3d:
         print("No se encontraron imágenes DICOM en la carpeta.")
         return
-    
-    # Crear el volumen 3D
-    volumen_3d = crear_volumen(slices)
-    
-    slice_index = [0]  # Utilizamos una lista para que sea mutable
 
     # Crear la ventana principal de Tkinter
     root = tk.Tk()
     root.title("Visor de Volumen DICOM 3D")
     
-    # Crear el gráfico de Matplotlib para incrustar en Tkinter
-    fig, ax = plt.subplots(figsize=(6, 6))
-    canvas = FigureCanvasTkAgg(fig, master=root)
-    canvas.get_tk_widget().pack()
-    
-    # Mostrar la primera imagen
-    visualizar_imagen(volumen_3d, slice_index[0], canvas, fig, ax)
-    
-    # Crear botón para avanzar a la siguiente imagen
-    def avanzar():
-        slice_index[0] = siguiente_imagen(volumen_3d, slice_index[0], canvas, fig, ax)
+    # Crear el visor de Matplotlib incrustado en Tkinter y mostrar la primera imagen
+    visor = VisorCortes(root, volumen_3d, cabecera=volumen_3d.cabeceras[0])
     
-    btn_siguiente = Button(root, text="Siguiente Imagen", command=avanzar)
-    btn_siguiente.pack()
+    # Botones para recorrer las imágenes en ambos sentidos y para el modo cine
+    botones = tk.Frame(root)
+    botones.pack()
+    Button(botones, text="Imagen Anterior", command=lambda: visor.avanzar(-1)).pack(side=tk.LEFT)
+    Button(botones, text="Siguiente Imagen", command=lambda: visor.avanzar(1)).pack(side=tk.LEFT)
+    Button(botones, text="Cine", command=visor.alternar_cine).pack(side=tk.LEFT)
+
+    volumen_apilado = []  # El MPR necesita el volumen completo: se apila la primera vez que se abre
+    def mpr():
+        if not volumen_apilado:
+            volumen_apilado.append(crear_volumen(volumen_3d))
+        abrir_mpr(root, volumen_apilado[0], volumen_3d)
+
+    Button(botones, text="MPR", command=mpr).pack(side=tk.LEFT)
 
     # Ejecutar la ventana de Tkinter
     root.mainloop()
+    volumen_3d.cerrar()
 
 # --- Uso del código ---
-dicom_dir = r"C:\Users\Claudia\Desktop\FUESMEN\HIGADO PACIENTE 1\T2W_TSE_COR"  # Ruta a la carpeta que contiene las imágenes DICOM
-main(dicom_dir)
+if __name__ == "__main__":
+    dicom_dir = r"C:\Users\Claudia\Desktop\FUESMEN\HIGADO PACIENTE 1\T2W_TSE_COR"  # Ruta a la carpeta que contiene las imágenes DICOM
+    main(dicom_dir)
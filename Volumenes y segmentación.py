@@ -1,38 +1,17 @@
-import os
-import matplotlib.pyplot as plt
-import pydicom
 import tkinter as tk
 from tkinter import Button
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
-# --- Paso 1: Cargar todas las imágenes DICOM de una carpeta ---
-def cargar_imagenes_dicom(dicom_dir):
-    slices = []
-    
-    for f in os.listdir(dicom_dir):
-        if f.endswith(".dcm"):
-            dicom_path = os.path.join(dicom_dir, f)
-            ds = pydicom.dcmread(dicom_path)
-            slices.append(ds)
-    
-    slices.sort(key=lambda x: float(x.ImagePositionPatient[2]))
-    
-    return slices
+from visor_cortes import VisorCortes
+from volumen_perezoso import cargar_volumen_perezoso
 
-# --- Paso 2: Visualizar la imagen en la GUI ---
-def visualizar_imagen(slices, slice_index, canvas, fig, ax):
-    ax.clear()  # Limpiar el eje
-    img = slices[slice_index]
-    ax.imshow(img.pixel_array, cmap="gray")
-    ax.set_title(f"Slice {slice_index+1} - Patient ID: {img.PatientID}")
-    canvas.draw()
+# --- Paso 1: Preparar el volumen leyendo solo las cabeceras de la carpeta ---
+def cargar_imagenes_dicom(dicom_dir, limite_memoria_mb=512):
+    # Los píxeles se decodifican bajo demanda y se guardan en una caché limitada en memoria
+    return cargar_volumen_perezoso(dicom_dir, limite_memoria_mb=limite_memoria_mb)
 
-# --- Paso 3: Función para avanzar a la siguiente imagen ---
-def siguiente_imagen(slices, slice_index, canvas, fig, ax):
-    if slice_index < len(slices) - 1:
-        slice_index += 1
-        visualizar_imagen(slices, slice_index, canvas, fig, ax)
-    return slice_index
+# --- Paso 2: Visualizar la imagen en la GUI ---
+# VisorCortes mantiene una única imagen que se actualiza por blitting; se navega con la
+# rueda del ratón, las flechas, RePág/AvPág e Inicio/Fin, y la barra espaciadora activa el cine.
 
 # --- Función principal que crea la ventana de Tkinter ---
 def main(dicom_dir):
@@ -41,31 +20,27 @@ def main(dicom_dir):
     if not slices:
         print("No se encontraron imágenes DICOM en la carpeta.")
         return
-    
-    slice_index = [0]  # Utilizamos una lista para que sea mutable
 
     # Crear la ventana principal de Tkinter
     root = tk.Tk()
     root.title("Visor de Imágenes DICOM")
     
-    # Crear el gráfico de Matplotlib para incrustar en Tkinter
-    fig, ax = plt.subplots(figsize=(6, 6))
-    canvas = FigureCanvasTkAgg(fig, master=root)
-    canvas.get_tk_widget().pack()
-    
-    # Mostrar la primera imagen
-    visualizar_imagen(slices, slice_index[0], canvas, fig, ax)
-    
-    # Crear botón para avanzar a la siguiente imagen
-    def avanzar():
-        slice_index[0] = siguiente_imagen(slices, slice_index[0], canvas, fig, ax)
+    # Crear el visor de Matplotlib incrustado en Tkinter y mostrar la primera imagen
+    cabecera = slices.cabeceras[0]
+    visor = VisorCortes(root, slices, cabecera=cabecera, titulo=f"Patient ID: {cabecera.get('PatientID', '')}")
     
-    btn_siguiente = Button(root, text="Siguiente Imagen", command=avanzar)
-    btn_siguiente.pack()
+    # Botones para recorrer las imágenes en ambos sentidos y para el modo cine
+    botones = tk.Frame(root)
+    botones.pack()
+    Button(botones, text="Imagen Anterior", command=lambda: visor.avanzar(-1)).pack(side=tk.LEFT)
+    Button(botones, text="Siguiente Imagen", command=lambda: visor.avanzar(1)).pack(side=tk.LEFT)
+    Button(botones, text="Cine", command=visor.alternar_cine).pack(side=tk.LEFT)
 
     # Ejecutar la ventana de Tkinter
     root.mainloop()
+    slices.cerrar()
 
 # --- Uso del código ---
-dicom_dir = r"C:\Users\Claudia\Desktop\FUESMEN\HIGADO PACIENTE 1\T2W_TSE_COR"  # Ruta a la carpeta que contiene las imágenes DICOM
-main(dicom_dir)
+if __name__ == "__main__":
+    dicom_dir = r"C:\Users\Claudia\Desktop\FUESMEN\HIGADO PACIENTE 1\T2W_TSE_COR"  # Ruta a la carpeta que contiene las imágenes DICOM
+    main(dicom_dir)
@@ -0,0 +1,252 @@
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from fantoma_dicom import generar_fantoma
+
+CARPETA_REPOSITORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Motores de ajuste medidos por defecto; curve_fit se mide aparte sobre una muestra
+MOTORES_POR_DEFECTO = ["loglineal", "arlo", "lm", "diccionario", "numba"]
+
+
+def importar_script(nombre_archivo):
+    """Importa un script del repositorio cuyo nombre no es un identificador válido (p. ej. con espacios)."""
+    ruta = os.path.join(CARPETA_REPOSITORIO, nombre_archivo)
+    nombre_modulo = os.path.splitext(nombre_archivo)[0].replace(" ", "_")
+    spec = importlib.util.spec_from_file_location(nombre_modulo, ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def medir(nombre, funcion, *args, memoria=True, **kwargs):
+    """
+    Ejecuta funcion(*args, **kwargs) midiendo el tiempo de reloj y el pico de memoria.
+
+    El pico se mide con tracemalloc, que incluye las reservas de NumPy pero solo ve el
+    proceso actual: para funciones que trabajan en otros procesos se pasa memoria=False
+    y el pico queda como no medido (None).
+
+    Returns:
+        tuple: (resultado de la función, dict con nombre, segundos y pico_memoria_mb).
+    """
+    if memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    try:
+        resultado = funcion(*args, **kwargs)
+    finally:
+        segundos = time.perf_counter() - inicio
+        pico = None
+        if memoria:
+            pico = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+    return resultado, {"nombre": nombre, "segundos": segundos, "pico_memoria_mb": pico}
+
+
+def _por_segundo(cantidad, segundos):
+    return cantidad / max(segundos, 1e-9)
+
+
+def precision_T2(T2_estimado, T2_verdad, mascara):
+    """Error relativo del T2 estimado frente a la verdad dentro de la máscara."""
+    validos = mascara & np.isfinite(T2_estimado)
+    if not validos.any():
+        return {"pixeles_validos": 0}
+    error = np.abs(T2_estimado[validos] - T2_verdad[validos]) / T2_verdad[validos]
+    return {
+        "pixeles_validos": int(validos.sum()),
+        "fraccion_valida": float(validos.sum() / max(mascara.sum(), 1)),
+        "error_relativo_mediano": float(np.median(error)),
+        "error_relativo_p95": float(np.percentile(error, 95)),
+        "fraccion_error_menor_5": float(np.mean(error < 0.05)),
+    }
+
+
+def ejecutar_benchmarks(carpeta_trabajo, n_cortes=4, tamano=256, n_ecos=8, ruido=10.0, motores=None,
+                        muestra_curve_fit=256):
+    """
+    Genera un fantoma y mide escaneo, carga, ajuste, escritura DICOM y anonimización.
+
+    Parameters:
+        carpeta_trabajo (str): Carpeta donde se escriben el fantoma y las salidas.
+        n_cortes, tamano, n_ecos, ruido: Parámetros del fantoma.
+        motores (list): Motores de ajuste a medir (por defecto MOTORES_POR_DEFECTO).
+        muestra_curve_fit (int): Píxeles sobre los que se mide curve_fit (0 para omitirlo).
+
+    Returns:
+        list: Un dict por prueba con tiempos, memoria, rendimiento y precisión.
+    """
+    from Anonimizador import PERFIL_AMPLIADO, anonimizar_carpeta
+    from T2_ajuste import ajustar_T2_curve_fit
+    from T2_numba import NUMBA_DISPONIBLE
+    from T2_volumen import ajustar_volumen_T2, cargar_volumen_multieco, guardar_volumen_dicom
+
+    motores = motores or MOTORES_POR_DEFECTO
+    carpeta_fantoma = os.path.join(carpeta_trabajo, "fantoma")
+    resultados = []
+
+    # Generación del fantoma
+    TE_values = tuple(10.0 * k for k in range(1, n_ecos + 1))
+    fantoma, medida = medir("generar_fantoma", generar_fantoma, carpeta_fantoma, n_cortes, tamano, tamano,
+                            TE_values, ruido)
+    medida["rendimiento"] = {"archivos_por_s": _por_segundo(fantoma["archivos"], medida["segundos"])}
+    resultados.append(medida)
+    verdad = np.load(fantoma["verdad"])
+    n_archivos = fantoma["archivos"]
+
+    # Escaneo de la carpeta (índice nuevo y segunda pasada con el índice ya al día)
+    procesamiento = importar_script("Procesamiento DICOM.py")
+    ruta_indice = os.path.join(carpeta_trabajo, "indice.sqlite")
+    for nombre in ("identificar_secuencia_dicom_en_frio", "identificar_secuencia_dicom_con_indice"):
+        secuencias, medida = medir(nombre, procesamiento.identificar_secuencia_dicom, carpeta_fantoma,
+                                   ruta_indice=ruta_indice)
+        medida["rendimiento"] = {"archivos_por_s": _por_segundo(n_archivos, medida["segundos"])}
+        medida["secuencias"] = len(secuencias)
+        resultados.append(medida)
+
+    # Carga del volumen del visor (cabeceras y primer corte) y del volumen multieco completo
+    visor = importar_script("Volume display.py")
+
+    def cargar_primer_corte():
+        volumen = visor.cargar_imagenes_dicom(carpeta_fantoma)
+        volumen[0]
+        volumen.cerrar()
+        return volumen
+
+    _, medida = medir("cargar_imagenes_dicom_primer_corte", cargar_primer_corte)
+    medida["rendimiento"] = {"archivos_por_s": _por_segundo(n_archivos, medida["segundos"])}
+    resultados.append(medida)
+
+    (volumen, TE_leidos, referencias), medida = medir("cargar_volumen_multieco", cargar_volumen_multieco,
+                                                      carpeta_fantoma)
+    medida["rendimiento"] = {
+        "archivos_por_s": _por_segundo(n_archivos, medida["segundos"]),
+        "mb_por_s": _por_segundo(volumen.nbytes / 1e6, medida["segundos"]),
+    }
+    resultados.append(medida)
+
+    # Motores de ajuste T2
+    n_pixeles = n_cortes * tamano * tamano
+    mapas = {}
+    for motor in motores:
+        (T2_map, _), medida = medir(f"ajuste_{motor}", ajustar_volumen_T2, volumen, TE_leidos, metodo=motor)
+        medida["rendimiento"] = {"pixeles_por_s": _por_segundo(n_pixeles, medida["segundos"])}
+        medida["precision"] = precision_T2(T2_map, verdad["T2"], verdad["cuerpo"])
+        if motor == "numba" and not NUMBA_DISPONIBLE:
+            # Sin Numba el motor cae en el LM de NumPy: el tiempo no es el del código compilado
+            medida["nombre"] = "ajuste_numba_respaldo_lm"
+            medida["respaldo"] = "lm"
+        resultados.append(medida)
+        mapas[motor] = T2_map
+
+    if muestra_curve_fit:
+        # curve_fit es demasiado lento para el volumen entero: se mide sobre los píxeles del cuerpo de un corte
+        filas, columnas = np.nonzero(verdad["cuerpo"][0])
+        seleccion = np.linspace(0, filas.size - 1, min(muestra_curve_fit, filas.size)).astype(int)
+        pila = volumen[0][:, filas[seleccion], columnas[seleccion]][:, None, :]
+        (T2_muestra, _), medida = medir("ajuste_curve_fit_muestra", ajustar_T2_curve_fit, pila, TE_leidos,
+                                        mostrar_progreso=False)
+        medida["rendimiento"] = {"pixeles_por_s": _por_segundo(seleccion.size, medida["segundos"])}
+        medida["precision"] = precision_T2(T2_muestra[0], verdad["T2"][0][filas[seleccion], columnas[seleccion]],
+                                           np.ones(seleccion.size, dtype=bool))
+        resultados.append(medida)
+
+    # Escritura DICOM de los mapas
+    carpeta_mapas = os.path.join(carpeta_trabajo, "mapas")
+    os.makedirs(carpeta_mapas, exist_ok=True)
+    T2_map = next(iter(mapas.values()))
+    T2_uint16 = np.nan_to_num((np.clip(T2_map, 10, 200) - 10) / 190 * 65534 + 1, nan=0).astype(np.uint16)
+    rutas_mapas, medida = medir("guardar_volumen_dicom", guardar_volumen_dicom, T2_uint16, referencias,
+                                carpeta_mapas)
+    medida["rendimiento"] = {
+        "archivos_por_s": _por_segundo(len(rutas_mapas), medida["segundos"]),
+        "mb_por_s": _por_segundo(T2_uint16.nbytes / 1e6, medida["segundos"]),
+    }
+    resultados.append(medida)
+
+    # Anonimización de la serie completa
+    carpeta_anonima = os.path.join(carpeta_trabajo, "anonimizado")
+    # Los archivos se anonimizan en procesos hijos, que tracemalloc no ve
+    resumen, medida = medir("anonimizar_carpeta", anonimizar_carpeta, carpeta_fantoma, carpeta_anonima,
+                            perfil=PERFIL_AMPLIADO, forzar=True, memoria=False)
+    medida["rendimiento"] = {"archivos_por_s": _por_segundo(resumen["anonimizados"], medida["segundos"])}
+    medida["errores"] = resumen["errores"]
+    resultados.append(medida)
+
+    return resultados
+
+
+def informacion_entorno():
+    import pydicom
+    import scipy
+    return {
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "procesadores": os.cpu_count(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "pydicom": pydicom.__version__,
+    }
+
+
+def imprimir_tabla(resultados):
+    print(f"{'Prueba':<42}{'Tiempo (s)':>12}{'Pico (MB)':>12}  Rendimiento / precisión")
+    for medida in resultados:
+        rendimiento = ", ".join(f"{k}={v:,.1f}" for k, v in medida.get("rendimiento", {}).items())
+        precision = medida.get("precision", {})
+        if "error_relativo_mediano" in precision:
+            rendimiento += f", error mediano={precision['error_relativo_mediano']:.2%}"
+        pico = medida["pico_memoria_mb"]
+        pico = f"{pico:>12.1f}" if pico is not None else f"{'-':>12}"
+        print(f"{medida['nombre']:<42}{medida['segundos']:>12.3f}{pico}  {rendimiento}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de escaneo, carga, ajuste T2, escritura y anonimización.")
+    parser.add_argument("--carpeta", default=None, help="Carpeta de trabajo (por defecto, una temporal que se borra)")
+    parser.add_argument("--cortes", type=int, default=4)
+    parser.add_argument("--tamano", type=int, default=256)
+    parser.add_argument("--ecos", type=int, default=8)
+    parser.add_argument("--ruido", type=float, default=10.0)
+    parser.add_argument("--motores", nargs="+", default=MOTORES_POR_DEFECTO)
+    parser.add_argument("--muestra-curve-fit", type=int, default=256, help="Píxeles para medir curve_fit (0 lo omite)")
+    parser.add_argument("--salida", default=None, help="Archivo JSON de resultados")
+    args = parser.parse_args()
+
+    carpeta = args.carpeta or tempfile.mkdtemp(prefix="benchmark_dicom_")
+    try:
+        resultados = ejecutar_benchmarks(carpeta, args.cortes, args.tamano, args.ecos, args.ruido, args.motores,
+                                         args.muestra_curve_fit)
+    finally:
+        if args.carpeta is None:
+            shutil.rmtree(carpeta, ignore_errors=True)
+
+    informe = {
+        "entorno": informacion_entorno(),
+        "parametros": {"cortes": args.cortes, "tamano": args.tamano, "ecos": args.ecos, "ruido": args.ruido,
+                       "motores": args.motores, "muestra_curve_fit": args.muestra_curve_fit},
+        "resultados": resultados,
+    }
+    salida = args.salida or f"benchmark_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+
+    imprimir_tabla(resultados)
+    print(f"Resultados guardados en: {salida}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
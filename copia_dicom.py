@@ -0,0 +1,119 @@
+import os
+import shutil
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# Modos de salida: copia secuencial (comportamiento original), copia en paralelo,
+# enlace duro, copia por referencia (copy-on-write) y enlace simbólico
+MODOS_COPIA = ("copia", "paralelo", "hardlink", "reflink", "symlink")
+N_HILOS_COPIA = 8
+
+FICLONE = 0x40049409  # ioctl de Linux para clonar un archivo (Btrfs, XFS, ...)
+
+
+def _reflink(origen, destino):
+    """Crea una copia por referencia; lanza OSError si el sistema de archivos no lo admite."""
+    if sys.platform.startswith("linux"):
+        import fcntl
+        with open(origen, "rb") as f_origen, open(destino, "wb") as f_destino:
+            fcntl.ioctl(f_destino.fileno(), FICLONE, f_origen.fileno())
+        shutil.copymode(origen, destino)
+    elif sys.platform == "darwin":
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(origen), os.fsencode(destino), 0) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+    else:
+        raise OSError("Copia por referencia no disponible en este sistema")
+
+
+def _eliminar_existente(destino):
+    """Los enlaces no sobrescriben: se elimina el destino previo, como haría shutil.copy."""
+    if os.path.lexists(destino):
+        os.remove(destino)
+
+
+def _transferir(origen, destino, modo):
+    """
+    Lleva un archivo al destino con el modo pedido y vuelve a la copia si no es posible.
+
+    Returns:
+        tuple: (modo usado realmente, bytes transferidos).
+    """
+    if os.path.abspath(origen) == os.path.abspath(destino):
+        raise shutil.SameFileError(f"{origen} y {destino} son el mismo archivo")
+    if modo in ("hardlink", "reflink", "symlink"):
+        try:
+            _eliminar_existente(destino)
+            if modo == "hardlink":
+                os.link(origen, destino)
+            elif modo == "reflink":
+                _reflink(origen, destino)
+            else:
+                os.symlink(os.path.abspath(origen), destino)
+            return modo, os.path.getsize(origen)
+        except (OSError, NotImplementedError):
+            # Distinto volumen, sistema de archivos sin soporte o falta de permisos
+            if os.path.lexists(destino):
+                os.remove(destino)
+    shutil.copy(origen, destino)
+    return "copia", os.path.getsize(origen)
+
+
+def copiar_archivos(pares, modo="paralelo", n_hilos=N_HILOS_COPIA):
+    """
+    Copia (o enlaza) una lista de archivos e imprime un resumen de rendimiento.
+
+    Parameters:
+        pares (list): Lista de tuplas (ruta de origen, ruta de destino).
+        modo (str): Uno de MODOS_COPIA. Los modos de enlace vuelven automáticamente a
+            la copia normal cuando el sistema de archivos no los admite.
+        n_hilos (int): Operaciones simultáneas (el modo "copia" siempre usa una).
+
+    Returns:
+        dict: Archivos, bytes, segundos y recuento por modo efectivamente usado.
+    """
+    if modo not in MODOS_COPIA:
+        raise ValueError(f"Modo de copia desconocido: {modo}. Opciones: {', '.join(MODOS_COPIA)}")
+    modo_archivo = "copia" if modo == "paralelo" else modo
+    n_hilos = 1 if modo == "copia" else max(1, n_hilos)
+
+    inicio = time.perf_counter()
+    modos_usados = Counter()
+    total_bytes = 0
+
+    def procesar(par):
+        origen, destino = par
+        try:
+            return _transferir(origen, destino, modo_archivo)
+        except OSError as e:
+            print(f"Error copiando {origen} -> {destino}: {e}")
+            return None, 0
+
+    with ThreadPoolExecutor(max_workers=n_hilos) as pool:
+        for modo_usado, tamano in pool.map(procesar, pares):
+            modos_usados[modo_usado] += 1
+            total_bytes += tamano
+
+    errores = modos_usados.pop(None, 0)
+    segundos = time.perf_counter() - inicio
+    archivos = sum(modos_usados.values())
+    resumen = {
+        "archivos": archivos,
+        "bytes": total_bytes,
+        "segundos": segundos,
+        "errores": errores,
+        "modos": dict(modos_usados),
+    }
+
+    duracion = max(segundos, 1e-9)
+    detalle_modos = ", ".join(f"{m}: {n}" for m, n in modos_usados.items())
+    print(f"{archivos} archivos ({total_bytes / 1e6:.1f} MB) en {segundos:.2f} s: "
+          f"{archivos / duracion:.0f} archivos/s, {total_bytes / 1e6 / duracion:.1f} MB/s "
+          f"[{detalle_modos or 'sin archivos'}]")
+    if errores:
+        print(f"{errores} archivos no se pudieron copiar.")
+    return resumen
@@ -0,0 +1,108 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pydicom
+
+# Etiquetas que se leen de cada archivo; el resto de la cabecera y los píxeles no se decodifican
+TAGS_CABECERA = [
+    "SeriesInstanceUID", "SeriesDescription", "SeriesNumber", "ProtocolName",
+    "DeviceSerialNumber", "ImagePositionPatient", "EchoTime", "SOPInstanceUID",
+]
+
+# Hilos por defecto: la lectura de cabeceras está dominada por la latencia del disco o de la red
+N_HILOS = 16
+
+
+def recorrer_dicom(dicom_folder):
+    """
+    Recorre la carpeta de forma recursiva y devuelve los archivos .dcm con su tamaño y mtime.
+
+    Usa os.scandir para aprovechar los metadatos que devuelve el propio listado
+    del directorio, lo que evita un stat adicional por archivo en unidades de red.
+    """
+    pendientes = [dicom_folder]
+    while pendientes:
+        carpeta = pendientes.pop()
+        try:
+            entradas = list(os.scandir(carpeta))
+        except OSError as e:
+            print(f"Error listando la carpeta {carpeta}: {e}")
+            continue
+        for entrada in entradas:
+            if entrada.is_dir(follow_symlinks=False):
+                pendientes.append(entrada.path)
+            elif entrada.name.lower().endswith(".dcm"):
+                info = entrada.stat()
+                yield entrada.path, info.st_size, info.st_mtime_ns
+
+
+def leer_etiquetas(ruta):
+    """
+    Lee solo las etiquetas de TAGS_CABECERA de un archivo DICOM.
+
+    Returns:
+        dict: Valores de las etiquetas, con None para las que faltan.
+    """
+    ds = pydicom.dcmread(ruta, stop_before_pixels=True, specific_tags=TAGS_CABECERA)
+    posicion = ds.get("ImagePositionPatient")
+    echo_time = ds.get("EchoTime")
+    series_number = ds.get("SeriesNumber")
+    return {
+        "series_uid": ds.get("SeriesInstanceUID"),
+        "series_description": ds.get("SeriesDescription"),
+        "series_number": int(series_number) if series_number not in (None, "") else None,
+        "protocol_name": ds.get("ProtocolName"),
+        "device_serial": ds.get("DeviceSerialNumber"),
+        "posicion": "_".join(map(str, posicion)) if posicion else None,
+        "echo_time": float(echo_time) if echo_time not in (None, "") else None,
+        "sop_uid": ds.get("SOPInstanceUID"),
+    }
+
+
+def _leer_protegido(ruta):
+    """Lee las etiquetas de un archivo devolviendo el error en lugar de lanzarlo."""
+    try:
+        return ruta, leer_etiquetas(ruta), None
+    except Exception as e:
+        return ruta, None, e
+
+
+def escanear_cabeceras(rutas, n_hilos=N_HILOS):
+    """
+    Lee las cabeceras de una secuencia de archivos con un grupo de hilos.
+
+    Es un generador: cada resultado se entrega en cuanto está disponible y solo se
+    mantienen en vuelo unas pocas lecturas por hilo, así que las rutas pueden venir
+    de otro generador (por ejemplo, recorrer_dicom) sin recorrer antes toda la carpeta.
+
+    Parameters:
+        rutas (iterable): Rutas de los archivos DICOM.
+        n_hilos (int): Número de hilos de lectura.
+
+    Yields:
+        tuple: (ruta, etiquetas, error); etiquetas es None si el archivo no se pudo leer.
+    """
+    en_vuelo = deque()
+    with ThreadPoolExecutor(max_workers=n_hilos) as pool:
+        for ruta in rutas:
+            en_vuelo.append(pool.submit(_leer_protegido, ruta))
+            if len(en_vuelo) >= 4 * n_hilos:
+                yield en_vuelo.popleft().result()
+        while en_vuelo:
+            yield en_vuelo.popleft().result()
+
+
+def escanear_carpeta(dicom_folder, n_hilos=N_HILOS):
+    """
+    Recorre una carpeta y entrega las cabeceras de sus archivos DICOM a medida que se leen.
+
+    Parameters:
+        dicom_folder (str): Carpeta a escanear.
+        n_hilos (int): Número de hilos de lectura.
+
+    Yields:
+        tuple: (ruta, etiquetas, error) como en escanear_cabeceras.
+    """
+    rutas = (ruta for ruta, _, _ in recorrer_dicom(dicom_folder))
+    yield from escanear_cabeceras(rutas, n_hilos)
@@ -0,0 +1,174 @@
+import argparse
+import datetime
+import os
+
+import numpy as np
+import pydicom
+from pydicom.dataset import FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, MRImageStorage, generate_uid
+
+# Tejidos del fantoma: (T2 en ms, S0) de cada región; el fondo queda a 0
+TEJIDOS = {
+    "higado": (40.0, 900.0),
+    "bazo": (80.0, 1100.0),
+    "grasa": (120.0, 1400.0),
+    "musculo": (30.0, 700.0),
+    "liquido": (180.0, 1800.0),
+}
+TE_POR_DEFECTO = tuple(10.0 * k for k in range(1, 9))
+
+
+def crear_mapas_verdad(n_cortes, filas, columnas):
+    """
+    Mapas T2 y S0 de referencia con forma (corte, fila, columna).
+
+    Un cuerpo elíptico de tejido hepático contiene discos de los demás tejidos, cuyo
+    tamaño varía de un corte a otro para que cada corte sea distinto.
+
+    Returns:
+        tuple: (T2, S0, máscara del cuerpo), T2 y S0 en float64 y 0 fuera del cuerpo.
+    """
+    T2 = np.zeros((n_cortes, filas, columnas))
+    S0 = np.zeros((n_cortes, filas, columnas))
+    y, x = np.mgrid[0:filas, 0:columnas]
+    y = (y - filas / 2) / (filas / 2)
+    x = (x - columnas / 2) / (columnas / 2)
+    cuerpo = (x / 0.85) ** 2 + (y / 0.7) ** 2 <= 1
+
+    discos = [("bazo", -0.4, -0.2), ("grasa", 0.4, -0.2), ("musculo", -0.4, 0.3), ("liquido", 0.4, 0.3)]
+    for k in range(n_cortes):
+        escala = 0.12 + 0.08 * np.sin(np.pi * (k + 1) / (n_cortes + 1))
+        T2[k][cuerpo], S0[k][cuerpo] = TEJIDOS["higado"]
+        for tejido, cx, cy in discos:
+            disco = (x - cx) ** 2 + (y - cy) ** 2 <= escala ** 2
+            T2[k][disco], S0[k][disco] = TEJIDOS[tejido]
+    return T2, S0, np.broadcast_to(cuerpo, T2.shape).copy()
+
+
+def _cabecera_base(filas, columnas, espaciado, paciente, serie_uid, estudio_uid, marco_uid, descripcion):
+    """Cabecera MR con los campos que leen las herramientas del repositorio."""
+    ahora = datetime.datetime.now()
+    ds = pydicom.Dataset()
+    ds.SOPClassUID = MRImageStorage
+    ds.Modality = "MR"
+    ds.Manufacturer = "Fantoma sintético"
+    ds.DeviceSerialNumber = "FANTOMA-0001"
+    ds.InstitutionName = "Laboratorio de pruebas"
+    ds.PatientName = paciente
+    ds.PatientID = paciente.upper()
+    ds.PatientBirthDate = "19800101"
+    ds.PatientSex = "O"
+    ds.ReferringPhysicianName = "Medico^Referente"
+    ds.StudyInstanceUID = estudio_uid
+    ds.SeriesInstanceUID = serie_uid
+    ds.FrameOfReferenceUID = marco_uid
+    ds.StudyDate = ds.SeriesDate = ahora.strftime("%Y%m%d")
+    ds.StudyTime = ds.SeriesTime = ahora.strftime("%H%M%S")
+    ds.StudyID = "1"
+    ds.AccessionNumber = "FANT0001"
+    ds.SeriesNumber = 301
+    ds.SeriesDescription = descripcion
+    ds.ProtocolName = descripcion
+    ds.ScanningSequence = "SE"
+    ds.SequenceVariant = "NONE"
+    ds.MRAcquisitionType = "2D"
+    ds.RepetitionTime = 2000
+    ds.MagneticFieldStrength = 1.5
+    ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+    ds.PixelSpacing = [espaciado[1], espaciado[2]]
+    ds.SliceThickness = espaciado[0]
+    ds.SpacingBetweenSlices = espaciado[0]
+    ds.Rows, ds.Columns = filas, columnas
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 0
+    return ds
+
+
+def generar_fantoma(carpeta, n_cortes=4, filas=256, columnas=256, TE_values=TE_POR_DEFECTO, ruido=10.0,
+                    espaciado=(5.0, 1.0, 1.0), semilla=0, paciente="Fantoma", descripcion="T2 multieco fantoma"):
+    """
+    Escribe una serie DICOM multieco sintética con mapas T2/S0 conocidos.
+
+    Cada archivo es un corte a un tiempo de eco, con las cabeceras que usan el
+    escaneo, la separación por cortes, el visor y los scripts de mapeo
+    (ImagePositionPatient, EchoTime, SeriesInstanceUID, PixelSpacing...). La señal es
+    S0·exp(-TE/T2) con ruido riciano de desviación ruido. Los mapas de referencia se
+    guardan en verdad.npz dentro de la carpeta.
+
+    Parameters:
+        carpeta (str): Carpeta de salida (se crea si no existe).
+        n_cortes (int): Número de cortes.
+        filas, columnas (int): Tamaño de cada imagen.
+        TE_values (tuple): Tiempos de eco en ms.
+        ruido (float): Desviación del ruido gaussiano de cada canal (0 para señal exacta).
+        espaciado (tuple): (entre cortes, entre filas, entre columnas) en mm.
+        semilla (int): Semilla del ruido y de los UIDs.
+
+    Returns:
+        dict: Rutas escritas, ruta de la verdad y número de archivos.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    rng = np.random.default_rng(semilla)
+    T2, S0, cuerpo = crear_mapas_verdad(n_cortes, filas, columnas)
+
+    semilla_uid = f"fantoma-{semilla}-{paciente}-{descripcion}"
+    estudio_uid = generate_uid(entropy_srcs=[semilla_uid, "estudio"])
+    serie_uid = generate_uid(entropy_srcs=[semilla_uid, "serie"])
+    marco_uid = generate_uid(entropy_srcs=[semilla_uid, "marco"])
+    base = _cabecera_base(filas, columnas, espaciado, paciente, serie_uid, estudio_uid, marco_uid, descripcion)
+
+    rutas = []
+    instancia = 0
+    for k in range(n_cortes):
+        posicion = [-columnas * espaciado[2] / 2, -filas * espaciado[1] / 2, k * espaciado[0]]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            decaimiento = np.where(cuerpo[k], np.exp(-np.divide.outer(TE_values, T2[k])), 0.0)
+        for e, TE in enumerate(TE_values):
+            senal = S0[k] * decaimiento[e]
+            if ruido > 0:
+                senal = np.hypot(senal + rng.normal(0, ruido, senal.shape), rng.normal(0, ruido, senal.shape))
+            pixeles = np.clip(np.round(senal), 0, 65535).astype(np.uint16)
+
+            instancia += 1
+            ds = base.copy()
+            ds.file_meta = FileMetaDataset()
+            ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+            ds.file_meta.MediaStorageSOPClassUID = MRImageStorage
+            ds.SOPInstanceUID = generate_uid(entropy_srcs=[semilla_uid, str(instancia)])
+            ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+            ds.InstanceNumber = instancia
+            ds.EchoTime = float(TE)
+            ds.EchoNumbers = e + 1
+            ds.ImagePositionPatient = posicion
+            ds.SliceLocation = posicion[2]
+            ds.WindowCenter = int(S0.max() / 2)
+            ds.WindowWidth = int(S0.max())
+            ds.PixelData = pixeles.tobytes()
+
+            ruta = os.path.join(carpeta, f"IM_{instancia:05d}.dcm")
+            ds.save_as(ruta, enforce_file_format=True)
+            rutas.append(ruta)
+
+    ruta_verdad = os.path.join(carpeta, "verdad.npz")
+    np.savez_compressed(ruta_verdad, T2=T2.astype(np.float32), S0=S0.astype(np.float32), cuerpo=cuerpo,
+                        TE=np.asarray(TE_values, dtype=np.float64))
+    return {"rutas": rutas, "verdad": ruta_verdad, "archivos": len(rutas)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera una serie DICOM multieco sintética con T2/S0 conocidos.")
+    parser.add_argument("carpeta", help="Carpeta de salida")
+    parser.add_argument("--cortes", type=int, default=4)
+    parser.add_argument("--tamano", type=int, default=256, help="Filas y columnas de cada imagen")
+    parser.add_argument("--ecos", type=int, default=len(TE_POR_DEFECTO), help="Número de ecos (TE = 10, 20, ... ms)")
+    parser.add_argument("--ruido", type=float, default=10.0)
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    resultado = generar_fantoma(args.carpeta, args.cortes, args.tamano, args.tamano,
+                                tuple(10.0 * k for k in range(1, args.ecos + 1)), args.ruido, semilla=args.semilla)
+    print(f"Se escribieron {resultado['archivos']} archivos en {args.carpeta}; verdad en {resultado['verdad']}")
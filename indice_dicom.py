@@ -0,0 +1,137 @@
+import os
+import sqlite3
+
+from escaneo_dicom import N_HILOS, escanear_cabeceras, recorrer_dicom
+
+# Índice por defecto en la carpeta del usuario (las carpetas de archivo suelen ser de solo lectura)
+RUTA_INDICE = os.path.join(os.path.expanduser("~"), ".indice_dicom.sqlite")
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS archivos (
+    ruta TEXT PRIMARY KEY,
+    tamano INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    series_uid TEXT,
+    series_description TEXT,
+    series_number INTEGER,
+    protocol_name TEXT,
+    device_serial TEXT,
+    posicion TEXT,
+    echo_time REAL,
+    sop_uid TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_archivos_serie ON archivos (series_uid);
+CREATE INDEX IF NOT EXISTS idx_archivos_descripcion ON archivos (series_description);
+CREATE INDEX IF NOT EXISTS idx_archivos_numero ON archivos (series_number);
+"""
+
+_COLUMNAS_ETIQUETAS = [
+    "series_uid", "series_description", "series_number", "protocol_name",
+    "device_serial", "posicion", "echo_time", "sop_uid",
+]
+
+
+def abrir_indice(ruta_indice=RUTA_INDICE):
+    """Abre (o crea) la base de datos SQLite del índice DICOM."""
+    conexion = sqlite3.connect(ruta_indice)
+    conexion.row_factory = sqlite3.Row
+    conexion.executescript(_ESQUEMA)
+    return conexion
+
+
+def _filtro_carpeta(dicom_folder):
+    """Condición SQL y parámetros para limitar una consulta a los archivos bajo una carpeta."""
+    prefijo = os.path.join(os.path.abspath(dicom_folder), "")
+    return "substr(ruta, 1, ?) = ?", (len(prefijo), prefijo)
+
+
+def actualizar_indice(conexion, dicom_folder, al_leer=None, n_hilos=N_HILOS):
+    """
+    Sincroniza el índice con el contenido actual de la carpeta.
+
+    Solo se leen los archivos nuevos o aquellos cuyo tamaño o fecha de modificación
+    cambió, y sus cabeceras se leen en paralelo; los archivos que ya no existen se
+    eliminan del índice.
+
+    Parameters:
+        conexion (sqlite3.Connection): Conexión devuelta por abrir_indice.
+        dicom_folder (str): Carpeta a indexar.
+        al_leer (callable): Función opcional que recibe cada fila (dict) en cuanto se
+            conoce, tanto si venía del índice como si se acaba de leer.
+        n_hilos (int): Número de hilos para leer las cabeceras.
+
+    Returns:
+        dict: Número de archivos nuevos, actualizados, sin cambios y eliminados.
+    """
+    dicom_folder = os.path.abspath(dicom_folder)
+    condicion, parametros = _filtro_carpeta(dicom_folder)
+    conocidos = {
+        fila["ruta"]: dict(fila)
+        for fila in conexion.execute(f"SELECT * FROM archivos WHERE {condicion}", parametros)
+    }
+
+    resumen = {"nuevos": 0, "actualizados": 0, "sin_cambios": 0, "eliminados": 0}
+    vistos = set()
+    estado_archivos = {}
+
+    def pendientes():
+        # Los archivos sin cambios se entregan desde el índice; el resto pasa al escáner
+        for ruta, tamano, mtime_ns in recorrer_dicom(dicom_folder):
+            vistos.add(ruta)
+            conocido = conocidos.get(ruta)
+            if conocido is not None and (conocido["tamano"], conocido["mtime_ns"]) == (tamano, mtime_ns):
+                resumen["sin_cambios"] += 1
+                if al_leer is not None:
+                    al_leer(conocido)
+                continue
+            resumen["actualizados" if conocido is not None else "nuevos"] += 1
+            estado_archivos[ruta] = (tamano, mtime_ns)
+            yield ruta
+
+    filas = []
+    for ruta, etiquetas, error in escanear_cabeceras(pendientes(), n_hilos):
+        if error is not None:
+            print(f"Error leyendo el archivo {ruta}: {error}")
+            etiquetas = dict.fromkeys(_COLUMNAS_ETIQUETAS)
+        tamano, mtime_ns = estado_archivos.pop(ruta)
+        fila = dict(etiquetas, ruta=ruta, tamano=tamano, mtime_ns=mtime_ns,
+                    error=str(error) if error is not None else None)
+        filas.append(fila)
+        if al_leer is not None:
+            al_leer(fila)
+
+    eliminados = [(ruta,) for ruta in conocidos if ruta not in vistos]
+    resumen["eliminados"] = len(eliminados)
+
+    with conexion:
+        conexion.executemany(
+            """INSERT OR REPLACE INTO archivos
+               (ruta, tamano, mtime_ns, series_uid, series_description, series_number, protocol_name,
+                device_serial, posicion, echo_time, sop_uid, error)
+               VALUES (:ruta, :tamano, :mtime_ns, :series_uid, :series_description, :series_number,
+                       :protocol_name, :device_serial, :posicion, :echo_time, :sop_uid, :error)""",
+            filas,
+        )
+        conexion.executemany("DELETE FROM archivos WHERE ruta = ?", eliminados)
+    return resumen
+
+
+def consultar_archivos(conexion, dicom_folder):
+    """
+    Devuelve las filas del índice (sin archivos ilegibles) bajo una carpeta.
+
+    Parameters:
+        conexion (sqlite3.Connection): Conexión devuelta por abrir_indice.
+        dicom_folder (str): Carpeta consultada.
+
+    Returns:
+        list: Filas sqlite3.Row ordenadas por serie y ruta.
+    """
+    condicion, parametros = _filtro_carpeta(dicom_folder)
+    return conexion.execute(
+        f"""SELECT * FROM archivos WHERE {condicion} AND error IS NULL
+            ORDER BY series_number, series_description, ruta""",
+        parametros,
+    ).fetchall()
+
@@ -0,0 +1,55 @@
+"""
+Pruebas de regresión de los motores de ajuste T2 sobre el fantoma sintético.
+
+Con el fantoma por defecto (ruido 10, 8 ecos) los motores tienen un error relativo
+mediano de T2 en torno al 1,5% frente a verdad.npz; los límites dejan margen para el
+ruido de otras semillas sin dejar pasar un motor roto.
+"""
+import numpy as np
+import pytest
+
+from benchmark import precision_T2
+from fantoma_dicom import generar_fantoma
+from T2_ajuste import verificar_contra_curve_fit
+from T2_numba import NUMBA_DISPONIBLE
+from T2_volumen import ajustar_volumen_T2, cargar_volumen_multieco
+
+# Error relativo mediano máximo frente a la verdad dentro del cuerpo
+ERROR_MEDIANO_MAXIMO = 0.03
+FRACCION_VALIDA_MINIMA = 0.99
+
+# Umbral de señal con el que se compara con curve_fit: solo píxeles del cuerpo (el fondo
+# riciano da ajustes mal condicionados en los que dos optimizadores pueden discrepar)
+UMBRAL_CUERPO = 100
+
+
+@pytest.fixture(scope="module")
+def fantoma(tmp_path_factory):
+    carpeta = tmp_path_factory.mktemp("fantoma")
+    rutas = generar_fantoma(str(carpeta), n_cortes=2, filas=64, columnas=64)
+    volumen, TE_values, _ = cargar_volumen_multieco(str(carpeta))
+    return volumen, TE_values, np.load(rutas["verdad"])
+
+
+@pytest.mark.parametrize("metodo", [
+    "loglineal",
+    "arlo",
+    "lm",
+    "diccionario",
+    pytest.param("numba", marks=pytest.mark.skipif(not NUMBA_DISPONIBLE, reason="Numba no está instalado")),
+])
+def test_error_frente_a_verdad(fantoma, metodo):
+    volumen, TE_values, verdad = fantoma
+    T2_vol, S0_vol = ajustar_volumen_T2(volumen, TE_values, metodo=metodo)
+    assert T2_vol.shape == S0_vol.shape == verdad["T2"].shape
+    precision = precision_T2(T2_vol, verdad["T2"], verdad["cuerpo"])
+    assert precision["fraccion_valida"] >= FRACCION_VALIDA_MINIMA
+    assert precision["error_relativo_mediano"] <= ERROR_MEDIANO_MAXIMO
+
+
+def test_lm_coincide_con_curve_fit(fantoma):
+    volumen, TE_values, _ = fantoma
+    diferencia, coincide = verificar_contra_curve_fit(volumen[0], TE_values, metodo="lm", n_muestras=100,
+                                                      umbral=UMBRAL_CUERPO)
+    assert coincide, f"Diferencia relativa máxima con curve_fit: {diferencia:.2e}"
+
@@ -0,0 +1,327 @@
+from collections import OrderedDict
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+from Conversor_DICOM_JPEG import _primer_valor, aplicar_ventana
+
+# Teclas de navegación: desplazamiento en cortes
+TECLAS_DESPLAZAMIENTO = {
+    "up": 1, "right": 1, "down": -1, "left": -1,
+    "pageup": 10, "pagedown": -10,
+}
+
+
+def calcular_ventana(cabecera, pixeles):
+    """
+    Ventana (centro, ancho) para mostrar la serie.
+
+    Se usa la de la cabecera si existe; si no, los percentiles 0.5-99.5 del corte
+    de referencia (el central), de modo que la ventana es la misma para toda la serie.
+    """
+    if "WindowCenter" in cabecera and "WindowWidth" in cabecera:
+        return _primer_valor(cabecera.WindowCenter), _primer_valor(cabecera.WindowWidth)
+    pendiente = float(cabecera.get("RescaleSlope", 1) or 1)
+    ordenada = float(cabecera.get("RescaleIntercept", 0) or 0)
+    minimo, maximo = np.percentile(pixeles, [0.5, 99.5]) * pendiente + ordenada
+    ancho = max(float(maximo - minimo), 1.0) + 1
+    return float(minimo) + ancho / 2, ancho
+
+
+class VisorCortes:
+    """
+    Visor de cortes embebido en Tkinter con redibujado rápido.
+
+    Mantiene una única AxesImage cuyo contenido se sustituye con set_data y se
+    redibuja por blitting sobre el fondo guardado, en lugar de limpiar el eje y
+    redibujar toda la figura. Los cortes ya convertidos a uint8 con la ventana de la
+    serie se guardan en una caché LRU. Se navega con la rueda del ratón, las flechas,
+    RePág/AvPág e Inicio/Fin; la barra espaciadora activa la reproducción en cine.
+
+    Parameters:
+        master: Ventana o marco de Tkinter donde se incrusta la figura.
+        volumen: Secuencia de cortes 2D (VolumenPerezoso o array (corte, fila, columna)).
+        cabecera: Cabecera DICOM de referencia para la ventana y el reescalado (opcional).
+        titulo (str): Título fijo de la figura.
+        limite_cache_mb (float): Memoria máxima de la caché de cortes en uint8.
+        fps (float): Cortes por segundo en modo cine.
+    """
+
+    def __init__(self, master, volumen, cabecera=None, titulo="", limite_cache_mb=128, fps=20, figsize=(6, 6)):
+        self.master = master
+        self.volumen = volumen
+        self.cabecera = cabecera if cabecera is not None else {}
+        self.indice = 0
+        self.fps = fps
+        self.limite_cache_bytes = int(limite_cache_mb * 1024 * 1024)
+        self._cache = OrderedDict()
+        self._bytes_en_cache = 0
+        self._fondo = None
+        self._cine = None
+
+        corte_central = np.asarray(volumen[len(volumen) // 2])
+        self.centro, self.ancho = calcular_ventana(self.cabecera, corte_central)
+
+        self.fig, self.ax = plt.subplots(figsize=figsize)
+        self.ax.set_axis_off()
+        if titulo:
+            self.ax.set_title(titulo)
+        self.imagen = self.ax.imshow(self._corte_8bits(0), cmap="gray", vmin=0, vmax=255,
+                                     interpolation="nearest", animated=True)
+        self.texto = self.ax.text(0.02, 0.98, "", transform=self.ax.transAxes, color="yellow",
+                                  va="top", ha="left", animated=True)
+
+        self.canvas = FigureCanvasTkAgg(self.fig, master=master)
+        self.widget = self.canvas.get_tk_widget()
+        self.widget.pack()
+        self.canvas.mpl_connect("draw_event", self._guardar_fondo)
+        self.canvas.mpl_connect("scroll_event", self._al_girar_rueda)
+        self.canvas.mpl_connect("key_press_event", self._al_pulsar_tecla)
+        self.widget.bind("<Enter>", lambda _: self.widget.focus_set())
+        self.canvas.draw()
+        self.mostrar(0)
+
+    # --- Conversión y caché de cortes en uint8 ---
+    def _convertir(self, pixeles):
+        pendiente = float(self.cabecera.get("RescaleSlope", 1) or 1)
+        ordenada = float(self.cabecera.get("RescaleIntercept", 0) or 0)
+        invertir = self.cabecera.get("PhotometricInterpretation") == "MONOCHROME1"
+        return aplicar_ventana(pixeles, pendiente, ordenada, self.centro, self.ancho, invertir)
+
+    def _corte_8bits(self, indice):
+        corte = self._cache.get(indice)
+        if corte is not None:
+            self._cache.move_to_end(indice)
+            return corte
+        corte = np.ascontiguousarray(self._convertir(np.asarray(self.volumen[indice])))
+        self._cache[indice] = corte
+        self._bytes_en_cache += corte.nbytes
+        while self._bytes_en_cache > self.limite_cache_bytes and len(self._cache) > 1:
+            _, descartado = self._cache.popitem(last=False)
+            self._bytes_en_cache -= descartado.nbytes
+        return corte
+
+    def cambiar_ventana(self, centro, ancho):
+        """Cambia la ventana de visualización y descarta los cortes ya convertidos."""
+        self.centro, self.ancho = float(centro), float(ancho)
+        self._cache.clear()
+        self._bytes_en_cache = 0
+        self.mostrar(self.indice)
+
+    # --- Dibujo ---
+    def _guardar_fondo(self, _evento=None):
+        """Tras un dibujado completo (inicio, cambio de tamaño) se guarda el fondo sin los artistas animados."""
+        self._fondo = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._dibujar_animados()
+
+    def _dibujar_animados(self):
+        self.ax.draw_artist(self.imagen)
+        self.ax.draw_artist(self.texto)
+
+    def mostrar(self, indice):
+        """Muestra el corte indicado (se limita al rango del volumen)."""
+        self.indice = int(np.clip(indice, 0, len(self.volumen) - 1))
+        self.imagen.set_data(self._corte_8bits(self.indice))
+        self.texto.set_text(f"Slice {self.indice + 1}/{len(self.volumen)}")
+        if self._fondo is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self._fondo)
+        self._dibujar_animados()
+        self.canvas.blit(self.fig.bbox)
+
+    def avanzar(self, paso=1):
+        self.mostrar(self.indice + paso)
+
+    # --- Eventos ---
+    def _al_girar_rueda(self, evento):
+        self.avanzar(1 if evento.button == "up" else -1)
+
+    def _al_pulsar_tecla(self, evento):
+        if evento.key in TECLAS_DESPLAZAMIENTO:
+            self.avanzar(TECLAS_DESPLAZAMIENTO[evento.key])
+        elif evento.key == "home":
+            self.mostrar(0)
+        elif evento.key == "end":
+            self.mostrar(len(self.volumen) - 1)
+        elif evento.key == " ":
+            self.alternar_cine()
+
+    # --- Cine ---
+    def alternar_cine(self):
+        """Inicia o detiene la reproducción en bucle de los cortes."""
+        if self._cine is not None:
+            self.master.after_cancel(self._cine)
+            self._cine = None
+            return
+        self._paso_cine()
+
+    def _paso_cine(self):
+        self.mostrar((self.indice + 1) % len(self.volumen))
+        self._cine = self.master.after(max(1, int(1000 / self.fps)), self._paso_cine)
+
+
+# Plano anatómico perpendicular a cada eje del paciente (x, y, z en DICOM)
+PLANOS_ANATOMICOS = ("Sagital", "Coronal", "Axial")
+
+
+def nombre_plano(normal):
+    """Nombre del plano anatómico más cercano al plano de normal dada."""
+    return PLANOS_ANATOMICOS[int(np.argmax(np.abs(normal)))]
+
+
+class VisorMPR:
+    """
+    Reformateo multiplanar: tres vistas ortogonales enlazadas por un punto de mira.
+
+    La vista 0 es el plano de adquisición (volumen[k]), la vista 1 fija la fila
+    (volumen[:, r, :]) y la vista 2 fija la columna (volumen[:, :, c]). Cada vista tiene
+    su propia copia contigua del volumen ya convertido a uint8, de modo que mover el
+    punto de mira solo lee un bloque contiguo de memoria por vista. La relación de
+    aspecto de cada vista sale del espaciado real de los vóxeles.
+
+    Se hace clic o se arrastra en cualquier vista para mover el punto de mira; la rueda
+    del ratón recorre los cortes de la vista sobre la que está el cursor.
+
+    Parameters:
+        master: Ventana o marco de Tkinter donde se incrusta la figura.
+        volumen (np.ndarray): Volumen (corte, fila, columna).
+        espaciado (tuple): Espaciado en mm (entre cortes, entre filas, entre columnas).
+        cabecera: Cabecera DICOM de referencia para la ventana y la orientación (opcional).
+    """
+
+    def __init__(self, master, volumen, espaciado, cabecera=None, figsize=(12, 4.5)):
+        cabecera = cabecera if cabecera is not None else {}
+        n_cortes, filas, columnas = volumen.shape
+        entre_cortes, entre_filas, entre_columnas = espaciado
+
+        pendiente = float(cabecera.get("RescaleSlope", 1) or 1)
+        ordenada = float(cabecera.get("RescaleIntercept", 0) or 0)
+        centro, ancho = calcular_ventana(cabecera, volumen[n_cortes // 2])
+        invertir = cabecera.get("PhotometricInterpretation") == "MONOCHROME1"
+        volumen_8bits = aplicar_ventana(volumen, pendiente, ordenada, centro, ancho, invertir)
+
+        # Disposición contigua por vista: el índice fijo de cada vista es el primer eje
+        self._disposiciones = (
+            np.ascontiguousarray(volumen_8bits),
+            np.ascontiguousarray(volumen_8bits.transpose(1, 0, 2)),
+            np.ascontiguousarray(volumen_8bits.transpose(2, 0, 1)),
+        )
+        del volumen_8bits
+
+        orientacion = cabecera.get("ImageOrientationPatient") or [1, 0, 0, 0, 1, 0]
+        direccion_filas = np.array(orientacion[:3], dtype=np.float64)
+        direccion_columnas = np.array(orientacion[3:], dtype=np.float64)
+        normal = np.cross(direccion_filas, direccion_columnas)
+        # En los reformateos el eje vertical es el de los cortes; si es craneocaudal se
+        # dibuja con el extremo superior arriba
+        origen_reformateo = "lower" if nombre_plano(normal) == "Axial" and normal[2] > 0 else "upper"
+
+        self.vistas = (
+            {"titulo": nombre_plano(normal), "aspecto": entre_filas / entre_columnas, "origen": "upper"},
+            {"titulo": nombre_plano(direccion_columnas), "aspecto": entre_cortes / entre_columnas,
+             "origen": origen_reformateo},
+            {"titulo": nombre_plano(direccion_filas), "aspecto": entre_cortes / entre_filas,
+             "origen": origen_reformateo},
+        )
+        self.punto = [n_cortes // 2, filas // 2, columnas // 2]  # (corte, fila, columna)
+        self._fondo = None
+        self._arrastrando = False
+
+        self.fig, self.axes = plt.subplots(1, 3, figsize=figsize)
+        self.imagenes, self.lineas = [], []
+        for vista, ax, disposicion in zip(self.vistas, self.axes, self._disposiciones):
+            ax.set_axis_off()
+            ax.set_title(vista["titulo"])
+            self.imagenes.append(ax.imshow(disposicion[0], cmap="gray", vmin=0, vmax=255, interpolation="nearest",
+                                           aspect=vista["aspecto"], origin=vista["origen"], animated=True))
+            self.lineas.append((ax.axhline(0, color="yellow", lw=0.8, animated=True),
+                                ax.axvline(0, color="yellow", lw=0.8, animated=True)))
+
+        self.canvas = FigureCanvasTkAgg(self.fig, master=master)
+        self.canvas.get_tk_widget().pack(fill="both", expand=True)
+        self.canvas.mpl_connect("draw_event", self._guardar_fondo)
+        self.canvas.mpl_connect("button_press_event", self._al_pulsar)
+        self.canvas.mpl_connect("button_release_event", self._al_soltar)
+        self.canvas.mpl_connect("motion_notify_event", self._al_mover)
+        self.canvas.mpl_connect("scroll_event", self._al_girar_rueda)
+        self._actualizar_artistas()
+        self.canvas.draw()
+
+    # --- Geometría del punto de mira ---
+    def _coordenadas_vista(self, vista):
+        """(índice fijo, x, y) del punto de mira en la vista indicada."""
+        corte, fila, columna = self.punto
+        return ((corte, columna, fila), (fila, columna, corte), (columna, fila, corte))[vista]
+
+    def _actualizar_artistas(self):
+        for vista, (imagen, (horizontal, vertical)) in enumerate(zip(self.imagenes, self.lineas)):
+            fijo, x, y = self._coordenadas_vista(vista)
+            imagen.set_data(self._disposiciones[vista][fijo])
+            horizontal.set_ydata([y, y])
+            vertical.set_xdata([x, x])
+
+    def mover_punto(self, corte=None, fila=None, columna=None):
+        """Mueve el punto de mira (se limita al volumen) y redibuja las tres vistas."""
+        limites = self._disposiciones[0].shape
+        for eje, valor in enumerate((corte, fila, columna)):
+            if valor is not None:
+                self.punto[eje] = int(np.clip(round(valor), 0, limites[eje] - 1))
+        self._actualizar_artistas()
+        if self._fondo is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self._fondo)
+        self._dibujar_animados()
+        self.canvas.blit(self.fig.bbox)
+
+    # --- Dibujo ---
+    def _guardar_fondo(self, _evento=None):
+        self._fondo = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._dibujar_animados()
+
+    def _dibujar_animados(self):
+        for ax, imagen, lineas in zip(self.axes, self.imagenes, self.lineas):
+            ax.draw_artist(imagen)
+            for linea in lineas:
+                ax.draw_artist(linea)
+
+    # --- Eventos ---
+    def _vista_del_evento(self, evento):
+        for vista, ax in enumerate(self.axes):
+            if evento.inaxes is ax:
+                return vista
+        return None
+
+    def _situar(self, evento):
+        vista = self._vista_del_evento(evento)
+        if vista is None or evento.xdata is None:
+            return
+        x, y = evento.xdata, evento.ydata
+        if vista == 0:
+            self.mover_punto(fila=y, columna=x)
+        elif vista == 1:
+            self.mover_punto(corte=y, columna=x)
+        else:
+            self.mover_punto(corte=y, fila=x)
+
+    def _al_pulsar(self, evento):
+        if evento.button == 1:
+            self._arrastrando = True
+            self._situar(evento)
+
+    def _al_soltar(self, _evento):
+        self._arrastrando = False
+
+    def _al_mover(self, evento):
+        if self._arrastrando:
+            self._situar(evento)
+
+    def _al_girar_rueda(self, evento):
+        vista = self._vista_del_evento(evento)
+        if vista is None:
+            return
+        nuevo = list(self.punto)
+        nuevo[vista] += 1 if evento.button == "up" else -1  # Cada vista recorre su propio índice fijo
+        self.mover_punto(*nuevo)
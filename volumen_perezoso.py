@@ -0,0 +1,192 @@
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pydicom
+
+from escaneo_dicom import N_HILOS
+
+# Etiquetas que se leen para ordenar los cortes y rotular el visor
+TAGS_VISOR = ["ImagePositionPatient", "ImageOrientationPatient", "InstanceNumber", "Rows", "Columns", "PatientID",
+              "PixelSpacing", "SliceThickness", "SpacingBetweenSlices", "WindowCenter", "WindowWidth",
+              "RescaleSlope", "RescaleIntercept", "PhotometricInterpretation"]
+
+
+def normal_corte(cabecera):
+    """Vector normal al plano de la imagen según ImageOrientationPatient (axial si falta)."""
+    orientacion = cabecera.get("ImageOrientationPatient")
+    if orientacion is None:
+        return np.array([0.0, 0.0, 1.0])
+    return np.cross(np.array(orientacion[:3], dtype=np.float64), np.array(orientacion[3:], dtype=np.float64))
+
+
+def posicion_corte(cabecera):
+    """
+    Posición del corte a lo largo de la normal al plano de la imagen.
+
+    En series coronales o sagitales ImagePositionPatient[2] no cambia entre cortes, así
+    que se proyecta la posición sobre la normal; sin posición se usa InstanceNumber.
+    """
+    if "ImagePositionPatient" in cabecera:
+        return float(np.dot(normal_corte(cabecera), np.array(cabecera.ImagePositionPatient, dtype=np.float64)))
+    return float(cabecera.get("InstanceNumber", 0) or 0)
+
+
+class VolumenPerezoso:
+    """
+    Volumen DICOM que decodifica los cortes bajo demanda.
+
+    Los cortes se ordenan a partir de las cabeceras (sin leer píxeles). Los píxeles
+    decodificados se guardan en una caché LRU limitada en memoria y un hilo en segundo
+    plano precarga los cortes vecinos del último corte pedido.
+
+    Parameters:
+        rutas (list): Rutas de los archivos, ya ordenadas.
+        cabeceras (list): Cabeceras (sin píxeles) en el mismo orden.
+        limite_memoria_mb (float): Memoria máxima de la caché de cortes decodificados.
+        n_vecinos (int): Cortes a cada lado que se precargan.
+    """
+
+    def __init__(self, rutas, cabeceras, limite_memoria_mb=512, n_vecinos=3):
+        self.rutas = rutas
+        self.cabeceras = cabeceras
+        self.limite_bytes = int(limite_memoria_mb * 1024 * 1024)
+        self.n_vecinos = n_vecinos
+
+        self._cache = OrderedDict()
+        self._bytes_en_cache = 0
+        self._candado = threading.Lock()
+        self._pendientes = deque()
+        self._hay_trabajo = threading.Condition(self._candado)
+        self._cerrado = False
+        self._hilo = threading.Thread(target=self._precargar, daemon=True)
+        self._hilo.start()
+
+    def __len__(self):
+        return len(self.rutas)
+
+    def espaciado(self):
+        """
+        Espaciado de los vóxeles en mm como (entre cortes, entre filas, entre columnas).
+
+        La distancia entre cortes se toma de las posiciones de los propios cortes y, con un
+        único corte, de SpacingBetweenSlices o SliceThickness.
+        """
+        cabecera = self.cabeceras[0]
+        fila, columna = (float(v) for v in cabecera.get("PixelSpacing", [1.0, 1.0]))
+        posiciones = [posicion_corte(c) for c in self.cabeceras]
+        saltos = np.abs(np.diff(posiciones))
+        saltos = saltos[saltos > 1e-3]
+        if saltos.size:
+            entre_cortes = float(np.median(saltos))
+        else:
+            entre_cortes = float(cabecera.get("SpacingBetweenSlices") or cabecera.get("SliceThickness") or 1.0)
+        return entre_cortes, fila, columna
+
+    @property
+    def forma_corte(self):
+        """(filas, columnas) de cada corte."""
+        cabecera = self.cabeceras[0]
+        return int(cabecera.Rows), int(cabecera.Columns)
+
+    def __getitem__(self, indice):
+        """Devuelve el array de píxeles del corte y programa la precarga de sus vecinos."""
+        if indice < 0:
+            indice += len(self)
+        if not 0 <= indice < len(self):
+            raise IndexError(f"Corte fuera de rango: {indice}")
+
+        with self._candado:
+            pixeles = self._cache.get(indice)
+            if pixeles is not None:
+                self._cache.move_to_end(indice)
+        if pixeles is None:
+            pixeles = self._decodificar(indice)
+            self._guardar(indice, pixeles)
+
+        self._programar_vecinos(indice)
+        return pixeles
+
+    def _decodificar(self, indice):
+        return pydicom.dcmread(self.rutas[indice]).pixel_array
+
+    def _guardar(self, indice, pixeles):
+        """Añade un corte a la caché y descarta los menos usados si se supera el límite."""
+        with self._candado:
+            if indice in self._cache:
+                return
+            self._cache[indice] = pixeles
+            self._bytes_en_cache += pixeles.nbytes
+            while self._bytes_en_cache > self.limite_bytes and len(self._cache) > 1:
+                _, descartado = self._cache.popitem(last=False)
+                self._bytes_en_cache -= descartado.nbytes
+
+    def _programar_vecinos(self, indice):
+        """Sustituye la precarga pendiente por los vecinos del corte actual, los más cercanos primero."""
+        vecinos = []
+        for distancia in range(1, self.n_vecinos + 1):
+            for vecino in (indice + distancia, indice - distancia):
+                if 0 <= vecino < len(self):
+                    vecinos.append(vecino)
+        with self._hay_trabajo:
+            self._pendientes.clear()
+            self._pendientes.extend(v for v in vecinos if v not in self._cache)
+            self._hay_trabajo.notify()
+
+    def _precargar(self):
+        while True:
+            with self._hay_trabajo:
+                while not self._pendientes and not self._cerrado:
+                    self._hay_trabajo.wait()
+                if self._cerrado:
+                    return
+                indice = self._pendientes.popleft()
+                if indice in self._cache:
+                    continue
+            try:
+                self._guardar(indice, self._decodificar(indice))
+            except Exception as e:
+                print(f"Error precargando el corte {indice}: {e}")
+
+    def como_array(self):
+        """Decodifica todos los cortes y los devuelve apilados como (corte, fila, columna)."""
+        volumen = np.empty((len(self),) + self.forma_corte, dtype=self[0].dtype)
+        for indice in range(len(self)):
+            volumen[indice] = self[indice]
+        return volumen
+
+    def cerrar(self):
+        """Detiene el hilo de precarga."""
+        with self._hay_trabajo:
+            self._cerrado = True
+            self._hay_trabajo.notify()
+
+
+def _leer_cabecera(ruta):
+    return pydicom.dcmread(ruta, stop_before_pixels=True, specific_tags=TAGS_VISOR)
+
+
+def cargar_volumen_perezoso(dicom_dir, limite_memoria_mb=512, n_vecinos=3, n_hilos=N_HILOS):
+    """
+    Prepara un VolumenPerezoso leyendo solo las cabeceras de la carpeta.
+
+    Parameters:
+        dicom_dir (str): Carpeta con los archivos DICOM de la serie.
+        limite_memoria_mb (float): Memoria máxima de la caché de cortes.
+        n_vecinos (int): Cortes a cada lado que se precargan.
+        n_hilos (int): Hilos para leer las cabeceras.
+
+    Returns:
+        VolumenPerezoso: Volumen ordenado según la posición de los cortes, o None si no hay archivos.
+    """
+    rutas = [os.path.join(dicom_dir, f) for f in os.listdir(dicom_dir) if f.endswith(".dcm")]
+    if not rutas:
+        return None
+
+    with ThreadPoolExecutor(max_workers=n_hilos) as pool:
+        cabeceras = list(pool.map(_leer_cabecera, rutas))
+
+    ordenados = sorted(zip(rutas, cabeceras), key=lambda par: posicion_corte(par[1]))  # Ordenar a lo largo de la normal
+    return VolumenPerezoso([r for r, _ in ordenados], [c for _, c in ordenados], limite_memoria_mb, n_vecinos)